@@ -1,13 +1,11 @@
+import functools
 import os
 import sys
-import inspect
 import time
 import traceback
 import unittest
-import argparse
-import configparser
+from collections.abc import Mapping, MutableMapping
 from types import MethodType
-from xml.dom.minidom import Document
 from typing import Optional, Dict, Any, List, Tuple, Union
 
 __author__ = "Maza"
@@ -23,74 +21,342 @@ _gLogPrefix: Dict[str, Tuple[str, bool]] = {
 _gTestClassName: str = ''
 aspectsDefault = {'autotest.termination.seconds': 600}
 aspects: Dict[str, Any] = {}
+inventory: Optional[Mapping] = None     # devices not in aspects, see sgInventory.useInventory
 
 # -- Find paths
-curPath = os.path.dirname(os.path.abspath(inspect.stack()[1][1]))
-dataPath = [curPath]
-toolPath = [curPath]
-
-while True:
-    libpath = os.path.join(curPath, 'lib')
-    if os.path.isdir(libpath) and libpath not in sys.path:
-        sys.path.append(libpath)
-    dpath = os.path.join(curPath, 'data')
-    if os.path.isdir(dpath):
-        dataPath.append(dpath)
-    tpath = os.path.join(curPath, 'tools')
-    if os.path.isdir(tpath):
-        toolPath.append(tpath)
-    newpath = os.path.dirname(curPath)
-    if newpath == curPath:
-        break
-    curPath = newpath
+# -- The lib, data and tools directories from the importer's directory up to / are
+# -- only searched when first needed: by data_filepath/tool_filepath, by reading
+# -- dataPath/toolPath, or by an import that nothing on sys.path can satisfy.
+# -- The last case is a process wide hook (_LibPathFinder on sys.meta_path): any
+# -- failed top level import in the process, not only those of test scripts, runs
+# -- the search once and appends the lib directories found to sys.path.
+# -- Directories that cannot be listed (e.g. mode 711) are skipped.
+
+def _caller_dir() -> str:
+    """Directory of the first real source file up the stack that is not this one,
+    frames of the import machinery ("<frozen importlib._bootstrap>") are skipped."""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if not filename.startswith('<') and filename != __file__:
+            return os.path.dirname(os.path.abspath(filename))
+        frame = frame.f_back
+    return os.getcwd()
+
+
+_gRootPath: str = _caller_dir()
+
+
+@functools.lru_cache(maxsize=None)
+def find_paths(root: str) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    """
+    Walk from root up to /, once per root.
+    Returns: (lib directories, data path, tool path), root itself leads data and tool path
+    """
+    libs, data, tools = [], [root], [root]
+    path = root
+    while True:
+        try:
+            with os.scandir(path) as entries:
+                names = {e.name for e in entries if e.name in ('lib', 'data', 'tools') and e.is_dir()}
+        except OSError:             # not readable, e.g. a traverse only home directory
+            names = set()
+        if 'lib' in names:
+            libs.append(os.path.join(path, 'lib'))
+        if 'data' in names:
+            data.append(os.path.join(path, 'data'))
+        if 'tools' in names:
+            tools.append(os.path.join(path, 'tools'))
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    return tuple(libs), tuple(data), tuple(tools)
+
+
+def _paths(root: Optional[str] = None) -> Tuple[Tuple[str, ...], Tuple[str, ...], Tuple[str, ...]]:
+    libs, data, tools = find_paths(root or _gRootPath)
+    for libpath in libs:
+        if libpath not in sys.path:
+            sys.path.append(libpath)
+    return libs, data, tools
+
+
+class _LibPathFinder:
+    """Last entry of sys.meta_path: an import that failed everywhere else triggers the
+    path search, so lib directories are still found without searching at import time.
+    It is installed for the whole process and never raises, a failed import stays an ImportError."""
+
+    @classmethod
+    def find_spec(cls, name, path=None, target=None):
+        if path is not None:
+            return None
+        missing = [libpath for libpath in find_paths(_gRootPath)[0] if libpath not in sys.path]
+        if not missing:
+            return None
+        _paths()
+        import importlib.machinery
+        return importlib.machinery.PathFinder.find_spec(name, missing)
+
+
+sys.meta_path.append(_LibPathFinder)
+
+
+def __getattr__(name: str):
+    if name in ('dataPath', 'toolPath'):
+        return list(_paths()[1 if name == 'dataPath' else 2])
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 class Error(Exception):
     pass
 
 
+_gKeyPaths: Dict[str, Tuple[str, ...]] = {}
+_kKeyPathsMax = 1 << 17
+
+
+def _key_path(key: str) -> Tuple[str, ...]:
+    """"a.b.c" -> ("a", "b", "c"), split once per distinct key"""
+    parts = _gKeyPaths.get(key)
+    if parts is None:
+        if len(_gKeyPaths) >= _kKeyPathsMax:
+            _gKeyPaths.clear()
+        parts = _gKeyPaths[key] = tuple(key.split('.'))
+    return parts
+
+
 class DotDict(dict):
-    """Access dictionary keys via dot notation."""
+    """
+    Access dictionary keys via dot notation, d['a.b'] is d['a']['b'], and as
+    attributes, d.a (None when missing). Nested plain dictionaries are wrapped
+    on first access instead of being copied when the DotDict is built.
+    """
+    __slots__ = ()
+
     def __init__(self, value=None):
         super().__init__()
         if isinstance(value, dict):
             for key, val in value.items():
-                self[key] = DotDict(val) if isinstance(val, dict) else val
+                if '.' in key:
+                    self[key] = val
+                else:
+                    super().__setitem__(key, val)
         elif value is not None:
             raise TypeError("Expected dictionary")
 
-    def __setitem__(self, key, value):
-        if '.' in key:
-            key1, key_rest = key.split('.', 1)
-            if key1 not in self or not isinstance(self[key1], DotDict):
-                self[key1] = DotDict()
-            self[key1][key_rest] = value
-        else:
-            if isinstance(value, dict) and not isinstance(value, DotDict):
-                value = DotDict(value)
-            super().__setitem__(key, value)
+    def _child(self, key):
+        value = dict.__getitem__(self, key)
+        if type(value) is dict:
+            value = DotDict(value)
+            dict.__setitem__(self, key, value)
+        return value
 
     def __getitem__(self, key):
-        if '.' in key:
-            key1, key_rest = key.split('.', 1)
-            return self[key1][key_rest]
-        return super().__getitem__(key)
+        if '.' not in key:
+            value = dict.__getitem__(self, key)
+            return self._child(key) if type(value) is dict else value
+        node = self
+        for part in _gKeyPaths.get(key) or _key_path(key):
+            if not isinstance(node, DotDict):
+                raise KeyError(key)
+            value = dict.__getitem__(node, part)
+            if type(value) is dict:
+                value = DotDict(value)
+                dict.__setitem__(node, part, value)
+            node = value
+        return node
+
+    def __setitem__(self, key, value):
+        if '.' not in key:
+            super().__setitem__(key, value)
+            return
+        parts = _key_path(key)
+        node = self
+        for part in parts[:-1]:
+            child = node._child(part) if dict.__contains__(node, part) else None
+            if not isinstance(child, DotDict):
+                child = DotDict()
+                dict.__setitem__(node, part, child)
+            node = child
+        dict.__setitem__(node, parts[-1], value)
 
     def __contains__(self, key):
-        if '.' in key:
-            key1, key_rest = key.split('.', 1)
-            return key1 in self and key_rest in self[key1]
-        return super().__contains__(key)
+        if '.' not in key:
+            return super().__contains__(key)
+        try:
+            self[key]
+        except KeyError:
+            return False
+        return True
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        try:
+            return self._child(name)
+        except KeyError:
+            return None
+
+    def __setattr__(self, name, value):
+        super().__setitem__(name, value)
+
+    def __delattr__(self, name):
+        try:
+            super().__delitem__(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
 
     def setdefault(self, key, default):
         if key not in self:
             self[key] = default
         return self[key]
 
+    def items(self):
+        for key in self:
+            self._child(key)
+        return super().items()
+
+    def values(self):
+        for key in self:
+            self._child(key)
+        return super().values()
+
+    def copy(self):
+        return DotDict(self)
+
+
+def _copy_tree(value):
+    """Private copy of a nested dictionary for a copy-on-write view"""
+    if isinstance(value, dict):
+        return DotDict({k: _copy_tree(v) for k, v in dict.items(value)})
+    return value
+
+
+class AspectsView(MutableMapping):
+    """
+    Copy-on-write view of a device's aspects: reads fall through to the shared
+    base DotDict, writes and deletes stay in the view. A nested dictionary of the
+    base is copied into the view only when a key below it is written. Nested
+    values read from the base are the shared objects, change them through the view.
+    Attribute access as DotDict, view.ipaddr is None when missing, names starting
+    with "_" are not aspects. A view is a Mapping but not a dict: use copy() where a
+    dict is needed, e.g. json.dumps(sg.aspects.copy()).
+    """
+    __slots__ = ('_base', '_local')
+
+    _kDeleted = object()
+
+    def __init__(self, base=None, overrides=None):
+        object.__setattr__(self, '_base', base if base is not None else DotDict())
+        object.__setattr__(self, '_local', DotDict())
+        for key, value in (overrides or {}).items():
+            if value is not None:
+                self[key] = value
+
+    def __getitem__(self, key):
+        top = _key_path(key)[0]
+        if dict.__contains__(self._local, top):
+            if dict.__getitem__(self._local, top) is self._kDeleted:
+                raise KeyError(key)
+            return self._local[key]
+        return self._base[key]
+
+    def __setitem__(self, key, value):
+        top = _key_path(key)[0]
+        if top != key and not dict.__contains__(self._local, top) and top in self._base:
+            dict.__setitem__(self._local, top, _copy_tree(self._base[top]))
+        self._local[key] = value
+
+    def __delitem__(self, key):
+        if key not in self:
+            raise KeyError(key)
+        top = _key_path(key)[0]
+        if top == key:
+            dict.__setitem__(self._local, key, self._kDeleted)
+            return
+        if not dict.__contains__(self._local, top):
+            dict.__setitem__(self._local, top, _copy_tree(self._base[top]))
+        parts = _key_path(key)
+        del self._local['.'.join(parts[:-1])][parts[-1]]
+
+    def __iter__(self):
+        for key, value in dict.items(self._local):
+            if value is not self._kDeleted:
+                yield key
+        for key in self._base:
+            if not dict.__contains__(self._local, key):
+                yield key
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __getattr__(self, name):
+        # -- also reached for the slots before they are set, as by copy and pickle
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return self.get(name)
+
+    def __setattr__(self, name, value):
+        self[name] = value
+
+    def __delattr__(self, name):
+        try:
+            del self[name]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __repr__(self):
+        return f'AspectsView({dict(self.items())!r})'
+
+    def copy(self):
+        """Returns: independent DotDict of the view's current values"""
+        return DotDict({key: _copy_tree(value) for key, value in self.items()})
+
+    def __copy__(self):
+        """Another view of the same base, with a private copy of this view's writes"""
+        return _restore_view(self._base, _copy_tree(self._local))
+
+    def __reduce__(self):
+        # -- deleted keys are listed apart, the marker object does not survive pickling
+        local = {key: value for key, value in dict.items(self._local) if value is not self._kDeleted}
+        deleted = [key for key, value in dict.items(self._local) if value is self._kDeleted]
+        return _restore_view, (self._base, local, deleted)
+
+
+def _restore_view(base, local, deleted=()):
+    view = AspectsView(base)
+    dict.update(view._local, local)
+    for key in deleted:
+        dict.__setitem__(view._local, key, AspectsView._kDeleted)
+    return view
+
 
 aspects = DotDict(aspectsDefault)
 
 
+def dotdictify(value: Optional[dict] = None) -> DotDict:
+    return value if isinstance(value, DotDict) else DotDict(value)
+
+
+def device_aspects(device: Optional[str] = None, /, **overrides) -> AspectsView:
+    """
+    Aspects of a connection to device: the keyword values that are not None, over
+    the device's entries of the global aspects, without copying them.
+    Returns: AspectsView, defaults written to it stay private to the connection
+    """
+    base = aspects.get(device) if device else None
+    if base is None and device and inventory is not None:
+        base = inventory.get(device)
+    return AspectsView(base if isinstance(base, DotDict) else None, overrides)
+
+
 def aspect(name: str) -> Any:
     return get_aspect(name)
 
@@ -99,6 +365,12 @@ def get_aspect(name: str) -> Any:
     try:
         return aspects[name]
     except KeyError:
+        device, _, rest = name.partition('.')
+        if inventory is not None and device not in aspects and device in inventory:
+            try:
+                return inventory[device][rest] if rest else inventory[device]
+            except KeyError:
+                pass
         raise Error(f"** Aspect not available: {name}")
 
 
@@ -132,6 +404,7 @@ def log_exception(filter_type: str, additional_info: str = ''):
 
 
 def data_filepath(filename: str, assert_on_error: bool = True) -> Optional[str]:
+    dataPath = _paths()[1]
     for path in dataPath:
         fp = os.path.join(path, filename)
         if os.path.isfile(fp):
@@ -142,6 +415,7 @@ def data_filepath(filename: str, assert_on_error: bool = True) -> Optional[str]:
 
 
 def tool_filepath(filename: str, assert_on_error: bool = True) -> Optional[str]:
+    toolPath = _paths()[2]
     for path in toolPath:
         fp = os.path.join(path, filename)
         if os.path.isfile(fp):
@@ -219,6 +493,8 @@ class TestRunner(unittest.TextTestRunner):
 
 
 def parse_config_file(filename: str):
+    import configparser
+
     global aspects
     if not os.path.isfile(filename):
         raise Error(f'Configuration file does not exist: {filename}')
@@ -233,6 +509,8 @@ def parse_config_file(filename: str):
 
 
 def run(a_module):
+    import argparse
+
     parser = argparse.ArgumentParser(description="Run tests")
     parser.add_argument('--config', required=True, help='Configuration file')
     parser.add_argument('--log', help='Comma-separated list of log filters')
@@ -270,4 +548,4 @@ def run_auto(a_module, test_names: List[str], test_aspects: Dict[str, Any], log_
     for k, v in test_aspects.items():
         aspects[k] = v
     suite = unittest.TestSuite(map(lambda n: a_module(n), test_names))
-    return TestRunner(stream=sys.stdout).run(suite)
\ No newline at end of file
+    return TestRunner(stream=sys.stdout).run(suite)
@@ -5,29 +5,25 @@ __metaclass__ = type
 __author__ = "Maza"
 __version__ = "1.0"
 
-import base64
-import json
+import collections
+import copy
+import hashlib
 import os
 import re
+import select
+import socket
 import sys
+import threading
 import time
-import urllib2, urllib, cookielib
-import HTMLParser
 import autotest
-import optparse
-import telnetlib
-import xml.dom.minidom
-import paramiko
-import types
-import select
-import ssl
-
-from copy import deepcopy
+import sgPages
 
-from ansible.module_utils.urls import fetch_url
-from ansible.module_utils._text import to_bytes, to_native
-from ansible.module_utils.basic import env_fallback
-from ansible.module_utils.connection import Connection, ConnectionError
+# -- Heavy or rarely needed modules are imported where they are first used, so a
+# -- module that only needs a helper of this file does not load them:
+# --   paramiko (SSH login), sgConsole (serial console), sgHtml (HTML table parsers),
+# --   xml.dom.minidom / sgShortcuts (XML data file), http.cookiejar, ssl and
+# --   sgHttpPool (ProxySGHTTP), sgProbe (reachability), sgImages (build load),
+# --   sgTcpConnections (numpy), concurrent.futures (thread pools), optparse (command line)
 
 # -- Regex prompt match objects
 
@@ -43,6 +39,19 @@ _reConfigPrompt2  = re.compile ( r"^[^#\r\n$=<>\"]{4,80}#\(config[^\)]+\)$", re.
 _reEnterOption    = re.compile ( r'Enter option: $', re.I )
 _reMore           = re.compile ( r'\-\-More\-\-$', re.M )
 
+# -- streamed command output, see ProxySGCLI.iterCommandOutput
+
+_reMoreBytes      = re.compile ( rb'--More--$' )
+_rePagingBytes    = re.compile ( rb'--More--|\x08+ *\x08*' )
+_rePromptBytes    = re.compile ( rb'[^#>\r\n$=<"]{4,80}(?:#|>|#\([^)]+\))\Z' )		# matched on the last line only
+
+# -- bulk configuration push, see ProxySGCLI.commandBulk
+
+_reEchoLine       = re.compile ( r'^([^#>\r\n$=<"]{4,80}?(?:#\([^)]*\)|#|>))(.*)$' )
+_reBulkError      = re.compile ( r'^\s*%.*$', re.M )
+_reErrorLineNo    = re.compile ( r'line\s+(\d+)', re.I )
+kBulkMark         = ';bulk-mark-'
+
 # -- special mode for slow serial port processing
 
 _reConfigPromptBit   = re.compile ( r"\(config\)$", re.I+re.M )
@@ -58,9 +67,20 @@ CLI_CONFIG_TREE = 'CLI_CONFIG_TREE'
 CLI_EXIT        = 'CLI_EXIT'
 
 
+# -- Result of a concurrent page fetch, see ProxySGHTTP.getPages
+# -- data is None and error holds the exception when the fetch failed
+
+PageResult = collections.namedtuple ('PageResult', ('device', 'url', 'data', 'latency', 'error'))
+
+# -- Outcome of one line of a bulk configuration push, see ProxySGCLI.commandBulk
+# -- line is the 1 based line number in the pushed fragment, errors the "%" lines of its output
+
+BulkResult = collections.namedtuple ('BulkResult', ('line', 'command', 'ok', 'output', 'errors'))
+
+
 class Error (Exception): pass
 
-class NotTextNodeError: pass
+class NotTextNodeError (Exception): pass
 
 
 # ------------------------------------------------------------------------------
@@ -118,7 +138,7 @@ def node_to_dictionary(node):
             continue
 
         try:
-            text = get_text_from_node(n)
+            text = getTextFromNode(n)
         except NotTextNodeError:
             # 'Normal' node
             node_name = f'cmd{ix}' if n.nodeName == 'cmd' else n.nodeName
@@ -133,6 +153,15 @@ def node_to_dictionary(node):
     return dic
 
 
+def loadXMLDictionary(file):
+    """Parse an XML data file into a dictionary with minidom, see node_to_dictionary.
+    sgShortcuts.parseXMLDictionary builds the same dictionary with far less memory,
+    see tests/benchmarks/bench_xml_loaders.py."""
+    import xml.dom.minidom
+
+    return node_to_dictionary(xml.dom.minidom.parse(file))
+
+
 # ------------------------------------------------------------------------------
 
 class QDExpect:
@@ -201,51 +230,167 @@ class QDExpect:
         self.expect_write(data)
 
     def close(self):
-        pass
+        self.channel.close()
+
+# ------------------------------------------------------------------------------
+
+class ChannelPool:
+    """
+    Extra shell channels on the SSH transport of one ProxySGCLI, each wrapped in a
+    ProxySGCLI clone with its own connector and context, so commands can run in
+    parallel without another SSH log in. At most maxChannels are open at once.
+    """
+
+    def __init__(self, sg, maxChannels=4):
+        self.sg = sg
+        self.maxChannels = maxChannels
+        self._slots = threading.BoundedSemaphore(maxChannels)
+        self._lock = threading.RLock()     # log in closes the pool
+        self._idle = []
+
+    def checkout(self, timeout=None):
+        if not self._slots.acquire(timeout=timeout):
+            raise Error(f'no free channel of {self.maxChannels} within {timeout}s')
+        try:
+            with self._lock:
+                while self._idle:
+                    clone = self._idle.pop()
+                    if clone.connector and not clone.connector.channel.closed:
+                        return clone
+                if self.sg.connector is None:
+                    self.sg._goThroughLogin()
+            return self.sg._cloneOnChannel()
+        except Exception:
+            self._slots.release()
+            raise
+
+    def checkin(self, clone, reuse=True):
+        with self._lock:
+            if reuse and clone.connector and not clone.connector.channel.closed:
+                self._idle.append(clone)
+            else:
+                clone.close()
+        self._slots.release()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for clone in idle:
+            clone.close()
 
 # ------------------------------------------------------------------------------
 
 class ProxyCommon:
     '''Common routines for ProxySGCLI and ProxySGHTTP'''
 
-    def wait(self, init_wait=15, ping_wait=300, end_wait=15):
+    def wait(self, init_wait=15, ping_wait=300, end_wait=15, icmp=False):
         """
         Wait for device to boot.
         init_wait - hold time before checking with ping.
-        ping_wait - how long to wait for a ping.
+        ping_wait - how long to wait for a ping, measured in real elapsed seconds.
         end_wait  - hold time before releasing back to main script.
-        return: (status, status_text)
+        icmp      - also send ICMP echo, only when running privileged.
+        return: True, the seconds the device took to answer are kept in self.bootSeconds
         """
         time.sleep(init_wait)
-        timer = 0
         if self.aspects.ipaddr is None:
             raise ValueError('Need IP address to ping')
-        while not self._ping(self.aspects.ipaddr):
-            timer += 2
-            if timer > ping_wait:
+        start = time.monotonic()
+        while not self._ping(self.aspects.ipaddr, icmp=icmp):
+            elapsed = time.monotonic() - start
+            if elapsed > ping_wait:
                 raise TimeoutError('Wait for boot failed timeout')
+            time.sleep(max(0, min(2 - elapsed % 2, ping_wait - elapsed)))
+        self.bootSeconds = time.monotonic() - start
         time.sleep(end_wait)
         return True
 
-    def _ping(self, ip):
+    def waitReady(self, timeout=600, http=False, expectDown=False, downTimeout=120, initialDelay=1, maxDelay=15,
+                  icmp=False):
         """
-        Ping (private routine) once.
-        return: True - successful ping, False - no ping returned in 2 seconds.
+        Wait until the device is usable, stage by stage, instead of fixed holds:
+            reachable - SSH or management port answers (ICMP too with icmp=True)
+            ssh       - SSH server sends its banner (SSH CLI access only)
+            cli       - log in reaches the CLI prompt (ProxySGCLI), the connection is kept
+            http      - management console answers HTTP (always for ProxySGHTTP, else with http=True)
+        Each stage is retried with exponential backoff from initialDelay up to maxDelay seconds.
+        timeout    - for all stages together, in real elapsed seconds.
+        expectDown - right after a restart command: first wait up to downTimeout seconds
+                     for the device to stop answering, so the old system is not mistaken as ready.
+        return: True, seconds to reach every stage are kept in self.readyTimes
         """
-        ping_commands = {
-            "sunos":   ('ping {} 5 | grep alive >/dev/null', 0),
-            "freebsd": ("ping -c 1 -t 2 {} | grep -E '1 packets received' >/dev/null", 0),
-            "darwin":  ("ping -c 1 -t 2 {} | grep -E '1 packets received' >/dev/null", 0),
-            "linux":   ("ping -c 1 -W 2 {} | grep -E '1 received' >/dev/null', 0),
-            "linux2":  ("ping -c 1 -W 2 {} | grep -E '1 received' >/dev/null', 0),
-            "windows": ("ping -n 1 -w 2000 {} | grep -E '1 (packets )?received' >/dev/null", 0),
-            "win32":   ('ping -n 1 -w 2000 {} | find /I "Received = 1"', 0),
-        }
-        os_type = sys.platform
-        if os_type not in ping_commands:
-            raise ValueError(f"Don't know how to ping on {os_type}")
-        command, expected_value = ping_commands[os_type]
-        return os.system(command.format(ip)) == expected_value
+        import sgProbe
+
+        start = time.monotonic()
+        deadline = start + timeout
+        self.readyTimes = {}
+        if expectDown and self.aspects.ipaddr:
+            downDeadline = start + downTimeout
+            while sgProbe.probe(self.aspects.ipaddr, ports=self._probePorts(), timeout=2).open:
+                if time.monotonic() > downDeadline:
+                    autotest.log('debug', f'{self.aspects.ipaddr} did not go down in {downTimeout}s, checking readiness')
+                    break
+                time.sleep(1)
+            self.readyTimes['down'] = time.monotonic() - start
+        for stage, ready in self._readyStages(http, icmp):
+            delays = sgProbe.backoff(initialDelay, 2, maxDelay)
+            while not ready():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise TimeoutError(f'Wait for ready failed timeout at stage: {stage}')
+                time.sleep(min(next(delays), remaining))
+            self.readyTimes[stage] = time.monotonic() - start
+            autotest.log('debug', f'{self.aspects.ipaddr} ready stage {stage} after {self.readyTimes[stage]:.1f}s')
+        return True
+
+    def _readyStages(self, http=False, icmp=False):
+        """Ordered (stage name, check function) for waitReady"""
+        import sgProbe
+
+        ip = self.aspects.ipaddr
+        isCLI = hasattr(self, '_goThroughLogin')
+        stages = []
+        if ip:
+            stages.append(('reachable', lambda: self._ping(ip, icmp=icmp)))
+        if isCLI and self.aspects.cliaccess == 'ssh':
+            stages.append(('ssh', lambda: sgProbe.sshBanner(ip) is not None))
+        if isCLI:
+            stages.append(('cli', self._cliReady))
+        if ip and (http or not isCLI):
+            port = int(self.aspects.get('port') or self.aspects.get('httpconsoleport') or 8082)
+            useTls = (self.aspects.get('protocol') or 'https') == 'https'
+            stages.append(('http', lambda: sgProbe.httpReady(ip, port, useTls)))
+        return stages
+
+    def _cliReady(self):
+        """Log in once, True when the CLI prompt was reached, the connection is kept for use"""
+        try:
+            self.close()
+            self._goThroughLogin()
+            return True
+        except Exception as e:
+            autotest.log('debug', f'CLI not ready: {e}')
+            for connection in (self, getattr(self, 'client', None)):
+                try:
+                    if connection:
+                        connection.close()
+                except Exception:
+                    pass
+            return False
+
+    def _probePorts(self):
+        """SSH and the management console port, the device is up when either answers."""
+        return tuple(sorted({22, int(self.aspects.get('port') or self.aspects.get('httpconsoleport') or 8082)}))
+
+    def _ping(self, ip, icmp=False):
+        """
+        Probe (private routine) once, in process with a TCP connect to the SSH and
+        management ports, a refused connection also counts as an answer.
+        return: True - device answered, False - no answer in 2 seconds.
+        """
+        import sgProbe
+
+        return sgProbe.probe(ip, ports=self._probePorts(), timeout=2, icmp=icmp and sgProbe.icmpAvailable()).reachable
 
     def check_for_name(self, aspects, name):
         """Check for existence of an aspect, return value."""
@@ -271,7 +416,7 @@ class ProxySGCLI (ProxyCommon):
 
 	# --------------------------------------------------------------------------
 
-	def __init__ (self, device=None, ipaddr=None, username=None, password=None, cliaccess=None, enablePassword=None, serial=None, loginTimeout=10, promptTimeout=10, commandTimeout=120):
+	def __init__ (self, device=None, ipaddr=None, username=None, password=None, cliaccess=None, enablePassword=None, serial=None, loginTimeout=10, promptTimeout=10, commandTimeout=120, maxChannels=4):
 		'''
 		Initialize proxy connection object for command line access
 		
@@ -282,6 +427,7 @@ class ProxySGCLI (ProxyCommon):
 		enablePassword - password used for enable command
 		cliaccess - use serial or ssh 		
 		serial - string containing address and port to serial server, format:  <ipaddr>:<port>
+		maxChannels - extra SSH channels for parallel commands, see showCommands
 		
 		When the device paramter is utilized then address/username/password parameters are taken from
 		the aspects dictionary. The global autotest aspects dictonary is used.
@@ -302,24 +448,25 @@ class ProxySGCLI (ProxyCommon):
 		self.context        = None
 		self.debugLevel     = 0
 		self.info           = {}
-		self.aspects        = autotest.dotdictify()
 		self.sgcli          = self
-
-		# -- First, parameters
+		self.maxChannels    = maxChannels
+		self.channelPool    = None
+		self.client         = None			# SSH client, shared by the clones of a channel pool
+		self._poolLock      = threading.Lock ()
+
+		# -- First, parameters, second, configuration properties for device where parameters are empty.
+		# -- The device's aspects are read through, not copied, see autotest.AspectsView;
+		# -- self.aspects is a Mapping, not a dict: self.aspects.copy () for json.dumps and the like
+		self.aspects = autotest.device_aspects (device,
+			device    = device,
+			ipaddr    = ipaddr,
+			username  = username,
+			password  = password,
+			cliaccess = cliaccess,
+			serial    = serial,
+			password_enable = enablePassword,
+			)
 		asp = self.aspects
-		asp.device    = device
-		asp.ipaddr    = ipaddr
-		asp.username  = username
-		asp.password  = password
-		asp.cliaccess = cliaccess
-		asp.serial    = serial
-		asp.password_enable = enablePassword
-
-		# -- Second, configuration properties for device, if properties are empty
-		if device and autotest.aspects.get(device):
-			for k,v in autotest.aspects[device].items():
-				if asp.get(k) == None:
-					asp[k]=v
 
 		# -- And lastly, defaults, if empty (do not set defaults in __init__ definition)
 		if asp.username == None: asp.username = 'admin'
@@ -350,28 +497,25 @@ class ProxySGCLI (ProxyCommon):
 		# -- Create a shell style connector and our own expect parser.
 		
 		if self.aspects.cliaccess == 'ssh':
+			import paramiko
+			if self.channelPool: self.channelPool.close ()	# channels of a previous transport
+			if self.client: self.client.close ()
 			self.client = paramiko.SSHClient ()
 			self.client.set_missing_host_key_policy (paramiko.AutoAddPolicy())
 			self.client.connect (self.aspects.ipaddr, username=self.aspects.username, password=self.aspects.password)
-			channel = self.client.invoke_shell(width=1000, height=1000)			# returns channel object
-			self.connector = QDExpect (channel)		# make Quick and Dirty expect wrapper
-			while 1:
-				reIndex, matchObj, text = self.connector.expect([_reRootPrompt], timeout=self.loginTimeout )
-				if reIndex == 0:													# caught command prompt
-					self.context = CLI_ROOT
-					break
-				else:
-					raise Error ('SSH timeout on log-in')
+			self._openShell ()
 		
 		# -- Login through serial port. Tricky because:
 		# -- 1. State is unknown, send a return, determine state by returned prompt.
 		# -- 2. Initial connect requires three returns for a login menu, this can be a problem.
 		# -- 3. The enable and configure prompts are non-unique, a configure prompt can trigger
-		# --    a enable prompt on the slow connection, thus wait for additional characters.
+		# --    a enable prompt on the slow connection, the console engine only accepts an
+		# --    enable prompt once the line went idle.
 		
 		elif self.aspects.cliaccess == 'serial':
+			import sgConsole
 			saddr, sport = self.aspects.serial.split(':')
-			self.connector = telnetlib.Telnet (saddr, int(sport), timeout=self.loginTimeout)
+			self.connector = sgConsole.getEngine().open (saddr, int(sport), timeout=self.loginTimeout)
 			self.connector.set_debuglevel (self.debugLevel)
 			self.connector.write ('\r')
 			count = 0
@@ -383,7 +527,7 @@ class ProxySGCLI (ProxyCommon):
 						_reRootPrompt,
 						_reEnablePrompt,
 						_rePasswordEnable,
-						_reMore], 3)
+						_reMore], 3, idle=[_reEnablePrompt])
 				if   reIndex == -1: self.connector.write ('\r')
 				elif reIndex == 0: self.connector.write ('1')
 				elif reIndex == 1:		# Configuration prompt (top level)
@@ -395,16 +539,8 @@ class ProxySGCLI (ProxyCommon):
 				elif reIndex == 3:		# Root prompt
 					self.context = CLI_ROOT
 					break
-				elif reIndex == 4:		# Enable prompt, special case
-					# -- Wait 1/4 second for additional characters of config prompts
+				elif reIndex == 4:		# Enable prompt, line idle so not the start of a config prompt
 					self.context = CLI_ENABLE
-					reIndex, matchObj, text = self.connector.expect ([
-						_reConfigPromptBit, 
-						_reConfigPromptBit2], 0.25)
-					if reIndex == 0:
-						self.context = CLI_CONFIG
-					elif reIndex == 1:
-						self.context = CLI_CONFIG_TREE
 					break
 				elif reIndex == 5:		# Enable password prompt, acknowledge
 					self.connector.send (self.aspects.password_enable+'\r')
@@ -416,6 +552,125 @@ class ProxySGCLI (ProxyCommon):
 				count += 1
 				if count > 5: raise Error ('Serial login problem')
 
+	def _openShell (self):
+		'''Private routine, open a shell channel on the logged in SSH transport, wait for the prompt'''
+		
+		channel = self.client.invoke_shell(width=1000, height=1000)			# new channel on the same transport
+		self.connector = QDExpect (channel)		# make Quick and Dirty expect wrapper
+		reIndex, matchObj, text = self.connector.expect([_reRootPrompt], timeout=self.loginTimeout )
+		if reIndex != 0:
+			raise Error ('SSH timeout on log-in')
+		self.context = CLI_ROOT
+
+	def _cloneOnChannel (self):
+		'''Private routine, a copy of this object on its own shell channel of the same SSH transport'''
+		
+		clone = copy.copy (self)
+		clone.connector   = None
+		clone.context     = None
+		clone.channelPool = None
+		clone._openShell ()
+		clone.client      = None		# the transport stays owned, and closed, by self
+		return clone
+
+	# --------------------------------------------------------------------------------
+
+	def showCommands (self, cmdLines, context=CLI_ENABLE, timeout=None):
+		'''
+		Run read-only "show" commands in parallel on pooled channels of one SSH log in.
+		Over serial access the commands run one after the other.
+		
+		cmdLines - list of commands, each must start with "show"
+		context - context the commands run in, CLI_ROOT or CLI_ENABLE
+		timeout - seconds to wait for a free channel, None waits forever
+		Returns: list of outputs, in the order of cmdLines
+		'''
+		
+		for cmdLine in cmdLines:
+			if not re.match (r'\s*show\s', cmdLine + ' '):
+				raise Error ('not a read-only show command: {}'.format(cmdLine))
+		if context not in (CLI_ROOT, CLI_ENABLE):
+			raise Error ('show commands run in CLI_ROOT or CLI_ENABLE context')
+
+		if self.aspects.cliaccess != 'ssh':
+			return [self.command (cmdLine, context=context) for cmdLine in cmdLines]
+
+		pool = self._getChannelPool ()
+
+		def run (cmdLine):
+			clone = pool.checkout (timeout)
+			reuse = False
+			try:
+				output = clone.command (cmdLine, context=context)
+				reuse = True
+				return output
+			finally:
+				pool.checkin (clone, reuse)
+
+		import concurrent.futures
+		with concurrent.futures.ThreadPoolExecutor (max_workers=min(self.maxChannels, len(cmdLines)) or 1) as executor:
+			return list (executor.map (run, cmdLines))
+
+	def showCommand (self, cmdLine, context=CLI_ENABLE, timeout=None):
+		'''A read-only "show" command on a pooled channel, safe to call from several threads'''
+		
+		return self.showCommands ([cmdLine], context, timeout)[0]
+
+	def _getChannelPool (self):
+		with self._poolLock:			# showCommands may be called from several threads
+			if self.channelPool is None:
+				self.channelPool = ChannelPool (self, self.maxChannels)
+			return self.channelPool
+
+	def iterCommandOutput (self, cmdLine, context=CLI_ENABLE, chunkSize=65536):
+		'''
+		Stream the output of a read-only command, such as "show config", from a pooled
+		SSH channel as it arrives, without holding it in memory. The echoed command
+		line, --More-- paging and the closing prompt are removed.
+		Over serial access the output is read with command and yielded at once.
+		Yields: bytes
+		'''
+		
+		if self.aspects.cliaccess != 'ssh':
+			yield self.command (cmdLine, context=context).encode ('utf-8')
+			return
+
+		pool = self._getChannelPool ()
+		clone = pool.checkout ()
+		reuse = False
+		try:
+			clone.command ('', context=context)
+			channel = clone.connector.channel
+			channel.settimeout (self.commandTimeout)
+			channel.send (cmdLine+'\r')
+			pending, echoed = b'', False
+			while True:
+				try:
+					data = channel.recv (chunkSize)
+				except socket.timeout:
+					raise Error ('ProxySG SSH command timed out: {}'.format(cmdLine))
+				if not data:
+					raise Error ('ProxySG SSH channel closed during: {}'.format(cmdLine))
+				pending += data
+				if _reMoreBytes.search (pending):
+					channel.send (' ')
+				pending = _rePagingBytes.sub (b'', pending)
+				if not echoed:
+					if b'\n' not in pending: continue
+					pending = pending[pending.index(b'\n')+1:]
+					echoed = True
+				m = _rePromptBytes.match (pending, pending.rfind(b'\n')+1)
+				if m and not select.select ([channel], [], [], 0.2)[0]:		# prompt and the line went idle
+					if pending[:m.start()]: yield pending[:m.start()]
+					reuse = True
+					break
+				cut = pending.rfind (b'\n', 0, len(pending) - 512) + 1		# hold back a prompt or a paging erase
+				if cut:
+					yield pending[:cut]
+					pending = pending[cut:]
+		finally:
+			pool.checkin (clone, reuse)
+
 	# --------------------------------------------------------------------------------
 	
 	def command (self, cmdLine, context=None, timeout=None, confirmation=1):
@@ -559,7 +814,7 @@ class ProxySGCLI (ProxyCommon):
 							_reEnablePrompt,
 							_rePasswordEnable,
 							_reMore,
-							], timeout=timeout)
+							], timeout=timeout, idle=[_reEnablePrompt])
 
 				if reText: store += reText
 					
@@ -581,15 +836,8 @@ class ProxySGCLI (ProxyCommon):
 					self.context = CLI_ROOT
 					break
 					
-				elif reIndex == 4:				# Enable level prompt
-					# -- Possible false match, Look for the additional characters of config prompts
+				elif reIndex == 4:				# Enable level prompt, line idle so not a config prompt
 					self.context = CLI_ENABLE
-					reIndex, reMatchObj, reText = self.connector.expect ([
-						_reConfigPromptBit, 
-						_reConfigPromptBit2], 1)
-					if reText: store += reText[reText.find('\n'):].strip()
-					if reIndex == 0:   self.context = CLI_CONFIG
-					elif reIndex == 1: self.context = CLI_CONFIG_TREE
 					break
 					
 				elif reIndex == 5:				# Enable password prompt
@@ -615,11 +863,16 @@ class ProxySGCLI (ProxyCommon):
 	# --------------------------------------------------------------------------
 
 	def close (self):
-		'''Close the ProxySG connector'''
+		'''Close the ProxySG connector, the pooled channels and the SSH transport'''
 		
 		if self.connector:
 			self.connector.close ()
 		self.connector = None
+		if self.channelPool:
+			self.channelPool.close ()
+		if self.client:
+			self.client.close ()
+		self.client = None
 	
 
 	# --------------------------------------------------------------------------
@@ -649,57 +902,163 @@ class ProxySGCLI (ProxyCommon):
 		
 	# --------------------------------------------------------------------------
 
-	def _setupXMLdata (self, file):
-		'''Read xml data file for shortcuts and stuff'''
+	def commandBulk (self, lines, context=CLI_CONFIG, window=200, stopOnError=False, server=None, timeout=None):
+		'''
+		Push a configuration fragment in bulk instead of a prompt wait per line.
+		
+		lines - fragment text or list of CLI lines, as in "show config" output
+		context - context the fragment starts in
+		window - lines written at once, the device output is read after each window
+		stopOnError - do not send further windows once a line failed
+		server - sgImages.ImageServer: the fragment is served from this control node and
+		         loaded in one transfer with "configure network <url>"
+		timeout - seconds for one window or for the network load (default commandTimeout * 10)
+		Returns: list of BulkResult, one per non-empty line in pipelined mode; with a server
+		         the errors are attributed by the line numbers the device reports
+		
+		Lines are written without waiting for their prompt, a command asking for
+		confirmation would take the next line as its answer, keep those out of bulk pushes.
+		'''
+		
+		if isinstance (lines, str): lines = lines.splitlines ()
+		commands = [(n, l.strip()) for n, l in enumerate (lines, 1) if l.strip()]
+		if timeout == None: timeout = self.commandTimeout * 10
+		if server: return self._commandBulkNetwork (commands, server, timeout)
+
+		self.command ('', context=context)				# reach the context, connector logged in
+		results = []
+		for start in range (0, len(commands), window):
+			chunk = commands[start:start+window]
+			mark = '{}{}'.format (kBulkMark, start)
+			autotest.log ('sgcmd', 'bulk lines {}-{}'.format (chunk[0][0], chunk[-1][0]), self.index)
+			self.connector.write (''.join (c+'\r' for n, c in chunk) + mark + '\r')
+			reIndex, matchObj, text = self.connector.expect (
+				[re.escape (mark) + r'\s*\n\r?([^#>\r\n$=<"]{4,80}(?:#\([^)]*\)|#|>))$'], timeout=timeout)
+			if reIndex != 0:
+				raise Error ('bulk push timed out after line {}'.format (chunk[0][0]))
+			if not text.endswith (matchObj.group(0)): text += matchObj.group(0)
+			results += self._parseBulkOutput (chunk, text)
+			self._setContextFromPrompt (matchObj.group(1))
+			if stopOnError and not all (r.ok for r in results): break
+		autotest.log ('sgout', '{} lines, {} failed'.format (len(results), sum (1 for r in results if not r.ok)), self.index)
+		return results
+
+	def _parseBulkOutput (self, chunk, text):
+		'''Split the echoed output of a pipelined window back into one BulkResult per line'''
+		
+		results = []
+		pending = list (chunk)
+		current = None
+		for line in text.replace ('\r\n', '\n').replace ('\r', '').split ('\n'):
+			m = _reEchoLine.match (line)
+			# -- the prompt in front of the first echo ended the previous expect, it is not in text
+			first = current == None and not results and pending and line.strip() == pending[0][1]
+			if first or (m and pending and m.group(2).strip() == pending[0][1]):
+				if current: results.append (current)
+				current = [pending.pop(0), []]
+			elif m and m.group(2).strip().startswith (kBulkMark):
+				break
+			elif current:
+				current[1].append (line)
+		if current: results.append (current)
+		out = []
+		for (n, command), output in results:
+			output = '\n'.join (output).strip ()
+			errors = _reBulkError.findall (output)
+			out.append (BulkResult (n, command, not errors, output, errors))
+		# -- lines whose echo was not found, the device did not take them
+		out += [BulkResult (n, c, False, '', ['% no echo of line from device']) for n, c in pending]
+		return out
+
+	def _commandBulkNetwork (self, commands, server, timeout):
+		'''Load the fragment with "configure network" from the control node's HTTP server'''
 		
-		dom = xml.dom.minidom.parse (file)
-		self.xmlData = nodeToDictionary (dom)
+		text = ''.join (c+'\n' for n, c in commands)
+		name = 'bulk-{}.txt'.format (hashlib.sha256 (text.encode ('utf-8')).hexdigest()[:16])
+		path = os.path.join (server.rootDir, name)
+		with open (path, 'w') as f:
+			f.write (text)
+		try:
+			output = self.command ('configure network {}'.format (server.url (path)), context=CLI_ENABLE, timeout=timeout)
+		finally:
+			os.remove (path)
+		failed = {}
+		unattributed = []
+		for error in _reBulkError.findall (output):
+			m = _reErrorLineNo.search (error)
+			if m: failed.setdefault (int(m.group(1)), []).append (error)
+			else: unattributed.append (error)
+		results = []
+		for index, (n, command) in enumerate (commands, 1):
+			errors = failed.get (index, [])				# device numbers the lines of the served file
+			results.append (BulkResult (n, command, not errors, '', errors))
+		if unattributed:
+			results.append (BulkResult (None, None, False, output, unattributed))
+		return results
+
+	def _setContextFromPrompt (self, prompt):
+		if   _reConfigPrompt.match (prompt):  self.context = CLI_CONFIG
+		elif _reConfigPrompt2.match (prompt): self.context = CLI_CONFIG_TREE
+		elif _reEnablePrompt.match (prompt):  self.context = CLI_ENABLE
+		elif _reRootPrompt.match (prompt):    self.context = CLI_ROOT
 
-		self.xmlvars = self.xmlData['CLI']['vars']
-		self.contexts = self.xmlData['CLI']['Contexts']
-		self.shortcuts = self.xmlData['CLI']['Shortcuts']
-		# -- xml to dictionary
+	# --------------------------------------------------------------------------
+
+	def _setupXMLdata (self, file):
+		'''
+		Read xml data file for shortcuts and stuff.
+		The shortcuts are compiled once and cached on disk while the file is unchanged,
+		self.xmlData is the sgShortcuts.ShortcutFile
+		'''
+		
+		import sgShortcuts
+		self.xmlData = sgShortcuts.loadShortcuts (file)
+		self.xmlvars = self.xmlData.vars
+		self.contexts = self.xmlData.contexts
+		self.shortcuts = self.xmlData.shortcuts
 	
 	# --------------------------------------------------------------------------
 
-	def shortcut (self,sk):
-		'''Lookup shortcut from XML file and send commands (not used)'''
+	def shortcut (self, sk, bulk=False, **values):
+		'''
+		Lookup shortcut from XML file and send its commands
+		sk - shortcut name
+		bulk - push the commands with commandBulk instead of a prompt wait per command
+		values - shortcut variables, override the xml vars and the aspects
+		Returns: output of the last command, or the list of BulkResult with bulk;
+		         nothing is sent for a shortcut without commands, '' or [] is returned
+		'''
 		
-		replaceList = {
+		replaceList = dict ((k, v) for k, v in self.xmlvars.items() if isinstance (v, str))
+		replaceList.update ({
 			'CR':'', 
 			'HTTPCONSOLEPORT': self.aspects.get ('httpconsoleport',''),
 			'IMAGEURL': self.aspects.get ('imageurl',''),
 			'PROXYIP' : self.aspects.get ('ipaddr',''),
-			}
-		print self.aspects
+			})
+		replaceList.update (values)
 		
-		print 'shortcut:',sk
-		c = self.shortcuts.get(sk)
-		print ' using context:', c['context']
-		context = c['context']
-		ix = 1
-		while 1:
-			cmdSet = c.get('cmd{}'.format(ix))
-			ix += 1
-			if not cmdSet: break
-			cmd = cmdSet['output']
-			# -- confirugation substitutions
-			while 1:
-				m = re.search ('{([^}]+)}', cmd)
-				if not m: break
-				cmd = cmd.replace ('{'+m.group(1)+'}', replaceList[m.group(1)])
-			self.command (cmd, c=context)
-			context = None		# context only for the first command
+		c = self.shortcuts.get (sk)
+		if c == None: raise Error ('unknown shortcut: {}'.format(sk))
+		autotest.log ('debug', 'shortcut: {} using context: {}'.format(sk, c.context))
+		commands = c.render (replaceList)
+		if not commands:
+			autotest.log ('debug', 'shortcut: {} has no commands'.format(sk))
+			return [] if bulk else ''
+		if bulk:
+			return self.commandBulk (commands, context=c.context or CLI_CONFIG)
+		return self.commandBatch (c.context, commands)		# context only for the first command
 		
 	# --------------------------------------------------------------------------
 
-	def loadBuild (self, build, type='system.bcsi'):
+	def loadBuild (self, build, type='system.bcsi', upgradePaths=None):
 		'''
 		Load software from the build server.
 		
 		build - number corresponding to software on build server, format "#####", or
 		        a URL to a build (not implemented)
 		type - Type of build 64bit, 32bit, debug, signed, etc. (not implemented)
+		upgradePaths - {cpu: URL} of already staged images, see sgImages.ImageDistributor
 		return: (status, statusText, loadedVersion, loadedBuild)
 
 		This is a smart loader:
@@ -710,12 +1069,6 @@ class ProxySGCLI (ProxyCommon):
 		4. The new image version is verified against the intended version
 		'''
 		
-		# -- DNS server for system updates (used in build loading)
-		# -- URL to build server pages (used in build loading)
-		kDnsServer = '10.2.2.10'
-		kBuildArchiveURL = 'http://buildarchive.bluecoat.com/'
-		kBuildInfoURL = '''http://cachezilla.bluecoat.com/XMLInterface.cgi?build_id={}&json=1'''
-
 		m = re.search (r'^\d+$', build)
 		if not m: raise Error ('build number format: {}'.format(build))
 		
@@ -724,6 +1077,34 @@ class ProxySGCLI (ProxyCommon):
 		currentVersion, currentBuild = self.getVersionBuild ()
 		if str(build) == str(currentBuild): return currentVersion, currentBuild
 
+		self.loadImage (build, type, upgradePaths)
+		
+		# -- Restart the box, check new build to confirm load
+		self.command ('',context='CLI_ENABLE')
+		self.command ('restart upgrade', context='CLI_EXIT')	# special context as no return prompt	
+		self.waitReady (timeout=900, expectDown=True)		# returns logged in, at the CLI prompt
+		cVersion,cBuild = self.getVersionBuild ()
+		if str(cBuild) != str(build):
+			raise Error ('load build did not match, expected: {}, have: {}'.format(build, cBuild))
+		return cVersion, cBuild
+
+	# --------------------------------------------------------------------------
+
+	def loadImage (self, build, type='system.bcsi', upgradePaths=None):
+		'''
+		Make a build the default system image, without restarting.
+		An installed system with that build is selected, otherwise the image is
+		loaded with "load upgrade" from upgradePaths or from the build server.
+		
+		build - number corresponding to software on build server, format "#####"
+		type - Type of build 64bit, 32bit, debug, signed, etc.
+		upgradePaths - {cpu: URL} of already staged images, see sgImages.ImageDistributor
+		return: True, raises Error when no image could be loaded
+		'''
+
+		# -- DNS server for system updates (used in build loading)
+		kDnsServer = '10.2.2.10'
+
 		readyToRestart = False
 		# -- put code to load a build from a URL here
 
@@ -739,62 +1120,37 @@ class ProxySGCLI (ProxyCommon):
 					readyToRestart = True
 					break
 
-		# -- Look for builds on build server
+		# -- Look for builds on build server, or use the staged images
 
 		if not readyToRestart:
-			buildLinks = {}
-			# -- Get build information from cachezilla, to contruct a build server link
-			import json
-			data = urllib2.urlopen(kBuildInfoURL.format(build)).read()
-			x = json.loads (data) ['Build']
-			if 'branch' not in x: raise Error ('build XML data: ' + x['msg'])
-			branch = x['branch']
-#			build = x['build_id']
-			# -- Look for 64bit and 32bit image directories, put those in link dictionary
-			
-			baseLink = kBuildArchiveURL + branch + '.' + build + '/wdir/images/bin/'
-			try:
-				p = urllib2.urlopen (baseLink)
-				exists = True
-			except urllib2.HTTPError:
-				exists = False
-			if exists and p.code == 200:
-				cpudata = p.read()
-				cpu = ('x86_64','x86')
-				for acpu in cpu:
-					if re.search('{}/'.format(acpu), cpudata):
-						nl = baseLink+'{}/sgos_native/release/'.format(acpu)
-						data = urllib2.urlopen(nl).read()				
-						m = re.search('(gcc_v\d+\.\d+\.\d+/)',data)
-						if m: buildLinks[acpu] =  nl + m.group(1) + 'sysimg/' + type
-						else: raise Error ('could not parse build link')	
+			if upgradePaths:
+				buildLinks = dict (upgradePaths)
 			else:
-				# -- Look for older build versions, get model number to select proper image directories
-				# -- (not tested)
-				out = self.command ('show advanced-url /Diagnostics/Hardware/Info')
-				m = re.search (r'Model:\s+([0-9]+)', out)
-				if not m: raise Error ('could not find model number')
-				buildFile = m.group(1) + '.chk'
-				oldLink = kBuildArchiveURL + branch + '.' + build + '/wdir/' + buildFile
-				try:
-					p = urllib2.urlopen (oldLink)
-					exists = True
-				except urllib2.HTTPError:
-					exists = False
-				if exists and p.code == 200:
-					buildLinks['old'] = oldLink
-				else:
-					raise Error ('could not find proxysg build on build server for branch: {}, build: {}'.format(branch, build))
-
-			# -- Make sure that DNS server is configured so as to find build server
-
-			self.command ('dns-forwarding', context='CLI_CONFIG')
-			self.command ('edit primary')
-			sgout = self.command ('view')
-			if sgout.find(kDnsServer) == -1:
-				self.command ('add server '+kDnsServer)
-			self.command ('exit')
-			self.command ('exit')
+				import sgImages
+				# -- Get build information from cachezilla, to contruct a build server link
+				# -- Look for 64bit and 32bit image directories, put those in link dictionary
+				branch, buildLinks = sgImages.resolveBuildLinks (build, type)
+				if not buildLinks:
+					# -- Look for older build versions, get model number to select proper image directories
+					# -- (not tested)
+					out = self.command ('show advanced-url /Diagnostics/Hardware/Info')
+					m = re.search (r'Model:\s+([0-9]+)', out)
+					if not m: raise Error ('could not find model number')
+					oldLink = sgImages.resolveOldBuildLink (branch, build, m.group(1))
+					if oldLink:
+						buildLinks['old'] = oldLink
+					else:
+						raise Error ('could not find proxysg build on build server for branch: {}, build: {}'.format(branch, build))
+
+				# -- Make sure that DNS server is configured so as to find build server
+
+				self.command ('dns-forwarding', context='CLI_CONFIG')
+				self.command ('edit primary')
+				sgout = self.command ('view')
+				if sgout.find(kDnsServer) == -1:
+					self.command ('add server '+kDnsServer)
+				self.command ('exit')
+				self.command ('exit')
 
 			# -- Walk through build link dictionary by perfered type
 			# -- % incompatible? check next build, other errors cause fault
@@ -811,16 +1167,7 @@ class ProxySGCLI (ProxyCommon):
 
 		# -- Bad news
 		if not readyToRestart: raise Error ('could not find build to load')
-		
-		# -- Restart the box, check new build to confirm load
-		self.command ('',context='CLI_ENABLE')
-		self.command ('restart upgrade', context='CLI_EXIT')	# special context as no return prompt	
-		self.wait (endWait=300)
-		self._goThroughLogin () #JDL- connector is likely to be invalid after restart, so go back through login
-		cVersion,cBuild = self.getVersionBuild ()
-		if str(cBuild) != str(build):
-			raise Error ('load build did not match, expected: {}, have: {}'.format(build, cBuild))
-		return cVersion, cBuild
+		return True
 
 	# --------------------------------------------------------------------------
 
@@ -842,7 +1189,7 @@ class ProxySGCLI (ProxyCommon):
 		self.command ('', context='CLI_ENABLE')
 		self.command (command, context='CLI_EXIT')				
 		autotest.log ('debug', "Wait for SG to come up after the restart...")
-		self.wait()
+		self.waitReady (expectDown=True)
 	
 	# --------------------------------------------------------------------------
 
@@ -894,7 +1241,7 @@ class ProxySGHTTP (ProxyCommon):
 
 	# --------------------------------------------------------------------------
 
-	def __init__ (self, device='', protocol=None, ipaddr=None, port=None, username=None, password=None):
+	def __init__ (self, device='', protocol=None, ipaddr=None, port=None, username=None, password=None, maxConnections=4, idleTimeout=30, cacheTTL=5):
 		'''
 		Initialize proxy connection object for HTTP access.
 		
@@ -905,6 +1252,9 @@ class ProxySGHTTP (ProxyCommon):
 		username - user name
 		password - pass word
 		aspects - dictionary of configuration variables (defaults to autotest.aspects)
+		maxConnections - keep-alive connections allowed to the device at once
+		idleTimeout - seconds an idle keep-alive connection is kept open
+		cacheTTL - seconds a parsed page is reused before it is downloaded again
 		
 		When the device paramter utilized then the ipaddr/username/password parameters are taken from
 		the aspects dictionary. aspects can be passed in or the glocal autotest aspects dictonary is used.
@@ -913,43 +1263,54 @@ class ProxySGHTTP (ProxyCommon):
 		'''
 		
 				
-		self.aspects = autotest.dotdictify()
+		self.device  = device
+		self.aspects = autotest.device_aspects (device,
+			username = username,
+			password = password,
+			protocol = protocol,
+			ipaddr   = ipaddr,
+			port     = port,
+			)
 		asp = self.aspects
-		asp.username = username
-		asp.password = password
-		asp.protocol = protocol
-		asp.ipaddr   = ipaddr
-		asp.port     = port
-		
-		if device:
-			for k,v in autotest.aspects[device].items():
-				if asp.get(k) == None: asp[k]=v
-				
+
 		if asp.username == None: asp.username = 'admin'
 		if asp.password == None: asp.password = 'admin'
 		if asp.protocol == None: asp.protocol = 'https'
 		if asp.port     == None: asp.port     = 8082
 
-		# -- Install managers for password authentication and cookie management
-		# -- These will automatically keep session for subsequent web access
+		# -- Cookie management and basic authentication are handled by the connection pool.
+		# -- The session and the keep-alive connections are kept for subsequent web access
 
-		self.passMan = urllib2.HTTPPasswordMgrWithDefaultRealm ()
-		self.passMan.add_password (None,
-			'https://{}:{}'.format (self.aspects.ipaddr,self.aspects.port),
-			self.aspects.username, self.aspects.password)
-		self.authHandler = urllib2.HTTPBasicAuthHandler (self.passMan)
-	
-		self.cookieJar = cookielib.CookieJar ()
-		self.cookieMan = urllib2.HTTPCookieProcessor (self.cookieJar)
+		import http.cookiejar
+		import ssl
+		import sgHttpPool
 
-                # Build the SSL context to disable certificate verification
-                # This is a little bit of a security hole ... Need to have a better means of addressing this!
-                self.ctx = ssl.create_default_context()
+		self.cookieJar = http.cookiejar.CookieJar ()
+
+		# Build the SSL context to disable certificate verification
+		# This is a little bit of a security hole ... Need to have a better means of addressing this!
+		self.ctx = ssl.create_default_context()
 		self.ctx.check_hostname = False
 		self.ctx.verify_mode = ssl.CERT_NONE
 
-		self.opener = urllib2.build_opener (self.authHandler, self.cookieMan, urllib2.HTTPSHandler(context=self.ctx))
+		self.pool = sgHttpPool.HTTPPool (maxPerHost=maxConnections, idleTimeout=idleTimeout, sslContext=self.ctx,
+			cookieJar=self.cookieJar, username=self.aspects.username, password=self.aspects.password)
+
+		self.cacheTTL = cacheTTL
+		self._parsed  = {}		# name: (fetch time, parsed record), see getParsedPage
+
+
+	# --------------------------------------------------------------------------
+
+	def openPage (self, url):
+		'''
+		Open a page for reading, returns a file-like sgHttpPool.PooledResponse.
+		The keep-alive connection goes back to the pool once the page is read or closed.
+		url - /direcotry/file portion of url, must start with slash
+		'''
 
+		fullUrl = '{}://{}:{}{}'.format (self.aspects.protocol, self.aspects.ipaddr, self.aspects.port, url)
+		return self.pool.open (fullUrl, headers={'User-agent': 'Mozilla/4.0 (compatible; MSIE 5.5; Windows NT)'})
 
 	# --------------------------------------------------------------------------
 
@@ -959,10 +1320,8 @@ class ProxySGHTTP (ProxyCommon):
 		url - /direcotry/file portion of url, must start with slash
 		'''
 
-		fullUrl = '{}://{}:{}{}'.format (self.aspects.protocol, self.aspects.ipaddr, self.aspects.port, url)
-		request = urllib2.Request (url=fullUrl)
-		request.add_header('User-agent', 'Mozilla/4.0 (compatible; MSIE 5.5; Windows NT)')
-		return self.opener.open (request).read ()
+		with self.openPage (url) as response:
+			return response.read ().decode ('utf-8', 'replace')
 
 		# -- need to figure out get vs post, currently defaulting to GET
 
@@ -978,113 +1337,228 @@ class ProxySGHTTP (ProxyCommon):
 # 
 # 		return data
 
-	def getConnectionPool(self, pool):
-		'''Get ADN connection pools from adn/show/tunnel/cpm'''
+	# --------------------------------------------------------------------------
+
+	def _timedPage (self, url):
+		'''Fetch one page for getPages, never raises'''
+
+		start = time.monotonic ()
+		try:
+			data, error = self.getPage (url), None
+		except Exception as e:
+			data, error = None, e
+		return PageResult (self.device or self.aspects.ipaddr, url, data, time.monotonic () - start, error)
+
+	def getPages (self, urls, maxWorkers=None):
+		'''
+		Fetch several pages concurrently over the keep-alive connection pool.
+		urls - list of /directory/file portions of urls
+		maxWorkers - number of fetch threads, defaults to the pool's connection limit
+		Yields: PageResult (device, url, data, latency, error) in order of completion
+		'''
+
+		import concurrent.futures
+		workers = maxWorkers or self.pool.maxPerHost
+		with concurrent.futures.ThreadPoolExecutor (max_workers=workers) as executor:
+			futures = [executor.submit (self._timedPage, url) for url in urls]
+			for future in concurrent.futures.as_completed (futures):
+				yield future.result ()
+
+	def getParsedPage (self, name, maxAge=None):
+		'''
+		Download and parse a page registered in sgPages, the parsed record is
+		kept for cacheTTL seconds so several lookups share one download and parse.
+		name - registered parser name: hardware, cpu, http, version, cpm
+		maxAge - seconds a cached parse may be old, defaults to cacheTTL, 0 forces a download
+		Returns: the parser's record, e.g. sgPages.HardwareInfo
+		'''
+
+		parser = sgPages.getPageParser (name)
+		maxAge = self.cacheTTL if maxAge == None else maxAge
+		cached = self._parsed.get (name)
+		if cached == None or time.time () - cached[0] > maxAge:
+			cached = (time.time (), parser.parse (self.getPage (parser.url)))
+			self._parsed[name] = cached
+		return cached[1]
+
+	def refreshPages (self, name=None):
+		'''Forget parsed pages, all of them or the one registered as name'''
+		if name == None: self._parsed.clear ()
+		else: self._parsed.pop (name, None)
+
+	# --------------------------------------------------------------------------
+
+	def getConnectionPools (self, maxAge=None):
+		'''
+		Get all ADN connection pools from adn/show/tunnel/cpm, the page is read
+		and parsed once and kept for cacheTTL seconds.
+		maxAge - see getParsedPage
+		Returns: {pool heading: {'entries': [CPMR lines], 'total': total line or None}}
+		'''
+
+		return self.getParsedPage ('cpm', maxAge)
+
+	# --------------------------------------------------------------------------
+
+	def getConnectionPool(self, pool, maxAge=None):
+		'''
+		Get ADN connection pools from adn/show/tunnel/cpm
+		pool - pool heading, or part of it
+		maxAge - see getConnectionPools
+		Returns: list of the pool's CPMR lines followed by its total line
+		'''
 		
-		conList = []
-		tunnelPool = self.getPage('/adn/show/tunnel/cpm?stats_mode=5').splitlines ()
-		for i in range(len(tunnelPool)):
-			if tunnelPool[i].find (pool) >= 0:
-				autotest.log('debug', "Requested {} found".format(pool))
-				if tunnelPool[i+1].find ("Total:") >= 0:
-					autotest.log('debug', "No {} found".format(pool) )
-					conList.append (tunnelPool[i+1])
-				else:
-					i = i + 2
-					while tunnelPool[i].find ("CPMR<") >= 0:
-						conList.append (tunnelPool[i])
-						i = i+1
-					if tunnelPool[i].find ("Total") >= 0:
-						conList.append (tunnelPool[i]) # appends the total # of connections
-				break
+		pools = self.getConnectionPools (maxAge)
+		name = pool if pool in pools else next ((k for k in pools if k.find (pool) >= 0), None)
+		if name == None:
+			return []
+		autotest.log('debug', "Requested {} found".format(pool))
+		entry = pools[name]
+		if not entry['entries']:
+			autotest.log('debug', "No {} found".format(pool) )
+		conList = list (entry['entries'])
+		if entry['total'] != None:
+			conList.append (entry['total']) # appends the total # of connections
 		return conList
 	
 	# --------------------------------------------------------------------------
 
-	def getTcpConnections(self):
+	def iterTcpConnections (self, chunkSize=65536):
+		'''
+		Stream the tcp connection table from url /tcp/connections
+		chunkSize - bytes read from the connection at a time
+		Yields: sgTcpConnections.TcpConnection records as soon as their line arrives
+		'''
+		import sgTcpConnections
+		with self.openPage ('/tcp/connections') as response:
+			for con in sgTcpConnections.iterTcpConnections (response.iterChunks (chunkSize)):
+				yield con
+
+	# --------------------------------------------------------------------------
+
+	def iterTableRows (self, url, table=None, chunkSize=65536):
+		'''
+		Stream the rows of HTML tables of a page, see sgHtml.SGTableParser.iterRows
+		url - /direcotry/file portion of url, must start with slash
+		table - None for every table, table number or caption text. The download
+		        stops as soon as the selected table is complete.
+		Yields: TableRow (table, caption, headers, cells)
+		'''
+		import sgHtml
+		with self.openPage (url) as response:
+			for row in sgHtml.SGTableParser ().iterRows (response.iterChunks (chunkSize), table):
+				yield row
+
+	# --------------------------------------------------------------------------
+
+	def getTcpConnections(self, columnar=False):
 		'''
 		Find and get all tcp connections from url /tcp/connection
+		columnar - return a numpy backed sgTcpConnections.TcpSnapshot for
+		           group-by, top-N and diff analysis (requires numpy)
+		Returns: list of tuples (proto, recv-q, send-q, local, remote, state, rest of line)
+		         or a TcpSnapshot when columnar is set
 		'''
-		conRe = re.compile (r"(?im)(\w+)\s+(\d+)\s+(\d+)\s+((?:\d+\.\d+\.\d+\.\d+\.\d+)|(?:\*\.\d+))\s+((?:\d+\.\d+\.\d+\.\d+.\d+)|(?:\*\.\*))\s+(\w+)\s+(\w.*$)")
-		sCon = self.getPage('/tcp/connections')
-		retVal = []
-		if sCon != None:
-			retVal = conRe.findall(sCon)
-		return retVal
+		if columnar:
+			import sgTcpConnections
+			return sgTcpConnections.TcpSnapshot.fromRecords (self.iterTcpConnections ())
+		return [con.astuple () for con in self.iterTcpConnections ()]
 	
 	# --------------------------------------------------------------------------
 
-	def getMacAddress(self, interfaceId):
+	def getMacAddress(self, interfaceId, maxAge=None):
 		'''
 		Get MAC address of given interface from url /Diagnostics/Hardware/Info
+		The page is parsed once for all interfaces, see getParsedPage
 		'''
-		#macRe = re.compile (r"(?im)(\w+)\s+(\d+)\s+(\d+)\s+((?:\d+\.\d+\.\d+\.\d+\.\d+)|(?:\*\.\d+))\s+((?:\d+\.\d+\.\d+\.\d+.\d+)|(?:\*\.\*))\s+(\w+)\s+(\w.*$)")
-		sHwInfo = self.getPage('/Diagnostics/Hardware/Info?stats_mode=5')
-		if sHwInfo != None:
-			macObj = re.search('Interface\s+{}:.+MAC\s+(([a-fA-F0-9]{2}[:|\-]?){6})'.format(interfaceId), sHwInfo)
-			if macObj:
-				return macObj.group(1)
-			else:
-				raise Error ('could not get MAC address for interface {}'.format(interfaceId))
-		else:
+		hwInfo = self.getParsedPage ('hardware', maxAge)
+		if not hwInfo.fields and not hwInfo.interfaces:
 			raise Error ('nothing returned from /Diagnostics/Hardware/Info')
+		mac = hwInfo.interfaces.get (interfaceId)
+		if mac == None:
+			raise Error ('could not get MAC address for interface {}'.format(interfaceId))
+		return mac
 	
 	# --------------------------------------------------------------------------
 
 	def close (self):
-		'''Close the ProxySG connector'''
-		pass
+		'''Close the ProxySG connector, drops idle keep-alive connections'''
+		self.pool.close ()
 
 
 # ------------------------------------------------------------------------------
 
-class SGHTMLParser (HTMLParser.HTMLParser):
+def getFleetPages (devices, urls, maxWorkers=16):
 	'''
-	Parse simple html table structure to nested array
-	usage:
-		p = SGHTMLParser ()
-		nestedArray = p.parse ( outputFromAPage )		
+	Fetch the same pages from many devices concurrently.
+	devices - list of ProxySGHTTP objects or autotest device names
+	urls - list of /directory/file portions of urls
+	maxWorkers - total number of fetch threads. A device never has more fetches
+	             running than its connection pool allows, further fetches of it are
+	             only submitted as earlier ones finish, so no thread waits on a busy device.
+	Yields: PageResult (device, url, data, latency, error) in order of completion
 	'''
-	
-	_result = None
-	_stack = None
-	_curtag = None
-
-	def parse (self, data):
-		'''Clear old results, process HTML data, return data as nested array
-		data - HTML page with nested tables'''
-		self._result = None
-		HTMLParser.HTMLParser.feed (self, data)
-		return self._result
-
-	def handle_starttag (self,tag, attr):
-#		print '.. start', tag, self.result
-		if tag in ('table','tr'):
-			if self._result == None:
-				self._result = []
-				self._stack = [self._result]
-			else:
-				t = []
-				self._stack[-1].append(t)
-				self._stack.append(t)
-		self._curtag = tag
-		
-	def handle_endtag (self, tag):
-#		print '.. end:', tag, self.result
-		if tag in ('table','tr'):
-			self._stack.pop()
-		self._curtag = None
-		
-	def handle_data (self, data):
-#		print '.. data:', data, self.result, self.curtag
-		if self._curtag == 'td':
-			self._stack[-1].append(data.strip())
+
+	import concurrent.futures
+	created = [ProxySGHTTP (d) for d in devices if isinstance (d, str)]
+	createdIter = iter (created)
+	sgList = [next (createdIter) if isinstance (d, str) else d for d in devices]
+	pending = collections.OrderedDict ((sg, collections.deque (urls)) for sg in sgList)
+	running = collections.Counter ()
+	try:
+		with concurrent.futures.ThreadPoolExecutor (max_workers=maxWorkers) as executor:
+			futures = {}
+
+			def submitReady ():
+				# -- round robin over the devices with a free connection, up to maxWorkers at once
+				while len (futures) < maxWorkers:
+					submitted = False
+					for sg, queue in list (pending.items ()):
+						if len (futures) >= maxWorkers: break
+						if queue and running[sg] < sg.pool.maxPerHost:
+							futures[executor.submit (sg._timedPage, queue.popleft ())] = sg
+							running[sg] += 1
+							submitted = True
+						if not queue: del pending[sg]
+					if not submitted: break
+
+			submitReady ()
+			while futures:
+				done, _ = concurrent.futures.wait (futures, return_when=concurrent.futures.FIRST_COMPLETED)
+				for future in done:
+					running[futures.pop (future)] -= 1
+				submitReady ()
+				for future in done:
+					yield future.result ()
+	finally:
+		for sg in created:
+			sg.close ()
+
+
+# ------------------------------------------------------------------------------
+
+_movedNames = {
+	'SGHTMLParser':  'sgHtml',
+	'SGTableParser': 'sgHtml',
+	'TableRow':      'sgHtml',
+	}
+
+def __getattr__ (name):
+	'''Names moved to modules that are imported on first use, proxysg.SGTableParser still works'''
+	if name in _movedNames:
+		import importlib
+		return getattr (importlib.import_module (_movedNames[name]), name)
+	raise AttributeError ('module {!r} has no attribute {!r}'.format (__name__, name))
 
 
 # ==============================================================================
 
 if __name__ == '__main__':
 
+	import optparse
+	import sgHtml
+	import sgImages
+
 	parser = optparse.OptionParser (usage='%prog [options] <proxy_ipaddr> [<command>]\n{}'.format(__doc__))
 	parser.add_option ('-l', '--log',      dest='log', default='', help='logging')
 	parser.add_option ('-b', '--build',    dest='build', help='build number to load')
@@ -1100,7 +1574,7 @@ if __name__ == '__main__':
 	(options, args) = parser.parse_args ()
 
 	if options.config:
-		autotest.parseConfigFile(options.config)
+		autotest.parse_config_file(options.config)
 		ipaddr = None
 	else:
 		if len(args) == 0:
@@ -1130,34 +1604,33 @@ if __name__ == '__main__':
 		sg1 = ProxySGHTTP (ipadddr=args[0], port=8081, username=options.username, password=options.password)
 		sg1.getPage ('/')
 		sg1.getPage ('/Accesslog/tail/main')
-		sg1.getPage ('/FTP/Info')
 	#	print sg1.getPage ('/Sysinfo')
 	
-		print sg1.getPage ('/SYSINFO/Version')
-		print sg1.getPage ('/Diagnostics/CPU_Monitor/Statistics')
+		for result in sg1.getPages (('/SYSINFO/Version', '/Diagnostics/CPU_Monitor/Statistics', '/Diagnostics/Hardware/Info', '/FTP/Info')):
+			print ('{} ({:.3f}s): {}'.format (result.url, result.latency, result.error or result.data))
 
-		p = SGHTMLParser ()
-		print p.parse ( sg1.getPage ('/Diagnostics/CPU/Statistics') )		
-		print p.parse ( sg1.getPage ('/Diagnostics/Hardware/Info') )
+		p = sgHtml.SGHTMLParser ()
+		print (p.parse ( sg1.getPage ('/Diagnostics/CPU/Statistics') ))
+		print (p.parse ( sg1.getPage ('/Diagnostics/Hardware/Info') ))
 		
 	# -- CLI command execution test
 	
 	if options.x == 2:
-		print sg.command ('show clock')
-		print sg.command ('show cpu')
-		print sg.command ('show sessions', context=CLI_ENABLE)
-		print sg.command ('test http get http://' + gBuildArchiveURL + '/')
-		print sg.context
+		print (sg.command ('show clock'))
+		print (sg.command ('show cpu'))
+		print (sg.command ('show sessions', context=CLI_ENABLE))
+		print (sg.command ('test http get ' + sgImages.kBuildArchiveURL))
+		print (sg.context)
 		
 	if options.x == None and len(args) > 0:
 		start = 1
 		if options.config: start = 0
 		for cmd in args[start:]:
-			print sg.command (cmd)
+			print (sg.command (cmd))
 
 	if options.info:
 		sg.getInfo()
 		for k,v in sg.info.items():
-			print '{}: {}'.format(k,v)
+			print ('{}: {}'.format(k,v))
 
     
\ No newline at end of file
@@ -0,0 +1,223 @@
+'''
+ProxySG configuration backup
+
+Streams the running configuration of a device straight into a compressed,
+content-addressed store: a snapshot is kept once by the sha256 of its text,
+so unchanged configurations of many devices and many nights take no extra
+space. Every device has an index of its snapshots by time.
+
+Sources: the HTTP archive page /archconf_expanded.txt (ProxySGHTTP) or
+"show config" on a pooled SSH channel (ProxySGCLI).
+Compression: zstd when the zstandard package is installed, otherwise gzip.
+
+Example:
+    store = sgBackup.ConfigStore('/var/backups/proxysg')
+    for snap in sgBackup.backupFleet(['proxysg_1', 'proxysg_2'], store):
+        print(snap.device, snap.sha, 'new' if snap.new else 'unchanged', snap.error)
+    text = store.read(store.latest('proxysg_1').sha)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import concurrent.futures
+import gzip
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import autotest
+import proxysg
+
+try:
+    import zstandard
+    HAS_ZSTD = True
+except ImportError:
+    HAS_ZSTD = False
+
+
+class Error(Exception):
+    pass
+
+
+kBackupDir = os.path.join(os.path.expanduser('~'), '.local', 'share', 'proxysg', 'backups')
+kArchiveURL = '/archconf_expanded.txt'
+
+# -- Lines that change on every pull without a configuration change, left out of the snapshot
+kVolatileRE = re.compile(rb'^\s*;+\s*(?:Date|Time|Date/Time|Uptime)\b[^\n]*\n?', re.I | re.M)
+
+# -- new: False when the same configuration was already stored
+Snapshot = collections.namedtuple('Snapshot', ('device', 'timestamp', 'sha', 'size', 'new', 'source', 'elapsed', 'error'))
+
+
+def iterConfig(sg, chunkSize=65536):
+    '''Stream the configuration of a ProxySGHTTP (archive page) or ProxySGCLI (show config)'''
+    if hasattr(sg, 'openPage'):
+        with sg.openPage(kArchiveURL) as response:
+            yield from response.iterChunks(chunkSize)
+    else:
+        yield from sg.iterCommandOutput('show config', context=proxysg.CLI_ENABLE, chunkSize=chunkSize)
+
+
+def _normalise(chunks, volatile):
+    '''
+    Pass chunks on in whole lines ending in \n, without the lines matching volatile.
+    The CLI sends \r\n, the archive page \n: the same configuration gets the same sha either way.
+    '''
+    rest = b''
+    for chunk in chunks:
+        rest += chunk
+        cut = rest.rfind(b'\n') + 1
+        if cut:
+            yield volatile.sub(b'', rest[:cut].replace(b'\r\n', b'\n'))
+            rest = rest[cut:]
+    if rest:
+        yield volatile.sub(b'', rest.replace(b'\r\n', b'\n'))
+
+
+class ConfigStore:
+    '''
+    root/objects/ab/abcdef....gz|zst - one compressed file per distinct configuration
+    root/devices/<device>.jsonl       - snapshots of a device, one JSON line each, oldest first
+    '''
+
+    def __init__(self, root=kBackupDir, compression=None, volatile=kVolatileRE):
+        self.root = root
+        self.compression = compression or ('zstd' if HAS_ZSTD else 'gzip')
+        if self.compression == 'zstd' and not HAS_ZSTD:
+            raise Error('zstd compression requires the zstandard package')
+        self.volatile = volatile
+        self._lock = threading.Lock()
+        os.makedirs(os.path.join(root, 'objects'), exist_ok=True)
+        os.makedirs(os.path.join(root, 'devices'), exist_ok=True)
+
+    def _objectPath(self, sha, compression=None):
+        ext = {'zstd': '.zst', 'gzip': '.gz'}[compression or self.compression]
+        return os.path.join(self.root, 'objects', sha[:2], sha + ext)
+
+    def _findObject(self, sha):
+        for compression in ('zstd', 'gzip'):
+            path = self._objectPath(sha, compression)
+            if os.path.exists(path):
+                return path, compression
+        return None, None
+
+    def _openWriter(self, raw):
+        if self.compression == 'zstd':
+            return zstandard.ZstdCompressor(level=10).stream_writer(raw)
+        return gzip.GzipFile(fileobj=raw, mode='wb', compresslevel=6, mtime=0)
+
+    def store(self, chunks):
+        '''
+        Compress and hash chunks into the store as they arrive.
+        Returns: (sha, size, new)
+        '''
+        sha = hashlib.sha256()
+        size = 0
+        objects = os.path.join(self.root, 'objects')
+        fd, tmp = tempfile.mkstemp(dir=objects, suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as raw:
+                writer = self._openWriter(raw)
+                for chunk in _normalise(chunks, self.volatile):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    writer.write(chunk)
+                writer.close()
+            digest = sha.hexdigest()
+            with self._lock:
+                if self._findObject(digest)[0]:
+                    os.remove(tmp)
+                    return digest, size, False
+                path = self._objectPath(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp, path)
+            return digest, size, True
+        except BaseException:
+            if os.path.exists(tmp):
+                os.remove(tmp)
+            raise
+
+    def addSnapshot(self, snapshot):
+        path = os.path.join(self.root, 'devices', snapshot.device.replace(os.sep, '_') + '.jsonl')
+        entry = snapshot._asdict()
+        entry['error'] = str(snapshot.error) if snapshot.error else None
+        with self._lock, open(path, 'a') as f:
+            f.write(json.dumps(entry) + '\n')
+
+    def snapshots(self, device):
+        '''Returns: list of Snapshot of a device, oldest first'''
+        path = os.path.join(self.root, 'devices', device.replace(os.sep, '_') + '.jsonl')
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            return [Snapshot(**json.loads(line)) for line in f if line.strip()]
+
+    def latest(self, device):
+        '''Returns: the last successful Snapshot of a device, or None'''
+        for snapshot in reversed(self.snapshots(device)):
+            if snapshot.sha:
+                return snapshot
+        return None
+
+    def devices(self):
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(os.path.join(self.root, 'devices'))
+                      if name.endswith('.jsonl'))
+
+    def open(self, sha):
+        '''Returns: binary file object of the uncompressed configuration'''
+        path, compression = self._findObject(sha)
+        if not path:
+            raise Error(f'no configuration stored as: {sha}')
+        if compression == 'zstd':
+            if not HAS_ZSTD:
+                raise Error('reading zstd snapshots requires the zstandard package')
+            return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+        return gzip.open(path, 'rb')
+
+    def read(self, sha):
+        '''Returns: configuration text'''
+        with self.open(sha) as f:
+            return f.read().decode('utf-8', 'replace')
+
+
+def _deviceName(sg):
+    return sg.device or sg.aspects.ipaddr
+
+
+def backup(sg, store, chunkSize=65536):
+    '''
+    Back up one device, errors are returned in the Snapshot and recorded in the device index.
+    sg - ProxySGHTTP, ProxySGCLI or autotest device name (uses HTTP, closed when done)
+    '''
+    if isinstance(sg, str):
+        sg = proxysg.ProxySGHTTP(sg)
+        try:
+            return backup(sg, store, chunkSize)
+        finally:
+            sg.close()
+    source = 'http' if hasattr(sg, 'openPage') else 'cli'
+    start = time.time()
+    try:
+        sha, size, new = store.store(iterConfig(sg, chunkSize))
+        snapshot = Snapshot(_deviceName(sg), start, sha, size, new, source, time.time() - start, None)
+    except Exception as e:
+        autotest.log('error', f'{_deviceName(sg)}: config backup failed: {e}')
+        snapshot = Snapshot(_deviceName(sg), start, None, 0, False, source, time.time() - start, e)
+    store.addSnapshot(snapshot)
+    return snapshot
+
+
+def backupFleet(devices, store, maxWorkers=16):
+    '''
+    Back up many devices concurrently.
+    Yields: Snapshot in order of completion
+    '''
+    with concurrent.futures.ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        futures = [executor.submit(backup, sg, store) for sg in devices]
+        for future in concurrent.futures.as_completed(futures):
+            yield future.result()
@@ -0,0 +1,165 @@
+'''
+ProxySG section-aware configuration diff
+
+A configuration is split into sections: the "!- BEGIN name" ... "!- END name"
+blocks and, inside them, the "#(config ...)" submode blocks. Every section is
+hashed, only sections whose hash changed are line diffed, so comparing two
+multi-MB configurations costs little more than reading them.
+
+Example:
+    diff = sgConfigDiff.diffConfigs(oldText, newText)
+    print(diff.added, diff.removed)
+    for key, lines in diff.changed.items():
+        print(key); print('\n'.join(lines))
+
+    store = sgBackup.ConfigStore()
+    for report in sgConfigDiff.driftReport(store):          # latest against previous snapshot
+        print(report.device, report.diff.summary() if report.diff else 'unchanged')
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import difflib
+import functools
+import hashlib
+import re
+
+
+class Error(Exception):
+    pass
+
+
+_beginRe = re.compile(r'^!-\s*BEGIN\s+(\S.*?)\s*$')
+_endRe = re.compile(r'^!-\s*END\b')
+_submodeRe = re.compile(r'^#\(config[\s)].*$')
+
+Section = collections.namedtuple('Section', ('key', 'lines', 'digest'))
+DriftReport = collections.namedtuple('DriftReport', ('device', 'oldSha', 'newSha', 'diff'))
+
+
+class ConfigDiff(collections.namedtuple('ConfigDiff', ('added', 'removed', 'changed', 'unchanged'))):
+    '''
+    added, removed - section keys only in the new, old configuration
+    changed - {section key: unified diff lines}, in the order of the new configuration
+    unchanged - number of sections with the same hash
+    '''
+
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+
+    def summary(self):
+        return f'{len(self.added)} added, {len(self.removed)} removed, {len(self.changed)} changed, ' \
+               f'{self.unchanged} unchanged sections'
+
+
+def parseSections(text):
+    '''
+    Split a configuration into sections.
+    Keys are "name" for a BEGIN block, "name/#(config ...)" for a submode block in it
+    ("/#(config ...)" outside a BEGIN block), "" for lines before the first block.
+    A key seen again gets " [n]" appended.
+    Returns: {key: Section} in configuration order
+    '''
+    sections = collections.OrderedDict()
+    seen = collections.Counter()
+    block = ''
+    key, lines = '', []
+
+    def close():
+        if lines or (key and not key.startswith(' [')):       # skip empty filler between blocks
+            digest = hashlib.blake2b('\n'.join(lines).encode('utf-8', 'replace'), digest_size=16).digest()
+            sections[key] = Section(key, tuple(lines), digest)
+
+    def start(newKey):
+        seen[newKey] += 1
+        return newKey if seen[newKey] == 1 else f'{newKey} [{seen[newKey]}]'
+
+    for line in text.splitlines():
+        line = line.rstrip()
+        m = _beginRe.match(line)
+        if m:
+            close()
+            block = m.group(1)
+            key, lines = start(block), []
+        elif _endRe.match(line):
+            close()
+            block = ''
+            key, lines = start(''), []
+        elif _submodeRe.match(line):
+            close()
+            key, lines = start(f'{block}/{line}'), []
+        elif line:
+            lines.append(line)
+    close()
+    return sections
+
+
+def diffSections(old, new, context=3):
+    '''Diff two results of parseSections. Returns: ConfigDiff'''
+    added = [k for k in new if k not in old]
+    removed = [k for k in old if k not in new]
+    changed = collections.OrderedDict()
+    unchanged = 0
+    for key, section in new.items():
+        previous = old.get(key)
+        if previous is None:
+            continue
+        if previous.digest == section.digest:
+            unchanged += 1
+            continue
+        changed[key] = list(difflib.unified_diff(previous.lines, section.lines, f'a/{key}', f'b/{key}',
+                                                 n=context, lineterm=''))
+    return ConfigDiff(added, removed, changed, unchanged)
+
+
+def diffConfigs(oldText, newText, context=3):
+    '''Returns: ConfigDiff of two configuration texts'''
+    return diffSections(parseSections(oldText), parseSections(newText), context)
+
+
+# ------------------------------------------------------------------------------
+
+@functools.lru_cache(maxsize=256)
+def _storedSections(store, sha):
+    # -- content addressed, the sections of a sha never change; devices sharing a
+    # -- configuration parse it once
+    return parseSections(store.read(sha))
+
+
+def driftReport(store, devices=None, against=None, context=3):
+    '''
+    Drift of devices in a sgBackup.ConfigStore.
+    devices - device names, default all devices of the store
+    against - None: each device's latest snapshot against the one before it, a device
+              with a single snapshot has no drift,
+              a sha of a stored configuration or the text of a desired configuration:
+              each device's latest snapshot against that
+    Yields: DriftReport, diff is None when the configurations are identical
+    '''
+    desired = desiredSha = None
+    if against is not None:
+        if re.match(r'^[0-9a-f]{64}$', against):
+            desiredSha = against
+            desired = _storedSections(store, against)
+        else:
+            desired = parseSections(against)
+
+    for device in devices or store.devices():
+        snapshots = [s for s in store.snapshots(device) if s.sha]
+        if not snapshots:
+            continue
+        newSha = snapshots[-1].sha
+        if desired is None:
+            oldSha = snapshots[-2].sha if len(snapshots) > 1 else newSha
+            if oldSha == newSha:
+                yield DriftReport(device, oldSha, newSha, None)
+                continue
+            diff = diffSections(_storedSections(store, oldSha), _storedSections(store, newSha), context)
+        else:
+            oldSha = desiredSha
+            if desiredSha == newSha:
+                yield DriftReport(device, oldSha, newSha, None)
+                continue
+            diff = diffSections(desired, _storedSections(store, newSha), context)
+        yield DriftReport(device, oldSha, newSha, diff or None)
@@ -0,0 +1,363 @@
+'''
+ProxySG serial console engine
+
+Console sessions through a terminal server, driven by one asyncio event loop
+so many devices can be recovered at once. Output is kept in a byte buffer and
+prompts are matched incrementally: a pattern that matches within one line is
+only searched from the last incomplete line on. Patterns that may cross a line
+end (a newline, "\\s", a negated class without "\\n", re.S) or are anchored to
+the start of the buffer ("^" or "\\A" without re.M) are searched from the start
+of the buffer, as telnetlib does. Prompts that are a prefix of a longer prompt
+(the enable prompt "sg#" of "sg#(config)") are only accepted once the line went
+idle, instead of waiting a fixed time for more characters.
+
+Example, blocking, as used by ProxySGCLI:
+    console = sgConsole.getEngine().open('10.1.1.100', 2001)
+    console.write('\r')
+    index, match, text = console.expect([reConfig, reEnable], timeout=3, idle=[reEnable])
+
+Example, many consoles from one event loop:
+    async def showVersion(host, port):
+        session = sgConsole.ConsoleSession(host, port)
+        await session.connect()
+        await session.write(b'\r')
+        await session.expect([rb'>$'], timeout=10)
+        ...
+    results = sgConsole.getEngine().runAll(showVersion(h, p) for h, p in consoles)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import asyncio
+import re
+import threading
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+# -- Telnet protocol bytes
+IAC, DONT, DO, WONT, WILL, SB, SE = 255, 254, 253, 252, 251, 250, 240
+ECHO, SGA = 1, 3
+
+kIdleTime = 0.15                # seconds without output before an ambiguous prompt is accepted
+kMaxBuffer = 16 * 1024 * 1024   # unmatched output kept, oldest is dropped beyond it
+
+
+class TelnetDecoder:
+    '''
+    Removes telnet commands from received bytes and answers option negotiation:
+    the server may echo and suppress go-ahead, every other option is refused.
+    State is kept across chunks, a command may be split over two reads.
+    '''
+
+    def __init__(self):
+        self._pending = b''
+        self._inSubnegotiation = False
+
+    def feed(self, chunk):
+        '''Returns: (data, replies), replies are to be sent back to the server'''
+        chunk = self._pending + chunk
+        self._pending = b''
+        data = bytearray()
+        replies = bytearray()
+        i, n = 0, len(chunk)
+        while i < n:
+            if self._inSubnegotiation:
+                end = chunk.find(bytes((IAC, SE)), i)
+                if end < 0:
+                    self._pending = chunk[max(i, n - 1):]       # keep a trailing IAC
+                    return bytes(data), bytes(replies)
+                self._inSubnegotiation = False
+                i = end + 2
+                continue
+            iac = chunk.find(IAC, i)
+            if iac < 0:
+                data += chunk[i:]
+                break
+            data += chunk[i:iac]
+            if iac + 1 >= n:
+                self._pending = chunk[iac:]
+                break
+            command = chunk[iac + 1]
+            if command == IAC:
+                data.append(IAC)
+                i = iac + 2
+            elif command in (DO, DONT, WILL, WONT):
+                if iac + 2 >= n:
+                    self._pending = chunk[iac:]
+                    break
+                option = chunk[iac + 2]
+                if command == WILL:
+                    replies += bytes((IAC, DO if option in (ECHO, SGA) else DONT, option))
+                elif command == DO:
+                    replies += bytes((IAC, WILL if option == SGA else WONT, option))
+                i = iac + 3
+            elif command == SB:
+                self._inSubnegotiation = True
+                i = iac + 2
+            else:                                               # NOP, GA, ...
+                i = iac + 2
+        return bytes(data), bytes(replies)
+
+
+def _bytesPattern(pattern):
+    '''Compile a str or bytes regular expression, or a compiled one, for the byte buffer'''
+    if isinstance(pattern, str):
+        return re.compile(pattern.encode('latin-1'))
+    if isinstance(pattern, bytes):
+        return re.compile(pattern)
+    if isinstance(pattern.pattern, str):
+        return re.compile(pattern.pattern.encode('latin-1'), pattern.flags & ~re.UNICODE)
+    return pattern
+
+
+_classRe = re.compile(rb'\[(\^?)((?:\\.|[^\]])*)\]')
+_lineEndRe = re.compile(rb'\n|\\[nsWD]')
+
+
+def _searchFromStart(pattern):
+    '''
+    True when a match may not lie within the last line alone: the pattern is anchored to
+    the start of the buffer, or may match a line end
+    '''
+    source = pattern.pattern
+    if not pattern.flags & re.M and (b'^' in source or b'\\A' in source):
+        return True
+    if pattern.flags & re.S:
+        return True
+    for negated, body in _classRe.findall(source):
+        if bool(negated) != bool(_lineEndRe.search(body)):     # [^x] without \n, [\s] or [\n]
+            return True
+    return bool(_lineEndRe.search(_classRe.sub(b'', source)))
+
+
+class ConsoleSession:
+    '''
+    One console connection, all methods are coroutines of the loop it was connected on.
+
+    host, port - terminal server address and port of the device console
+    idleTime - seconds of silence that make an ambiguous prompt final
+    maxBuffer - bytes of unmatched output kept
+    '''
+
+    def __init__(self, host, port, idleTime=kIdleTime, maxBuffer=kMaxBuffer):
+        self.host = host
+        self.port = port
+        self.idleTime = idleTime
+        self.maxBuffer = maxBuffer
+        self.buffer = bytearray()
+        self.eof = False
+        self._scanFrom = 0              # start of the first line not yet searched completely
+        self._decoder = TelnetDecoder()
+        self._reader = None
+        self._writer = None
+        self._readTask = None
+        self._arrived = None
+        self._compiled = {}             # pattern: (compiled, search from the buffer start)
+
+    def __repr__(self):
+        return f'<ConsoleSession {self.host}:{self.port}>'
+
+    async def connect(self, timeout=10):
+        self._reader, self._writer = await asyncio.wait_for(asyncio.open_connection(self.host, self.port), timeout)
+        self._arrived = asyncio.Event()
+        self._readTask = asyncio.ensure_future(self._readLoop())
+
+    async def _readLoop(self):
+        try:
+            while True:
+                chunk = await self._reader.read(65536)
+                if not chunk:
+                    break
+                data, replies = self._decoder.feed(chunk)
+                if replies:
+                    self._writer.write(replies)
+                if data:
+                    self.buffer += data
+                    if len(self.buffer) > self.maxBuffer:
+                        drop = len(self.buffer) - self.maxBuffer
+                        del self.buffer[:drop]
+                        self._scanFrom = max(0, self._scanFrom - drop)
+                    self._arrived.set()
+        except (OSError, asyncio.CancelledError):
+            pass
+        finally:
+            self.eof = True
+            self._arrived.set()
+
+    async def write(self, data):
+        if isinstance(data, str):
+            data = data.encode('latin-1')
+        self._writer.write(data.replace(bytes((IAC,)), bytes((IAC, IAC))))
+        await self._writer.drain()
+
+    def _patterns(self, patterns):
+        compiled = []
+        for pattern in patterns:
+            key = pattern if isinstance(pattern, (str, bytes)) else id(pattern)
+            if key not in self._compiled:
+                regex = _bytesPattern(pattern)
+                self._compiled[key] = (regex, _searchFromStart(regex))
+            compiled.append(self._compiled[key])
+        return compiled
+
+    def _scan(self, patterns):
+        '''First pattern in list order that matches, single line patterns are searched from the last incomplete line'''
+        for index, (pattern, fromStart) in enumerate(patterns):
+            match = pattern.search(self.buffer, 0 if fromStart else self._scanFrom)
+            if match:
+                return index, match
+        # -- complete lines without a match need not be searched again
+        self._scanFrom = self.buffer.rfind(b'\n', self._scanFrom) + 1 or self._scanFrom
+        return None
+
+    async def _waitData(self, timeout):
+        '''True when output or end of file arrived within timeout'''
+        if self.eof:
+            return False
+        self._arrived.clear()
+        try:
+            await asyncio.wait_for(self._arrived.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return False
+        return True
+
+    async def expect(self, patterns, timeout=10, idle=()):
+        '''
+        Read until one of the regular expressions matches.
+        patterns - str, bytes or compiled regular expressions, tried in list order
+        idle - those patterns that may be the start of a longer prompt, they only
+               match when no further output arrives for idleTime seconds
+        Returns: (index, match object, bytes up to and including the match), like
+                 telnetlib.expect (-1, None, b'') on timeout, (-1, None, rest of output) on end of file
+        '''
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        compiled = self._patterns(patterns)
+        ambiguous = {i for i, p in enumerate(patterns) if any(p is q for q in idle)}
+        while True:
+            hit = self._scan(compiled)
+            if hit:
+                index, match = hit
+                if index in ambiguous and match.end() == len(self.buffer):
+                    if await self._waitData(min(self.idleTime, deadline - loop.time())):
+                        continue                                # more output, look again
+                # -- the match refers to the buffer, match again on the bytes taken out of it
+                text = self._consume(match.end())
+                return index, compiled[index][0].search(text, match.start()) or match, text
+            if self.eof:
+                return -1, None, self._consume(len(self.buffer))
+            if not await self._waitData(deadline - loop.time()):
+                return -1, None, b''
+
+    def _consume(self, end):
+        text = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        self._scanFrom = 0
+        return text
+
+    async def close(self):
+        if self._writer:
+            self._writer.close()
+            try:
+                await self._writer.wait_closed()
+            except OSError:
+                pass
+        if self._readTask:
+            self._readTask.cancel()
+        self._writer = None
+
+
+class SerialConsole:
+    '''
+    Blocking adapter of a ConsoleSession running on a ConsoleEngine, with the
+    telnetlib.Telnet calls ProxySGCLI uses. Text is str, decoded as latin-1.
+    '''
+
+    def __init__(self, engine, session):
+        self.engine = engine
+        self.session = session
+        self.debugLevel = 0
+
+    def set_debuglevel(self, level):
+        self.debugLevel = level
+
+    def write(self, data):
+        if self.debugLevel:
+            autotest.log('debug', f'{self.session} send {data!r}')
+        self.engine.run(self.session.write(data))
+
+    send = write
+
+    def expect(self, patterns, timeout=10, idle=()):
+        '''As ConsoleSession.expect, the match object is of the str pattern'''
+        patterns = list(patterns)
+        index, match, text = self.engine.run(self.session.expect(patterns, timeout, idle))
+        text = text.decode('latin-1')
+        if self.debugLevel:
+            autotest.log('debug', f'{self.session} recv {text!r}')
+        if index >= 0:
+            pattern = patterns[index]
+            if not hasattr(pattern, 'search'):
+                pattern = re.compile(pattern if isinstance(pattern, str) else pattern.decode('latin-1'))
+            match = pattern.search(text, match.start()) or match
+        return index, match, text
+
+    def read_very_eager(self):
+        return self.engine.run(self._drain()).decode('latin-1')
+
+    async def _drain(self):
+        return self.session._consume(len(self.session.buffer))
+
+    def close(self):
+        self.engine.run(self.session.close())
+
+
+class ConsoleEngine:
+    '''An event loop in a background thread that owns any number of console sessions'''
+
+    def __init__(self, idleTime=kIdleTime):
+        self.idleTime = idleTime
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name='sgConsole', daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout=None):
+        '''Run a coroutine on the engine loop, wait for its result'''
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result(timeout)
+
+    def runAll(self, coroutines):
+        '''Run coroutines concurrently. Returns: list of results or exceptions, in order'''
+        coroutines = list(coroutines)
+
+        async def gather():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+        return self.run(gather())
+
+    def open(self, host, port, timeout=10):
+        '''Returns: connected SerialConsole'''
+        session = ConsoleSession(host, port, self.idleTime)
+        self.run(session.connect(timeout))
+        return SerialConsole(self, session)
+
+    def close(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+        self.loop.close()
+
+
+_engine = None
+_engineLock = threading.Lock()
+
+
+def getEngine():
+    '''The shared ConsoleEngine'''
+    global _engine
+    with _engineLock:
+        if _engine is None:
+            _engine = ConsoleEngine()
+    return _engine
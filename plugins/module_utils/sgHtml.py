@@ -0,0 +1,162 @@
+'''
+ProxySG HTML table parsers
+
+Moved out of proxysg so html.parser is only loaded when a page is parsed.
+SGHTMLParser returns the tables of a page as nested lists, SGTableParser
+streams table rows while the page is still arriving.
+
+Example:
+    for row in sgHtml.SGTableParser().iterRows(chunksOfAPage, table='Interfaces'):
+        print(row.headers, row.cells)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import codecs
+import collections
+import html.parser
+
+
+# -- One data row of an HTML table, see SGTableParser
+# -- headers are the cells of the table's last all-th row
+
+TableRow = collections.namedtuple ('TableRow', ('table', 'caption', 'headers', 'cells'))
+
+
+# ------------------------------------------------------------------------------
+
+class SGHTMLParser (html.parser.HTMLParser):
+	'''
+	Parse simple html table structure to nested array
+	usage:
+		p = SGHTMLParser ()
+		nestedArray = p.parse ( outputFromAPage )		
+	'''
+	
+	_result = None
+	_stack = None
+	_curtag = None
+
+	def parse (self, data):
+		'''Clear old results, process HTML data, return data as nested array
+		data - HTML page with nested tables'''
+		self._result = None
+		html.parser.HTMLParser.feed (self, data)
+		return self._result
+
+	def handle_starttag (self,tag, attr):
+#		print '.. start', tag, self.result
+		if tag in ('table','tr'):
+			if self._result == None:
+				self._result = []
+				self._stack = [self._result]
+			else:
+				t = []
+				self._stack[-1].append(t)
+				self._stack.append(t)
+		self._curtag = tag
+		
+	def handle_endtag (self, tag):
+#		print '.. end:', tag, self.result
+		if tag in ('table','tr'):
+			self._stack.pop()
+		self._curtag = None
+		
+	def handle_data (self, data):
+#		print '.. data:', data, self.result, self.curtag
+		if self._curtag == 'td':
+			self._stack[-1].append(data.strip())
+
+
+# ------------------------------------------------------------------------------
+
+class SGTableParser (html.parser.HTMLParser):
+	'''
+	Streaming table extractor, rows are produced while the page is still arriving.
+	Header cells (th) are kept and attached to the following data rows.
+	usage:
+		p = SGTableParser ()
+		for row in p.iterRows (chunksOfAPage, table='Interfaces'):
+			print (row.headers, row.cells)
+	'''
+
+	def _start (self):
+		self._rows     = collections.deque ()
+		self._tables   = []		# open tables, innermost last
+		self._count    = 0
+		self._select   = None
+		self._finished = False
+
+	def iterRows (self, chunks, table=None):
+		'''
+		Feed page chunks, yield TableRow (table, caption, headers, cells) as rows complete
+		chunks - iterable of str or bytes pieces of an HTML page
+		table - None for every table, table number (0 = first in page) or caption text.
+		        Parsing stops once the selected table is closed.
+		'''
+		self.reset ()
+		self._start ()
+		self._select = table
+		decoder = codecs.getincrementaldecoder ('utf-8') ('replace')
+		for chunk in chunks:
+			self.feed (decoder.decode (chunk) if isinstance (chunk, bytes) else chunk)
+			while self._rows: yield self._rows.popleft ()
+			if self._finished: return
+		self.close ()
+		while self._rows: yield self._rows.popleft ()
+
+	def _selected (self, t):
+		return self._select == None or self._select == t['index'] or self._select == t['caption']
+
+	def _endCell (self, t):
+		if t['cell'] != None and t['row'] != None:
+			t['row'].append ((t['cellTag'], ' '.join (''.join (t['cell']).split ())))
+		t['cell'] = None
+
+	def _endRow (self, t):
+		self._endCell (t)
+		row, t['row'] = t['row'], None
+		if not row: return
+		cells = [text for tag, text in row]
+		if all (tag == 'th' for tag, text in row):
+			t['headers'] = cells
+		elif self._selected (t):
+			self._rows.append (TableRow (t['index'], t['caption'], t['headers'], cells))
+
+	def handle_starttag (self, tag, attr):
+		if tag == 'table':
+			self._tables.append ({'index': self._count, 'caption': None, 'captionText': None,
+				'headers': [], 'row': None, 'cell': None, 'cellTag': None})
+			self._count += 1
+		if not self._tables: return
+		t = self._tables[-1]
+		if tag == 'caption':
+			t['captionText'] = []
+		elif tag == 'tr':
+			self._endRow (t)
+			t['row'] = []
+		elif tag in ('td', 'th'):
+			self._endCell (t)
+			if t['row'] == None: t['row'] = []
+			t['cell'], t['cellTag'] = [], tag
+
+	def handle_endtag (self, tag):
+		if not self._tables: return
+		t = self._tables[-1]
+		if tag == 'caption' and t['captionText'] != None:
+			t['caption'] = ' '.join (''.join (t['captionText']).split ())
+			t['captionText'] = None
+		elif tag in ('td', 'th'):
+			self._endCell (t)
+		elif tag == 'tr':
+			self._endRow (t)
+		elif tag == 'table':
+			self._endRow (t)
+			self._tables.pop ()
+			if self._select != None and self._selected (t): self._finished = True
+
+	def handle_data (self, data):
+		if not self._tables: return
+		t = self._tables[-1]
+		if t['cell'] != None: t['cell'].append (data)
+		elif t['captionText'] != None: t['captionText'].append (data)
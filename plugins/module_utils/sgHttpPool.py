@@ -0,0 +1,256 @@
+'''
+ProxySG keep-alive HTTP(S) connection pool
+
+Keeps connections to the management port open between requests, so scraping
+several pages does not pay a TCP and TLS handshake per page.
+
+Example:
+    pool = sgHttpPool.HTTPPool(sslContext=ctx, username='admin', password='admin')
+    with pool.open('https://1.2.3.4:8082/SYSINFO/Version') as response:
+        data = response.read()
+    pool.close()
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import base64
+import http.client
+import io
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+# -- Errors seen when the device has dropped an idle keep-alive connection
+_staleErrors = (http.client.RemoteDisconnected, http.client.BadStatusLine, ConnectionError, BrokenPipeError)
+_redirectCodes = (301, 302, 303, 307, 308)
+
+
+class _HTTPSConnection(http.client.HTTPSConnection):
+    '''HTTPS connection that offers a saved TLS session for resumption'''
+
+    def __init__(self, host, port, context, timeout, session=None):
+        super().__init__(host, port, timeout=timeout, context=context)
+        self.tlsSession = session
+
+    def connect(self):
+        http.client.HTTPConnection.connect(self)
+        self.sock = self._context.wrap_socket(self.sock, server_hostname=self.host, session=self.tlsSession)
+
+
+class _HostPool:
+    '''Idle connections and connection slots for one (scheme, host, port)'''
+
+    def __init__(self, maxConnections):
+        self.idle = []              # [(connection, lastUsed), ...] most recent last
+        self.slots = threading.BoundedSemaphore(maxConnections)
+        self.tlsSession = None
+        self.useAuth = False        # host challenged once, send credentials up front
+
+
+class PooledResponse:
+    '''
+    File-like wrapper of an http.client response.
+    The connection goes back to the pool when the body is read to the end,
+    and is dropped when the response is closed early.
+    '''
+
+    def __init__(self, pool, hostPool, connection, response, url):
+        self.pool = pool
+        self.hostPool = hostPool
+        self.connection = connection
+        self.response = response
+        self.url = url
+        self.status = response.status
+        self.reason = response.reason
+        self.headers = response.msg
+
+    def info(self):
+        return self.headers
+
+    def read(self, size=-1):
+        if self.connection is None:
+            return b''
+        data = self.response.read() if size is None or size < 0 else self.response.read(size)
+        if self.response.isclosed():
+            self._release(reuse=True)
+        return data
+
+    def iterChunks(self, chunkSize=65536):
+        '''Yield the body in chunks of up to chunkSize bytes'''
+        while True:
+            data = self.read(chunkSize)
+            if not data:
+                break
+            yield data
+
+    def close(self):
+        if self.connection is not None:
+            self._release(reuse=self.response.isclosed())
+
+    def _release(self, reuse):
+        connection, self.connection = self.connection, None
+        self.pool._checkin(self.hostPool, connection, reuse and not self.response.will_close)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPPool:
+    '''
+    Pool of keep-alive HTTP and HTTPS connections.
+
+    maxPerHost - number of connections allowed to one host at once
+    idleTimeout - seconds an unused connection is kept before it is closed
+    timeout - socket timeout in seconds
+    sslContext - ssl.SSLContext for https connections
+    cookieJar - http.cookiejar.CookieJar shared by all requests
+    username, password - basic authentication, sent after the first 401 challenge
+    '''
+
+    def __init__(self, maxPerHost=4, idleTimeout=30, timeout=60, sslContext=None, cookieJar=None, username=None, password=None):
+        self.maxPerHost = maxPerHost
+        self.idleTimeout = idleTimeout
+        self.timeout = timeout
+        self.sslContext = sslContext
+        self.cookieJar = cookieJar
+        self.username = username
+        self.password = password
+        self._hosts = {}
+        self._lock = threading.Lock()
+
+    # --------------------------------------------------------------------------
+
+    def open(self, url, headers=None, method='GET', body=None, maxRedirects=5):
+        '''
+        Send a request, return a PooledResponse.
+        Non 2xx/3xx answers raise urllib.error.HTTPError, like the urllib openers.
+        '''
+        authSent = False
+        for _ in range(maxRedirects + 1):
+            parts = urllib.parse.urlsplit(url)
+            key = (parts.scheme, parts.hostname, parts.port or (443 if parts.scheme == 'https' else 80))
+            hostPool = self._hostPool(key)
+            request = urllib.request.Request(url, data=body, headers=headers or {}, method=method)
+            if self.cookieJar is not None:
+                self.cookieJar.add_cookie_header(request)
+            sendHeaders = dict(request.header_items())
+            if hostPool.useAuth and self.username is not None:
+                sendHeaders['Authorization'] = self._authHeader()
+                authSent = True
+            path = urllib.parse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+
+            response = self._send(key, hostPool, method, path, body, sendHeaders, url)
+            if self.cookieJar is not None:
+                self.cookieJar.extract_cookies(response, request)
+
+            if response.status == 401 and not authSent and self.username is not None \
+                    and 'basic' in (response.headers.get('WWW-Authenticate') or '').lower():
+                response.read()
+                hostPool.useAuth = True
+                continue
+            if response.status in _redirectCodes and response.headers.get('Location'):
+                response.read()
+                url = urllib.parse.urljoin(url, response.headers['Location'])
+                if response.status == 303:
+                    method, body = 'GET', None
+                continue
+            if response.status >= 400:
+                data = response.read()
+                raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(data))
+            return response
+        raise Error(f'too many redirects: {url}')
+
+    def evictIdle(self, now=None):
+        '''Close connections that have been idle longer than idleTimeout'''
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            hostPools = list(self._hosts.values())
+        for hostPool in hostPools:
+            with self._lock:
+                expired = [c for c, used in hostPool.idle if now - used > self.idleTimeout]
+                hostPool.idle = [(c, used) for c, used in hostPool.idle if now - used <= self.idleTimeout]
+            for connection in expired:
+                connection.close()
+
+    def close(self):
+        '''Close all idle connections'''
+        with self._lock:
+            hostPools, self._hosts = list(self._hosts.values()), {}
+        for hostPool in hostPools:
+            for connection, _ in hostPool.idle:
+                connection.close()
+            hostPool.idle = []
+
+    # --------------------------------------------------------------------------
+
+    def _hostPool(self, key):
+        with self._lock:
+            hostPool = self._hosts.get(key)
+            if hostPool is None:
+                hostPool = self._hosts[key] = _HostPool(self.maxPerHost)
+            return hostPool
+
+    def _authHeader(self):
+        token = base64.b64encode(f'{self.username}:{self.password}'.encode('utf-8')).decode('ascii')
+        return 'Basic ' + token
+
+    def _send(self, key, hostPool, method, path, body, headers, url):
+        '''Send on an idle connection, retry once on a fresh one if the idle one went stale'''
+        if not hostPool.slots.acquire(timeout=self.timeout):
+            raise Error(f'no free connection to {key[1]}:{key[2]} within {self.timeout}s')
+        try:
+            while True:
+                connection, reused = self._checkout(key, hostPool)
+                try:
+                    connection.request(method, path, body=body, headers=headers)
+                    response = connection.getresponse()
+                    break
+                except _staleErrors:
+                    connection.close()
+                    if not reused:
+                        raise
+                    autotest.log('debug', f'stale keep-alive connection to {key[1]}:{key[2]}, reconnecting')
+                except Exception:
+                    connection.close()
+                    raise
+        except Exception:
+            hostPool.slots.release()
+            raise
+        return PooledResponse(self, hostPool, connection, response, url)
+
+    def _checkout(self, key, hostPool):
+        '''Return (connection, reused), dropping idle connections past idleTimeout'''
+        now = time.monotonic()
+        with self._lock:
+            while hostPool.idle:
+                connection, used = hostPool.idle.pop()
+                if now - used <= self.idleTimeout:
+                    return connection, True
+                connection.close()
+        scheme, host, port = key
+        if scheme == 'https':
+            return _HTTPSConnection(host, port, self.sslContext, self.timeout, session=hostPool.tlsSession), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _checkin(self, hostPool, connection, reuse):
+        if reuse and connection.sock is not None:
+            session = getattr(connection.sock, 'session', None)
+            with self._lock:
+                if session is not None:
+                    hostPool.tlsSession = session
+                hostPool.idle.append((connection, time.monotonic()))
+        else:
+            connection.close()
+        hostPool.slots.release()
@@ -0,0 +1,358 @@
+'''
+ProxySG firmware image resolution and staging
+
+Resolves build server links for a build, downloads each image once to a
+local staging directory (resuming partial downloads), serves the staging
+directory over HTTP from the control node and loads the staged image on
+many devices at once.
+
+Example:
+    dist = sgImages.ImageDistributor('/var/tmp/sgimages', advertiseHost='10.1.1.5')
+    for result in dist.loadFleet([sg1, sg2, sg3], '123456', window=2):
+        print(result)
+    dist.close()
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import concurrent.futures
+import functools
+import http.server
+import json
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+# -- URL to build server pages (used in build loading)
+kBuildArchiveURL = 'http://buildarchive.bluecoat.com/'
+kBuildInfoURL = '''http://cachezilla.bluecoat.com/XMLInterface.cgi?build_id={}&json=1'''
+
+# -- Image directories in order of preference
+kCpuTypes = ('x86_64', 'x86')
+
+# -- Resolved links are kept on disk, shared by all runs on the control node
+kLinkCachePath = os.path.join(os.path.expanduser('~'), '.cache', 'proxysg', 'buildlinks.json')
+
+LoadResult = collections.namedtuple('LoadResult', ('device', 'loaded', 'error', 'seconds'))
+
+
+def _readUrl(url, timeout=60):
+    with urllib.request.urlopen(url, timeout=timeout) as f:
+        return f.read().decode('utf-8', 'replace')
+
+
+def _urlExists(url, timeout=60):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as f:
+            return f.status == 200
+    except urllib.error.HTTPError:
+        return False
+
+
+def getBuildBranch(build):
+    '''Ask cachezilla for the branch of a build number'''
+    x = json.loads(_readUrl(kBuildInfoURL.format(build)))['Build']
+    if 'branch' not in x:
+        raise Error('build XML data: ' + x['msg'])
+    return x['branch']
+
+
+def _resolveCpuLink(baseLink, cpu, type):
+    nl = baseLink + f'{cpu}/sgos_native/release/'
+    m = re.search(r'(gcc_v\d+\.\d+\.\d+/)', _readUrl(nl))
+    if not m:
+        raise Error('could not parse build link')
+    return nl + m.group(1) + 'sysimg/' + type
+
+
+class BuildLinkCache:
+    '''
+    Persistent cache of resolved build links keyed by (build, type, cpu).
+
+    Unknown builds and builds without any image are cached too (negative
+    entries) for negativeTtl seconds, resolved builds for ttl seconds. On every
+    update the entries written are merged into the current file, expired
+    entries dropped and the file replaced atomically, so concurrent runs share it.
+    '''
+
+    def __init__(self, path=kLinkCachePath, ttl=7 * 86400, negativeTtl=600):
+        self.path = path
+        self.ttl = ttl
+        self.negativeTtl = negativeTtl
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(build, type, cpu):
+        return f'{build}|{type}|{cpu}'
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _expired(self, entry, now):
+        ttl = self.ttl if entry.get('found') else self.negativeTtl
+        return now - entry.get('time', 0) > ttl
+
+    def get(self, build, type, cpu):
+        '''
+        Returns: None when not cached or expired, otherwise the entry
+                 {'branch', 'link', 'error', 'found', 'time'}, link is None when the
+                 cpu type has no image
+        '''
+        with self._lock:
+            entry = self._entries.get(self._key(build, type, cpu))
+        if entry is None or self._expired(entry, time.time()):
+            return None
+        return entry
+
+    def put(self, build, type, entries):
+        '''Store {cpu: (branch, link or None, error or None)} and write the file'''
+        now = time.time()
+        found = any(link for branch, link, error in entries.values())
+        with self._lock:
+            # -- only this call's entries override the file, other runs may have written newer ones
+            merged = self._load()
+            for cpu, (branch, link, error) in entries.items():
+                merged[self._key(build, type, cpu)] = {'branch': branch, 'link': link, 'error': error,
+                                                       'found': found, 'time': now}
+            merged = {key: entry for key, entry in merged.items() if not self._expired(entry, now)}
+            self._entries = merged
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = f'{self.path}.{os.getpid()}.{threading.get_ident()}.tmp'
+                with open(tmp, 'w') as f:
+                    json.dump(merged, f)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                autotest.log('debug', f'could not write build link cache {self.path}: {e}')
+
+    def clear(self):
+        with self._lock:
+            self._entries = {}
+            if os.path.exists(self.path):
+                os.remove(self.path)
+
+
+_linkCache = None
+_resolveLocks = collections.defaultdict(threading.Lock)
+_resolveLocksLock = threading.Lock()
+
+
+def getLinkCache():
+    '''The shared BuildLinkCache at kLinkCachePath'''
+    global _linkCache
+    if _linkCache is None:
+        _linkCache = BuildLinkCache()
+    return _linkCache
+
+
+def _crawlBuildLinks(build, type):
+    branch = getBuildBranch(build)
+    baseLink = kBuildArchiveURL + branch + '.' + build + '/wdir/images/bin/'
+    try:
+        cpudata = _readUrl(baseLink)
+    except urllib.error.HTTPError:
+        return branch, {}
+    cpus = [cpu for cpu in kCpuTypes if re.search(f'{cpu}/', cpudata)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max(1, len(cpus))) as executor:
+        links = dict(zip(cpus, executor.map(lambda cpu: _resolveCpuLink(baseLink, cpu, type), cpus)))
+    return branch, links
+
+
+def resolveBuildLinks(build, type='system.bcsi', cache=None):
+    '''
+    Find the sysimg links of a build on the build server.
+    The per cpu directories are crawled concurrently, results (found or not)
+    are kept in the build link cache so later calls and runs do not crawl again.
+    Concurrent calls for the same build wait for one crawl.
+    cache - BuildLinkCache, None for the shared one, False to always crawl
+    Returns: (branch, {cpu: link}), links are empty for old builds, see resolveOldBuildLink
+    '''
+    if cache is False:
+        return _crawlBuildLinks(build, type)
+    cache = cache or getLinkCache()
+    with _resolveLocksLock:
+        lock = _resolveLocks[(build, type)]
+    with lock:
+        entries = [cache.get(build, type, cpu) for cpu in kCpuTypes]
+        if all(entries):
+            if entries[0]['error']:
+                raise Error(entries[0]['error'])
+            return entries[0]['branch'], {cpu: e['link'] for cpu, e in zip(kCpuTypes, entries) if e['link']}
+        try:
+            branch, links = _crawlBuildLinks(build, type)
+        except Error as e:
+            cache.put(build, type, {cpu: (None, None, str(e)) for cpu in kCpuTypes})
+            raise
+        cache.put(build, type, {cpu: (branch, links.get(cpu), None) for cpu in kCpuTypes})
+        return branch, links
+
+
+def resolveOldBuildLink(branch, build, model):
+    '''Link of the model specific image of older builds, None when missing'''
+    oldLink = kBuildArchiveURL + branch + '.' + build + '/wdir/' + model + '.chk'
+    return oldLink if _urlExists(oldLink) else None
+
+
+# ------------------------------------------------------------------------------
+
+class ImageStager:
+    '''
+    Download images once into a staging directory.
+    The local path mirrors the URL path. An interrupted download is kept as
+    "<file>.part" and resumed with a Range request.
+    '''
+
+    def __init__(self, stageDir, retries=5, timeout=60, chunkSize=1 << 20):
+        self.stageDir = stageDir
+        self.retries = retries
+        self.timeout = timeout
+        self.chunkSize = chunkSize
+        self._locks = collections.defaultdict(threading.Lock)
+        self._locksLock = threading.Lock()
+
+    def localPath(self, url):
+        parts = urllib.parse.urlsplit(url)
+        host = parts.netloc.replace(':', '_')
+        rel = [urllib.parse.unquote(p) for p in (host + parts.path).split('/') if p not in ('', '.', '..')]
+        return os.path.join(self.stageDir, *rel)
+
+    def fetch(self, url):
+        '''Return the local path of url, downloading or resuming it first when needed'''
+        path = self.localPath(url)
+        with self._locksLock:
+            lock = self._locks[path]
+        with lock:
+            if os.path.exists(path):
+                return path
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            part = path + '.part'
+            for attempt in range(1, self.retries + 1):
+                try:
+                    if self._download(url, part):
+                        break
+                except (urllib.error.URLError, ConnectionError, socket.timeout) as e:
+                    autotest.log('debug', f'download of {url} interrupted ({e}), attempt {attempt}')
+                    if attempt == self.retries:
+                        raise
+            else:
+                raise Error(f'download of {url} incomplete after {self.retries} attempts')
+            os.replace(part, path)
+            return path
+
+    def _download(self, url, part):
+        '''Download or resume into part, True once the file is complete'''
+        offset = os.path.getsize(part) if os.path.exists(part) else 0
+        request = urllib.request.Request(url, headers={'Range': f'bytes={offset}-'} if offset else {})
+        try:
+            response = urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            if e.code == 416 and offset:        # nothing left to send
+                return True
+            raise
+        with response:
+            if offset and response.status != 206:      # server ignored the range, start over
+                offset = 0
+            length = response.headers.get('Content-Length')
+            expected = offset + int(length) if length else None
+            with open(part, 'ab' if offset else 'wb') as f:
+                shutil.copyfileobj(response, f, self.chunkSize)
+        return expected is None or os.path.getsize(part) >= expected
+
+
+class _ImageRequestHandler(http.server.SimpleHTTPRequestHandler):
+    def log_message(self, format, *args):
+        autotest.log('debug', 'image server: ' + format % args)
+
+
+class ImageServer:
+    '''
+    Serve a staging directory over HTTP from a background thread.
+    advertiseHost - address of this control node as the devices reach it
+    '''
+
+    def __init__(self, rootDir, advertiseHost, port=0, bind=''):
+        self.rootDir = rootDir
+        self.advertiseHost = advertiseHost
+        handler = functools.partial(_ImageRequestHandler, directory=rootDir)
+        self.httpd = http.server.ThreadingHTTPServer((bind, port), handler)
+        self.port = self.httpd.server_address[1]
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name='sgImageServer', daemon=True)
+        self._thread.start()
+
+    def url(self, localPath):
+        '''URL the devices use for a file below the root directory'''
+        rel = os.path.relpath(localPath, self.rootDir).replace(os.sep, '/')
+        return f'http://{self.advertiseHost}:{self.port}/{urllib.parse.quote(rel)}'
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class ImageDistributor:
+    '''
+    Resolve, stage and serve builds, then load them on many devices.
+
+    stageDir - local staging directory
+    advertiseHost - address of this control node as the devices reach it
+    port - HTTP port of the image server, 0 picks a free one
+    resolver - function (build, type) -> (branch, {cpu: link}), defaults to resolveBuildLinks
+    '''
+
+    def __init__(self, stageDir, advertiseHost, port=0, resolver=resolveBuildLinks):
+        self.stager = ImageStager(stageDir)
+        self.server = ImageServer(stageDir, advertiseHost, port)
+        self.resolver = resolver
+
+    def stage(self, build, type='system.bcsi'):
+        '''Download the build's images (once), Returns: {cpu: URL on this control node}'''
+        branch, links = self.resolver(build, type)
+        if not links:
+            raise Error(f'no staged image types for build {build} on branch {branch}')
+        with concurrent.futures.ThreadPoolExecutor(max_workers=len(links)) as executor:
+            paths = dict(zip(links, executor.map(self.stager.fetch, links.values())))
+        return {cpu: self.server.url(path) for cpu, path in paths.items()}
+
+    def _load(self, sg, build, type, upgradePaths):
+        start = time.time()
+        try:
+            sg.loadImage(build, type, upgradePaths=upgradePaths)
+            return LoadResult(sg.aspects.device or sg.aspects.ipaddr, True, None, time.time() - start)
+        except Exception as e:
+            return LoadResult(sg.aspects.device or sg.aspects.ipaddr, False, e, time.time() - start)
+
+    def loadFleet(self, devices, build, type='system.bcsi', window=4):
+        '''
+        Stage a build once, then point every device's upgrade-path at this
+        control node and run "load upgrade", at most window devices at a time.
+        The devices are not restarted.
+        devices - list of ProxySGCLI objects
+        Yields: LoadResult (device, loaded, error, seconds) as devices finish
+        '''
+        upgradePaths = self.stage(build, type)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=window) as executor:
+            futures = [executor.submit(self._load, sg, build, type, upgradePaths) for sg in devices]
+            for future in concurrent.futures.as_completed(futures):
+                yield future.result()
+
+    def close(self):
+        self.server.close()
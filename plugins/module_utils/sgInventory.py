@@ -0,0 +1,278 @@
+'''
+ProxySG device inventory
+
+Loads device aspects for large fleets from an INI file, a JSON file or a
+SQLite index. INI and JSON inventories are parsed once into a SQLite index
+kept in the cache directory, keyed by the file's path, size and modification
+time, so a later start only opens the index. A device's aspects are read
+from the index and turned into a DotDict when the device is first used.
+
+INI, as autotest.parse_config_file, plus one section per device:
+    [aspects]
+    proxysg_1.ipaddr = 10.1.1.100
+    proxysg_1.tags = dc1, core
+    [proxysg_2]
+    ipaddr = 10.1.1.101
+    tags = dc2
+
+JSON:
+    {"aspects": {"autotest.termination.seconds": 600},
+     "devices": {"proxysg_1": {"ipaddr": "10.1.1.100", "tags": ["dc1", "core"]}}}
+
+Tags are the "tags" aspect of a device, a list or a comma separated string.
+
+Example:
+    inventory = sgInventory.useInventory('/etc/proxysg/inventory.json')
+    devices = inventory.select('proxysg_*', tags=['dc1'])
+    for snap in sgBackup.backupFleet(devices, store):
+        ...
+    print(inventory['proxysg_1'].ipaddr)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import collections.abc
+import configparser
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+kInventoryCacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'proxysg', 'inventory')
+kIndexVersion = 1
+kIndexSuffixes = ('.sqlite', '.sqlite3', '.db')
+
+_tagSplitRe = re.compile(r'[,\s]+')
+
+_schema = '''
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT) WITHOUT ROWID;
+CREATE TABLE devices (name TEXT PRIMARY KEY, data TEXT NOT NULL) WITHOUT ROWID;
+CREATE TABLE tags (tag TEXT, device TEXT, PRIMARY KEY (tag, device)) WITHOUT ROWID;
+'''
+
+
+def _tags(value):
+    if value is None:
+        return []
+    if isinstance(value, str):
+        return [tag for tag in _tagSplitRe.split(value) if tag]
+    return [str(tag) for tag in value]
+
+
+def parseIni(path):
+    '''Returns: (global aspects, {device: aspects}) of an INI inventory'''
+    config = configparser.ConfigParser()
+    if not config.read(path):
+        raise Error(f'Inventory file does not exist: {path}')
+    globalAspects = {}
+    devices = collections.defaultdict(dict)
+    if config.has_section('aspects'):
+        for key, value in config.items('aspects'):
+            device, dot, rest = key.partition('.')
+            if dot:
+                devices[device][rest] = value
+            else:
+                globalAspects[key] = value
+    for section in config.sections():
+        if section != 'aspects':
+            devices[section].update(config.items(section))
+    return globalAspects, devices
+
+
+def parseJson(path):
+    '''Returns: (global aspects, {device: aspects}) of a JSON inventory'''
+    with open(path) as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise Error(f'Inventory must be a JSON object: {path}')
+    if isinstance(data.get('devices'), dict):
+        return data.get('aspects') or {}, data['devices']
+    # -- flat layout: objects are devices, other values global aspects
+    return ({k: v for k, v in data.items() if not isinstance(v, dict)},
+            {k: v for k, v in data.items() if isinstance(v, dict)})
+
+
+def buildIndex(path, indexPath):
+    '''
+    Parse an INI or JSON inventory into a SQLite index at indexPath, ':memory:'
+    for an index that is not kept. Returns: open sqlite3 connection of the index
+    '''
+    st = os.stat(path)
+    globalAspects, devices = (parseJson if path.endswith('.json') else parseIni)(path)
+    if indexPath == ':memory:':
+        tmp = indexPath
+    else:
+        # -- a private file per writer, replaced into place once complete
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(indexPath))
+        os.close(fd)
+    try:
+        db = sqlite3.connect(tmp, check_same_thread=False)
+        with db:
+            db.executescript(_schema)
+            db.executemany('INSERT INTO meta VALUES (?, ?)', (
+                ('version', str(kIndexVersion)), ('source', os.path.abspath(path)), ('size', str(st.st_size)),
+                ('mtime', str(st.st_mtime_ns)), ('aspects', json.dumps(globalAspects))))
+            db.executemany('INSERT INTO devices VALUES (?, ?)',
+                           ((name, json.dumps(aspects)) for name, aspects in devices.items()))
+            db.executemany('INSERT OR IGNORE INTO tags VALUES (?, ?)',
+                           ((tag, name) for name, aspects in devices.items() for tag in _tags(aspects.get('tags'))))
+        if tmp == ':memory:':
+            return db
+        db.close()
+        os.replace(tmp, indexPath)
+    except BaseException:
+        if tmp != ':memory:' and os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return sqlite3.connect(indexPath, check_same_thread=False)
+
+
+def _meta(db):
+    try:
+        return dict(db.execute('SELECT key, value FROM meta'))
+    except sqlite3.DatabaseError:
+        return {}
+
+
+def openIndex(path, cacheDir=kInventoryCacheDir):
+    '''
+    SQLite index of an inventory: a .sqlite/.db file is used as is, an INI or JSON
+    file is indexed once and reused from cacheDir while the file is unchanged.
+    cacheDir - None keeps the index in memory only, as does a cacheDir that cannot be written
+    Returns: open sqlite3 connection
+    '''
+    if path.endswith(kIndexSuffixes):
+        if not os.path.isfile(path):
+            raise Error(f'Inventory index does not exist: {path}')
+        db = sqlite3.connect(f'file:{path}?mode=ro', uri=True, check_same_thread=False)
+        if _meta(db).get('version') != str(kIndexVersion):
+            db.close()
+            raise Error(f'Not an inventory index of version {kIndexVersion}: {path}')
+        return db
+    if not os.path.isfile(path):
+        raise Error(f'Inventory file does not exist: {path}')
+    if not cacheDir:
+        return buildIndex(path, ':memory:')
+
+    st = os.stat(path)
+    indexPath = os.path.join(cacheDir, hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest() + '.sqlite')
+    if os.path.exists(indexPath):
+        db = sqlite3.connect(indexPath, check_same_thread=False)
+        meta = _meta(db)
+        if (meta.get('version'), meta.get('size'), meta.get('mtime')) == \
+                (str(kIndexVersion), str(st.st_size), str(st.st_mtime_ns)):
+            return db
+        db.close()
+    autotest.log('info', f'indexing inventory {path}')
+    try:
+        os.makedirs(cacheDir, exist_ok=True)
+        return buildIndex(path, indexPath)
+    except (OSError, sqlite3.Error) as e:
+        autotest.log('debug', f'could not write inventory index in {cacheDir}: {e}, kept in memory')
+        return buildIndex(path, ':memory:')
+
+
+class Inventory(collections.abc.Mapping):
+    '''
+    Devices of an inventory, a read only mapping of device name to DotDict of
+    its aspects. Aspects are materialized per device on first access.
+    path - INI, JSON or SQLite index file, see openIndex
+    '''
+
+    def __init__(self, path, cacheDir=kInventoryCacheDir):
+        self.path = path
+        self._db = openIndex(path, cacheDir)
+        self._lock = threading.Lock()
+        self._devices = {}
+        self.globalAspects = json.loads(_meta(self._db).get('aspects') or '{}')
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._db.execute(sql, args).fetchall()
+
+    def __getitem__(self, device):
+        aspects = self._devices.get(device)
+        if aspects is None:
+            rows = self._query('SELECT data FROM devices WHERE name = ?', (device,))
+            if not rows:
+                raise KeyError(device)
+            aspects = self._devices.setdefault(device, autotest.DotDict(json.loads(rows[0][0])))
+        return aspects
+
+    def get(self, device, default=None):
+        try:
+            return self[device]
+        except KeyError:
+            return default
+
+    def __contains__(self, device):
+        return device in self._devices or bool(self._query('SELECT 1 FROM devices WHERE name = ?', (device,)))
+
+    def __len__(self):
+        return self._query('SELECT COUNT(*) FROM devices')[0][0]
+
+    def __iter__(self):
+        return iter(self.devices())
+
+    def devices(self):
+        '''Returns: all device names, sorted'''
+        return [name for name, in self._query('SELECT name FROM devices ORDER BY name')]
+
+    def tags(self, device=None):
+        '''Returns: sorted tags of a device, or of all devices'''
+        if device is None:
+            return [tag for tag, in self._query('SELECT DISTINCT tag FROM tags ORDER BY tag')]
+        return [tag for tag, in self._query('SELECT tag FROM tags WHERE device = ? ORDER BY tag', (device,))]
+
+    def select(self, patterns='*', tags=None, anyTag=False):
+        '''
+        Names of the devices matching the query, sorted.
+        patterns - glob pattern or list of them, a device matches any of them;
+                   patterns starting with "!" exclude the devices they match
+        tags - devices must have all of these tags, any of them with anyTag
+        '''
+        if isinstance(patterns, str):
+            patterns = [patterns]
+        include = [p for p in patterns if not p.startswith('!')] or ['*']
+        exclude = [p[1:] for p in patterns if p.startswith('!')]
+        sql = 'SELECT name FROM devices WHERE (' + ' OR '.join(['name GLOB ?'] * len(include)) + ')'
+        args = list(include)
+        for pattern in exclude:
+            sql += ' AND NOT name GLOB ?'
+            args.append(pattern)
+        tags = _tags(tags)
+        if tags:
+            sql += ' AND name IN (SELECT device FROM tags WHERE tag IN ({}) GROUP BY device{})'.format(
+                ', '.join('?' * len(tags)), '' if anyTag else f' HAVING COUNT(*) = {len(set(tags))}')
+            args.extend(tags)
+        return [name for name, in self._query(sql + ' ORDER BY name', args)]
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+def useInventory(path, cacheDir=kInventoryCacheDir):
+    '''
+    Open an inventory and make it the fallback of autotest aspects: devices that
+    are not in autotest.aspects are looked up in it (autotest.get_aspect,
+    autotest.device_aspects, ProxySGCLI/ProxySGHTTP by device name).
+    Global aspects of the inventory are set in autotest.aspects.
+    Returns: Inventory
+    '''
+    inventory = Inventory(path, cacheDir)
+    for key, value in inventory.globalAspects.items():
+        autotest.aspects[key] = value
+    autotest.inventory = inventory
+    return inventory
@@ -0,0 +1,127 @@
+'''
+ProxySG advanced-url page parsers
+
+Each parser takes the text of one page and returns all of its data in one
+pass, so callers asking for several items of the same page do not have to
+download and scan it again.
+
+Parsers are registered by name together with their url, ProxySGHTTP.getParsedPage
+fetches, parses and memoizes them:
+    hw = sg.getParsedPage('hardware')
+    print(hw.model, hw.interfaces['0:0'])
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import re
+
+
+class Error(Exception):
+    pass
+
+
+# -- Typed records, fields holds every "name: value" line of the page
+
+PageParser = collections.namedtuple('PageParser', ('name', 'url', 'parse'))
+HardwareInfo = collections.namedtuple('HardwareInfo', ('model', 'interfaces', 'fields'))
+CpuStats = collections.namedtuple('CpuStats', ('cpus', 'fields'))
+HttpStats = collections.namedtuple('HttpStats', ('connectionsAccepted', 'fields'))
+SysinfoVersion = collections.namedtuple('SysinfoVersion', ('version', 'build', 'serialNumber', 'fields'))
+
+pageParsers = {}
+
+_tagRe = re.compile(r'<[^>]+>')
+_fieldRe = re.compile(r'^\s*([^:\r\n]*[^:\s])\s*:\s*(\S[^\r\n]*?)\s*$', re.M)
+_macRe = re.compile(r'Interface\s+(\d+:\d+):.+MAC\s+((?:[a-fA-F0-9]{2}[:|\-]?){6})')
+_percentRe = re.compile(r'^\s*(CPU[^:\r\n]*?)\s*:?\s+(\d+(?:\.\d+)?)\s*%', re.I | re.M)
+
+
+def registerPage(name, url):
+    '''Decorator, register a parser function for the page at url under name'''
+    def register(parse):
+        pageParsers[name] = PageParser(name, url, parse)
+        return parse
+    return register
+
+
+def getPageParser(name):
+    try:
+        return pageParsers[name]
+    except KeyError:
+        raise Error(f'no page parser registered as: {name}')
+
+
+def parseFields(text):
+    '''Every "name: value" line of a page, html tags removed, first occurrence wins'''
+    fields = {}
+    for name, value in _fieldRe.findall(_tagRe.sub(' ', text)):
+        fields.setdefault(name, value)
+    return fields
+
+
+# ------------------------------------------------------------------------------
+
+@registerPage('hardware', '/Diagnostics/Hardware/Info?stats_mode=5')
+def parseHardwareInfo(text):
+    '''Model number and the MAC address of every interface, interfaces keyed by "0:0"'''
+    fields = parseFields(text)
+    m = re.search(r'Model:\s+([0-9]+)', text)
+    return HardwareInfo(m.group(1) if m else None, dict(_macRe.findall(text)), fields)
+
+
+@registerPage('cpu', '/Diagnostics/CPU_Monitor/Statistics')
+def parseCpuStats(text):
+    '''Utilization percent of every "CPU ..." line'''
+    cpus = {name: float(value) for name, value in _percentRe.findall(_tagRe.sub(' ', text))}
+    return CpuStats(cpus, parseFields(text))
+
+
+@registerPage('http', '/HTTP/Statistics')
+def parseHttpStats(text):
+    '''HTTP statistics, as in "show http-stats"'''
+    fields = parseFields(text)
+    accepted = fields.get('Connections accepted')
+    return HttpStats(int(accepted) if accepted and accepted.isdigit() else None, fields)
+
+
+@registerPage('version', '/SYSINFO/Version')
+def parseSysinfoVersion(text):
+    '''SGOS version, release id and serial number'''
+    fields = parseFields(text)
+    version = re.search(r'^\s*Version:\s+SGOS\s+([0-9\.]+)', text, re.I | re.M)
+    build = re.search(r'^\s*Release id:\s+([0-9]+)', text, re.I | re.M)
+    serial = re.search(r'^\s*Serial\snumber:\s+([0-9\-]+)', text, re.I | re.M)
+    return SysinfoVersion(version and version.group(1), build and build.group(1), serial and serial.group(1), fields)
+
+
+@registerPage('cpm', '/adn/show/tunnel/cpm?stats_mode=5')
+def parseConnectionPools(text):
+    '''
+    Parse /adn/show/tunnel/cpm?stats_mode=5 into all connection pools.
+
+    A pool is a heading line followed either directly by its "Total:" line, or
+    by a column heading line, its "CPMR<" lines and the "Total" line.
+    Returns: {pool heading: {'entries': [CPMR lines], 'total': total line or None}}
+             in page order
+    '''
+    pools = {}
+    pending = []        # lines seen since the previous pool ended
+    current = None
+    for line in text.splitlines():
+        if 'CPMR<' in line:
+            if current is None:
+                name = pending[-2].strip() if len(pending) >= 2 else ''
+                current = pools.setdefault(name, {'entries': [], 'total': None})
+            current['entries'].append(line)
+        elif 'Total' in line:
+            if current is None and pending and pending[-1].strip():
+                current = pools.setdefault(pending[-1].strip(), {'entries': [], 'total': None})
+            if current is not None:
+                current['total'] = line
+            current, pending = None, []
+        else:
+            current = None
+            pending.append(line)
+    pools.pop('', None)
+    return pools
@@ -0,0 +1,180 @@
+'''
+ProxySG CPL policy install
+
+Installs a local CPL file with the "inline policy <type> <marker>" command,
+as sgSSL.Config does for keyrings. The policy is streamed in chunks of whole
+lines while the echo is drained, compile warning confirmations are answered,
+and the compile result is parsed into counts and timings. An install is
+skipped when the stored hash shows the device already has the same policy.
+
+Example:
+    installer = sgPolicy.PolicyInstaller(proxysg.ProxySGCLI('proxysg_1'))
+    result = installer.install('/srv/policy/local.cpl')
+    print(result.installed, result.warnings, result.compileSeconds)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+kPolicyHashPath = os.path.join(os.path.expanduser('~'), '.cache', 'proxysg', 'policyhash.json')
+kPolicyTypes = ('local', 'central', 'forward', 'vpm-cpl', 'vpm-xml')
+
+# -- skipped: the stored hash matched, nothing was sent
+# -- sendSeconds: streaming the policy, compileSeconds: end marker to prompt
+# -- deviceCompileSeconds: compile time reported by the device, None when not reported
+PolicyResult = collections.namedtuple('PolicyResult', (
+    'device', 'policyType', 'sha', 'installed', 'skipped', 'lines', 'size', 'sendSeconds', 'compileSeconds',
+    'deviceCompileSeconds', 'warnings', 'errors', 'output'))
+
+_warningRe = re.compile(r'^\s*Warning\b.*$', re.I | re.M)
+_errorRe = re.compile(r'^\s*(?:Error\b|%).*$', re.I | re.M)
+_countRe = re.compile(r'(\d+)\s+(warning|error)s?\b', re.I)
+_compileTimeRe = re.compile(r'compil\w*[^\n]*?(\d+(?:\.\d+)?)\s*(ms|milliseconds?|s|sec|seconds?)\b', re.I)
+
+
+class PolicyHashes:
+    '''Hash of the last policy installed per device and policy type, kept in a JSON file'''
+
+    def __init__(self, path=kPolicyHashPath):
+        self.path = path
+        self._lock = threading.Lock()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def get(self, device, policyType):
+        return self._load().get(f'{device}/{policyType}')
+
+    def put(self, device, policyType, sha):
+        '''Store the hash, a private temporary file per writer; failures are only logged, the policy is installed'''
+        with self._lock:
+            hashes = self._load()
+            hashes[f'{device}/{policyType}'] = sha
+            tmp = None
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(self.path))
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(hashes, f, indent=1, sort_keys=True)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                autotest.log('debug', f'could not write policy hashes {self.path}: {e}')
+                if tmp and os.path.exists(tmp):
+                    os.remove(tmp)
+
+
+class PolicyInstaller:
+    '''
+    sgcli - ProxySGCLI object
+    hashes - PolicyHashes or path of its file, None disables skipping unchanged policy
+    chunkSize - bytes of whole lines written at once
+    '''
+
+    EOF_MARKER = "EOF1234"
+
+    def __init__(self, sgcli, hashes=kPolicyHashPath, chunkSize=16384):
+        self.sgcli = sgcli
+        self.hashes = PolicyHashes(hashes) if isinstance(hashes, str) else hashes
+        self.chunkSize = chunkSize
+
+    def _device(self):
+        return self.sgcli.aspects.device or self.sgcli.aspects.ipaddr
+
+    def _chunks(self, lines):
+        chunk, size = [], 0
+        for line in lines:
+            chunk.append(line + '\r')
+            size += len(line) + 1
+            if size >= self.chunkSize:
+                yield ''.join(chunk)
+                chunk, size = [], 0
+        if chunk:
+            yield ''.join(chunk)
+
+    def _send(self, data):
+        '''Write to the device; over SSH all of it, reading the echo meanwhile so neither side stalls'''
+        connector = self.sgcli.connector
+        channel = getattr(connector, 'channel', None)
+        if channel is None:
+            connector.write(data)
+            return
+        channel.sendall(data)
+        while channel.recv_ready():
+            channel.recv(65536)
+
+    def install(self, policy, policyType='local', force=False):
+        '''
+        policy - path of a CPL file, or the policy text
+        policyType - one of kPolicyTypes
+        force - install even when the stored hash matches
+        Returns: PolicyResult, raises Error when the device reports compile errors
+        '''
+        if policyType not in kPolicyTypes:
+            raise Error(f'unknown policy type: {policyType}')
+        if '\n' not in policy and os.path.isfile(policy):
+            with open(policy, 'r') as f:
+                policy = f.read()
+        lines = policy.splitlines()
+        sha = hashlib.sha256('\n'.join(lines).encode('utf-8')).hexdigest()
+        device = self._device()
+
+        if not force and self.hashes and self.hashes.get(device, policyType) == sha:
+            autotest.log('info', f'{device}: {policyType} policy unchanged, install skipped')
+            return PolicyResult(device, policyType, sha, False, True, len(lines), len(policy), 0.0, 0.0, None, 0, 0, '')
+
+        marker = self.EOF_MARKER
+        while any(marker in line for line in lines):
+            marker += 'X'
+
+        autotest.log('info', f'{device}: installing {policyType} policy, {len(lines)} lines')
+        self.sgcli.command('', context='CLI_CONFIG')
+        start = time.time()
+        self._send(f'inline policy {policyType} {marker}\r')
+        for chunk in self._chunks(lines):
+            self._send(chunk)
+        sendSeconds = time.time() - start
+
+        start = time.time()
+        output = self.sgcli.command(marker, timeout=max(self.sgcli.commandTimeout, 600), confirmation=1)
+        compileSeconds = time.time() - start
+        output = output[output.rfind(marker) + len(marker):] if marker in output else output
+        output = output.strip()
+
+        reported = collections.Counter()
+        for count, kind in _countRe.findall(output):
+            reported[kind.lower()] = max(reported[kind.lower()], int(count))
+        warnings = max(len(_warningRe.findall(output)), reported['warning'])
+        errors = _errorRe.findall(output)
+        if reported['error'] and not errors:
+            errors = [f'device reported {reported["error"]} errors']
+        m = _compileTimeRe.search(output)
+        deviceCompileSeconds = None
+        if m:
+            deviceCompileSeconds = float(m.group(1)) / (1000.0 if m.group(2).lower().startswith('m') else 1.0)
+        autotest.log('info', f'{device}: {policyType} policy sent in {sendSeconds:.1f}s, compiled in '
+                     f'{compileSeconds:.1f}s, {warnings} warnings, {len(errors)} errors')
+        if errors:
+            raise Error(f'{device}: {policyType} policy install failed:\n' + '\n'.join(errors))
+        if self.hashes:
+            self.hashes.put(device, policyType, sha)
+        return PolicyResult(device, policyType, sha, True, False, len(lines), len(policy), sendSeconds, compileSeconds,
+                            deviceCompileSeconds, warnings, 0, output)
@@ -0,0 +1,258 @@
+'''
+ProxySG metrics poller
+
+Samples HTTP statistics, CPU monitor and TCP connection counts from many
+devices at a fixed interval and appends value, delta and rate per metric to
+a memory-mapped ring buffer file that dashboards can read while it is written.
+Rates are per second and only kept for counters (kCounterMetrics), gauges such
+as CPU or the connection count have a rate of 0.
+
+Example:
+    poller = sgPoller.MetricsPoller(['proxysg_1', 'proxysg_2'], '/var/tmp/sg.ts', interval=60)
+    poller.start()
+    ...
+    poller.stop()
+    for sample in sgPoller.TimeSeriesFile('/var/tmp/sg.ts').read(metric='tcp.connections'):
+        print(sample)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import concurrent.futures
+import json
+import mmap
+import os
+import sched
+import struct
+import tempfile
+import threading
+import time
+
+import autotest
+import proxysg
+
+
+class Error(Exception):
+    pass
+
+
+Sample = collections.namedtuple('Sample', ('timestamp', 'device', 'metric', 'value', 'delta', 'rate'))
+
+
+class TimeSeriesFile:
+    '''
+    Fixed size ring buffer of samples in a memory-mapped file.
+
+    Header: magic, version, capacity, number of samples ever written.
+    Record: timestamp, device number, metric number, value, delta, rate.
+    Device and metric names are kept in a small JSON file next to it (path + ".names").
+    Once capacity samples are written the oldest ones are overwritten.
+    '''
+
+    MAGIC = b'SGTS'
+    VERSION = 1
+    _header = struct.Struct('<4sIQQ8x')             # 32 bytes
+    _record = struct.Struct('<dHH4xddd')            # 40 bytes
+
+    def __init__(self, path, capacity=100000):
+        self.path = path
+        self._lock = threading.Lock()
+        size = self._header.size + capacity * self._record.size
+        exists = os.path.exists(path) and os.path.getsize(path) >= self._header.size
+        self._file = open(path, 'r+b' if exists else 'w+b')
+        if not exists:
+            self._file.write(self._header.pack(self.MAGIC, self.VERSION, capacity, 0))
+            self._file.truncate(size)
+            self._file.flush()
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        magic, version, self.capacity, self.count = self._header.unpack_from(self._map, 0)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise Error(f'not a time series file: {path}')
+        self._names = {'devices': [], 'metrics': []}
+        if os.path.exists(path + '.names'):
+            with open(path + '.names') as f:
+                self._names = json.load(f)
+
+    def _index(self, kind, name):
+        names = self._names[kind]
+        if name not in names:
+            names.append(name)
+            # -- a private temporary file per writer, readers only ever see a complete names file
+            fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(os.path.abspath(self.path)))
+            try:
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(self._names, f)
+                os.replace(tmp, self.path + '.names')
+            except OSError:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        return names.index(name)
+
+    def append(self, timestamp, device, metric, value, delta=0.0, rate=0.0):
+        '''Add one sample, device and metric are names'''
+        with self._lock:
+            offset = self._header.size + (self.count % self.capacity) * self._record.size
+            self._record.pack_into(self._map, offset, timestamp, self._index('devices', device),
+                                   self._index('metrics', metric), value, delta, rate)
+            self.count += 1
+            self._header.pack_into(self._map, 0, self.MAGIC, self.VERSION, self.capacity, self.count)
+
+    def read(self, device=None, metric=None, since=None):
+        '''
+        Samples still in the ring, oldest first
+        device, metric - only samples of that name
+        since - only samples with a timestamp after since
+        Returns: list of Sample
+        '''
+        with self._lock:
+            self.count = self._header.unpack_from(self._map, 0)[3]
+            if os.path.exists(self.path + '.names'):           # names added by another writer
+                with open(self.path + '.names') as f:
+                    self._names = json.load(f)
+            first = max(0, self.count - self.capacity)
+            samples = []
+            for n in range(first, self.count):
+                offset = self._header.size + (n % self.capacity) * self._record.size
+                timestamp, dev, met, value, delta, rate = self._record.unpack_from(self._map, offset)
+                samples.append(Sample(timestamp, self._names['devices'][dev], self._names['metrics'][met], value, delta, rate))
+        return [s for s in samples
+                if (device is None or s.device == device) and (metric is None or s.metric == metric)
+                and (since is None or s.timestamp > since)]
+
+    def flush(self):
+        self._map.flush()
+
+    def close(self):
+        self._map.flush()
+        self._map.close()
+        self._file.close()
+
+
+# ------------------------------------------------------------------------------
+
+def sampleHttpStats(sg):
+    return {'http.connectionsAccepted': sg.getParsedPage('http', maxAge=0).connectionsAccepted}
+
+
+def sampleCpu(sg):
+    return {'cpu.' + name.replace(' ', ''): value for name, value in sg.getParsedPage('cpu', maxAge=0).cpus.items()}
+
+
+def sampleTcpConnections(sg):
+    return {'tcp.connections': sum(1 for con in sg.iterTcpConnections())}
+
+
+defaultSamplers = (sampleHttpStats, sampleCpu, sampleTcpConnections)
+
+# -- metrics that only grow, everything else is a gauge
+kCounterMetrics = frozenset(('http.connectionsAccepted',))
+
+
+class MetricsPoller:
+    '''
+    Poll many devices from one scheduler thread, sampling devices in parallel.
+
+    devices - list of ProxySGHTTP objects or autotest device names, stop() closes the ones created from names
+    path - time series file, see TimeSeriesFile
+    interval - seconds between polls, polls are aligned to the start time and do not drift
+    samplers - functions sg -> {metric: value}, defaults to HTTP stats, CPU and TCP connection count
+    counters - metric names that are counters and get a rate, see kCounterMetrics
+    maxWorkers - devices sampled at once
+    '''
+
+    def __init__(self, devices, path, interval=60, samplers=defaultSamplers, maxWorkers=8, capacity=100000,
+                 counters=kCounterMetrics):
+        self.devices = [proxysg.ProxySGHTTP(d) if isinstance(d, str) else d for d in devices]
+        self._created = [sg for sg, d in zip(self.devices, devices) if isinstance(d, str)]
+        self.series = TimeSeriesFile(path, capacity)
+        self.interval = interval
+        self.samplers = samplers
+        self.counters = frozenset(counters)
+        self.maxWorkers = maxWorkers
+        self._previous = {}         # (device, metric): (timestamp, value)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()       # scheduling against stop()
+        self._thread = None
+        self._scheduler = sched.scheduler(time.monotonic, self._stop.wait)
+
+    def _name(self, sg):
+        return sg.device or sg.aspects.ipaddr
+
+    def _sampleDevice(self, sg):
+        values = {}
+        for sampler in self.samplers:
+            try:
+                values.update(sampler(sg))
+            except Exception as e:
+                autotest.log('error', f'{self._name(sg)}: {sampler.__name__} failed: {e}')
+        return time.time(), values
+
+    def poll(self):
+        '''Sample every device once and append to the time series'''
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            futures = {executor.submit(self._sampleDevice, sg): self._name(sg) for sg in self.devices}
+            for future in concurrent.futures.as_completed(futures):
+                device = futures[future]
+                timestamp, values = future.result()
+                for metric, value in values.items():
+                    if value is None:
+                        continue
+                    delta, rate = 0.0, 0.0
+                    previous = self._previous.get((device, metric))
+                    if previous:
+                        delta = value - previous[1]
+                        # -- a counter going down was reset, e.g. by a restart
+                        if metric in self.counters and delta >= 0 and timestamp > previous[0]:
+                            rate = delta / (timestamp - previous[0])
+                    self._previous[(device, metric)] = (timestamp, value)
+                    self.series.append(timestamp, device, metric, value, delta, rate)
+        self.series.flush()
+
+    def _tick(self, due, remaining):
+        if self._stop.is_set():
+            return
+        self.poll()
+        if remaining is not None:
+            remaining -= 1
+            if remaining <= 0:
+                return
+        due += self.interval
+        while due < time.monotonic():       # a poll overran, skip missed slots
+            due += self.interval
+        with self._lock:
+            if not self._stop.is_set():
+                self._scheduler.enterabs(due, 0, self._tick, (due, remaining))
+
+    def run(self, count=None):
+        '''Poll every interval until stop() is called, or count polls are done'''
+        self._stop.clear()
+        now = time.monotonic()
+        self._scheduler.enterabs(now, 0, self._tick, (now, count))
+        # -- not sched.run(): once stopped, _stop.wait returns at once and it would spin until the next event
+        while not self._stop.is_set():
+            deadline = self._scheduler.run(blocking=False)
+            if deadline is None:
+                break
+            self._stop.wait(deadline)
+
+    def start(self):
+        '''Run the poller in a background thread'''
+        self._thread = threading.Thread(target=self.run, name='sgPoller', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        with self._lock:
+            self._stop.set()
+            for event in self._scheduler.queue:
+                try:
+                    self._scheduler.cancel(event)
+                except ValueError:        # already running
+                    pass
+        if self._thread:
+            self._thread.join()
+        self.series.close()
+        for sg in self._created:
+            sg.close()
+        self._created = []
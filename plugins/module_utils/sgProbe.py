@@ -0,0 +1,241 @@
+'''
+ProxySG reachability probing
+
+In-process replacement for forking ping: a device is reachable when a TCP
+connect to its SSH or management port is answered, accepted or refused.
+ICMP echo is used in addition when the process may open raw sockets.
+Many devices are probed concurrently from one asyncio event loop.
+
+Example:
+    print(sgProbe.probe('10.1.1.1'))
+    results = sgProbe.probeMany(['10.1.1.1', '10.1.1.2'], ports=(22,))
+    elapsed = sgProbe.waitReachable(['10.1.1.1', '10.1.1.2'], timeout=300)
+    print(sgProbe.sshBanner('10.1.1.1'), sgProbe.httpReady('10.1.1.1', 8082))
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import asyncio
+import collections
+import os
+import socket
+import ssl
+import struct
+import time
+
+
+class Error(Exception):
+    pass
+
+
+kProbePorts = (22, 8082)
+
+# -- reachable: host answered, port: the port that answered (None for ICMP),
+# -- open: port accepted the connection, elapsed: seconds the probe took
+ProbeResult = collections.namedtuple('ProbeResult', ('host', 'reachable', 'port', 'open', 'elapsed', 'error'))
+
+
+def _icmpChecksum(data):
+    if len(data) % 2:
+        data += b'\0'
+    total = sum(struct.unpack(f'!{len(data) // 2}H', data))
+    total = (total >> 16) + (total & 0xffff)
+    total += total >> 16
+    return ~total & 0xffff
+
+
+def icmpAvailable():
+    '''True when this process may send ICMP echo requests (root or CAP_NET_RAW)'''
+    try:
+        socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP).close()
+        return True
+    except (PermissionError, OSError):
+        return False
+
+
+async def icmpProbe(host, timeout=2):
+    '''One ICMP echo, True when a reply arrives within timeout. Needs a raw socket.'''
+    loop = asyncio.get_running_loop()
+    ident = (os.getpid() ^ id(host)) & 0xffff
+    header = struct.pack('!BBHHH', 8, 0, 0, ident, 1)
+    payload = struct.pack('!d', time.time())
+    packet = struct.pack('!BBHHH', 8, 0, _icmpChecksum(header + payload), ident, 1) + payload
+    addr = (await loop.getaddrinfo(host, None, family=socket.AF_INET))[0][4][0]
+    with socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_ICMP) as sock:
+        sock.setblocking(False)
+        await loop.sock_sendto(sock, packet, (addr, 0))
+        deadline = loop.time() + timeout
+        while True:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                return False
+            try:
+                data, peer = await asyncio.wait_for(loop.sock_recvfrom(sock, 1024), remaining)
+            except asyncio.TimeoutError:
+                return False
+            ihl = (data[0] & 0x0f) * 4
+            icmpType, _, _, replyIdent, _ = struct.unpack('!BBHHH', data[ihl:ihl + 8])
+            if peer[0] == addr and icmpType == 0 and replyIdent == ident:
+                return True
+
+
+async def tcpProbe(host, port, timeout=2):
+    '''
+    One TCP connect.
+    Returns: (reachable, open, error), a refused connection is reachable but not open
+    '''
+    try:
+        _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except ConnectionRefusedError as e:
+        return True, False, e
+    except (asyncio.TimeoutError, OSError) as e:
+        return False, False, e
+    writer.close()
+    try:
+        await writer.wait_closed()
+    except OSError:
+        pass
+    return True, True, None
+
+
+async def readSshBanner(host, port=22, timeout=5):
+    '''Returns: the "SSH-..." identification line of the server, None when there is none'''
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return None
+    try:
+        line = await asyncio.wait_for(reader.readline(), timeout)
+    except (asyncio.TimeoutError, OSError):
+        line = b''
+    finally:
+        writer.close()
+    line = line.decode('latin-1').strip()
+    return line if line.startswith('SSH-') else None
+
+
+async def httpAnswers(host, port=8082, useTls=True, timeout=5):
+    '''True when the port answers a HEAD request with any HTTP status line'''
+    context = None
+    if useTls:
+        context = ssl.create_default_context()
+        context.check_hostname = False
+        context.verify_mode = ssl.CERT_NONE
+    try:
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port, ssl=context), timeout)
+    except (asyncio.TimeoutError, OSError):
+        return False
+    try:
+        writer.write(f'HEAD / HTTP/1.0\r\nHost: {host}\r\n\r\n'.encode('ascii'))
+        await writer.drain()
+        status = await asyncio.wait_for(reader.readline(), timeout)
+    except (asyncio.TimeoutError, OSError):
+        status = b''
+    finally:
+        writer.close()
+    return status.startswith(b'HTTP/')
+
+
+async def _portProbe(host, port, timeout):
+    return (port,) + await tcpProbe(host, port, timeout)
+
+
+async def _icmpPortProbe(host, timeout):
+    try:
+        reachable = await icmpProbe(host, timeout)
+    except OSError as e:
+        return None, False, False, e
+    return None, reachable, False, None
+
+
+async def probeHost(host, ports=kProbePorts, timeout=2, icmp=False):
+    '''
+    Probe all ports (and ICMP) of a host at once.
+    Returns: ProbeResult, as soon as a port accepts, else once every probe has finished
+    '''
+    start = time.monotonic()
+    tasks = [asyncio.ensure_future(_portProbe(host, port, timeout)) for port in ports]
+    if icmp:
+        tasks.append(asyncio.ensure_future(_icmpPortProbe(host, timeout)))
+    result = ProbeResult(host, False, None, False, 0.0, None)
+    try:
+        for task in asyncio.as_completed(tasks):
+            port, reachable, isOpen, error = await task
+            if isOpen or (reachable and not result.reachable):
+                result = ProbeResult(host, True, port, isOpen, 0.0, error)
+            elif not result.reachable:
+                result = result._replace(error=error)
+            if isOpen:
+                break
+    finally:
+        for task in tasks:
+            task.cancel()
+    return result._replace(elapsed=time.monotonic() - start)
+
+
+async def probeManyAsync(hosts, ports=kProbePorts, timeout=2, icmp=False, limit=256):
+    '''Probe hosts concurrently, at most limit hosts at once'''
+    semaphore = asyncio.Semaphore(limit)
+
+    async def bounded(host):
+        async with semaphore:
+            return await probeHost(host, ports, timeout, icmp)
+
+    return dict(zip(hosts, await asyncio.gather(*(bounded(h) for h in hosts))))
+
+
+async def waitReachableAsync(hosts, timeout=300, interval=2, ports=kProbePorts, probeTimeout=2, icmp=False,
+                             requireOpen=False):
+    '''
+    Probe every host each interval until it answers or timeout seconds have passed.
+    requireOpen - a refused port does not count, a port has to accept connections
+    Returns: {host: seconds until it answered, None if it never did}
+    '''
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    waiting = list(hosts)
+    elapsed = dict.fromkeys(waiting)
+    while waiting:
+        roundStart = loop.time()
+        results = await probeManyAsync(waiting, ports, probeTimeout, icmp)
+        for host, result in results.items():
+            if result.open or (result.reachable and not requireOpen):
+                elapsed[host] = loop.time() - start
+        waiting = [h for h in waiting if elapsed[h] is None]
+        if not waiting or loop.time() - start >= timeout:
+            break
+        await asyncio.sleep(max(0, min(interval - (loop.time() - roundStart), timeout - (loop.time() - start))))
+    return elapsed
+
+
+# -- Blocking wrappers, each runs its own event loop
+
+def probe(host, ports=kProbePorts, timeout=2, icmp=False):
+    '''Returns: ProbeResult of one host'''
+    return asyncio.run(probeHost(host, ports, timeout, icmp))
+
+
+def sshBanner(host, port=22, timeout=5):
+    return asyncio.run(readSshBanner(host, port, timeout))
+
+
+def httpReady(host, port=8082, useTls=True, timeout=5):
+    return asyncio.run(httpAnswers(host, port, useTls, timeout))
+
+
+def backoff(initial=1, factor=2, maximum=15):
+    '''Exponential delays: initial, initial * factor, ... capped at maximum'''
+    delay = initial
+    while True:
+        yield delay
+        delay = min(delay * factor, maximum)
+
+
+def probeMany(hosts, ports=kProbePorts, timeout=2, icmp=False, limit=256):
+    '''Returns: {host: ProbeResult}'''
+    return asyncio.run(probeManyAsync(list(hosts), ports, timeout, icmp, limit))
+
+
+def waitReachable(hosts, timeout=300, interval=2, ports=kProbePorts, probeTimeout=2, icmp=False, requireOpen=False):
+    '''Returns: {host: seconds until it answered, None if it never did}, see waitReachableAsync'''
+    return asyncio.run(waitReachableAsync(list(hosts), timeout, interval, ports, probeTimeout, icmp, requireOpen))
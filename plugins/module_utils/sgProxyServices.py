@@ -29,6 +29,7 @@ class SgProxyServices:
 
     serviceConfigRE = re.compile(r"(?im)(\w.+\:)\s+(.+)\s*$")
     serviceActionRE3 = re.compile(r"(?im)((?:<\w+>)|(?:\d+\.\d+\.\d+\.\d+)|(?:\d+\.\d+\.\d+\.\d+/\d+))\s+(\d+)\s+(\w+)\s*$")
+    httpConnectionsRE = re.compile(r"(?im)Connections accepted\s*:\s*(\S+)")
 
     def __init__(self, sgcli):
         '''link SG command routine'''
@@ -201,12 +202,11 @@ class SgProxyServices:
         Returns: number of http connections
         '''
         retVal = self.command("show http-stats", context='CLI_ENABLE')
-        alist = retVal.split("\n")
-        for line in alist:
-            if "Connections accepted" in line:
-                noHttpConnections = line.split(":")[1].strip()
-                autotest.log('debug', "noHttpConnections: " + noHttpConnections)
-                break
+        match = self.httpConnectionsRE.search(retVal)
+        if not match:
+            raise Error("'Connections accepted' not found in 'show http-stats' output")
+        noHttpConnections = match.group(1)
+        autotest.log('debug', "noHttpConnections: " + noHttpConnections)
         return noHttpConnections
 
     def createProxyService(self, proxyType, proxyName):
@@ -0,0 +1,148 @@
+'''
+ProxySG rolling fleet upgrade
+
+Upgrades devices in waves. Devices of one wave load the image, restart and
+are verified concurrently; the next wave only starts when the health gate
+passes, and the rollout halts once too many devices have failed.
+
+Example:
+    devices = [proxysg.ProxySGCLI(d) for d in ('proxysg_1', 'proxysg_2', 'proxysg_3')]
+    rollout = sgRollout.RollingUpgrade(devices, '123456', batchPercent=25, maxFailureRate=0.1)
+    for report in rollout.run():
+        print(report)
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import concurrent.futures
+import math
+import time
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+# -- status: upgraded, current (already running the build), failed, skipped (rollout halted)
+DeviceReport = collections.namedtuple('DeviceReport', (
+    'device', 'wave', 'status', 'error', 'loadSeconds', 'rebootSeconds', 'verifySeconds', 'version', 'build'))
+
+
+class RollingUpgrade:
+    '''
+    devices - list of ProxySGCLI objects
+    build - build number to upgrade to
+    type - image type, see ProxySGCLI.loadImage
+    batchSize - devices per wave, or
+    batchPercent - percent of the fleet per wave (default 10)
+    maxFailureRate - halt when failed / attempted devices exceeds this fraction
+    rebootTimeout - seconds a device may take after restart until its CLI is usable
+    distributor - optional sgImages.ImageDistributor, the build is staged once
+                  and every device loads it from the control node
+    healthCheck - optional function sg -> bool run on every upgraded device,
+                  a False or an exception counts as a failed device
+    '''
+
+    def __init__(self, devices, build, type='system.bcsi', batchSize=None, batchPercent=10, maxFailureRate=0.1,
+                 rebootTimeout=300, distributor=None, healthCheck=None):
+        self.devices = list(devices)
+        self.build = str(build)
+        self.type = type
+        if batchSize is None:
+            batchSize = max(1, int(math.ceil(len(self.devices) * batchPercent / 100.0)))
+        self.batchSize = batchSize
+        self.maxFailureRate = maxFailureRate
+        self.rebootTimeout = rebootTimeout
+        self.distributor = distributor
+        self.healthCheck = healthCheck
+        self.reports = []
+        self.halted = False
+        self.haltReason = None
+
+    def waves(self):
+        return [self.devices[i:i + self.batchSize] for i in range(0, len(self.devices), self.batchSize)]
+
+    def _name(self, sg):
+        return sg.aspects.device or sg.aspects.ipaddr
+
+    def _upgradeDevice(self, sg, wave, upgradePaths):
+        timing = {'load': 0.0, 'reboot': 0.0, 'verify': 0.0}
+        version = build = None
+        phase = 'load'
+        try:
+            start = time.time()
+            version, build = sg.getVersionBuild()
+            if str(build) == self.build:
+                timing['load'] = time.time() - start
+                return DeviceReport(self._name(sg), wave, 'current', None, timing['load'], 0.0, 0.0, version, build)
+            sg.loadImage(self.build, self.type, upgradePaths=upgradePaths)
+            timing['load'] = time.time() - start
+
+            phase = 'reboot'
+            start = time.time()
+            sg.command('', context='CLI_ENABLE')
+            sg.command('restart upgrade', context='CLI_EXIT')       # special context as no return prompt
+            sg.waitReady(timeout=self.rebootTimeout, expectDown=True)
+            timing['reboot'] = time.time() - start
+
+            phase = 'verify'
+            start = time.time()
+            version, build = sg.getVersionBuild()
+            if str(build) != self.build:
+                raise Error(f'load build did not match, expected: {self.build}, have: {build}')
+            if self.healthCheck and not self.healthCheck(sg):
+                raise Error('health check failed')
+            timing['verify'] = time.time() - start
+            return DeviceReport(self._name(sg), wave, 'upgraded', None,
+                                timing['load'], timing['reboot'], timing['verify'], version, build)
+        except Exception as e:
+            timing[phase] = time.time() - start
+            autotest.log('error', f'{self._name(sg)}: upgrade failed during {phase}: {e}')
+            return DeviceReport(self._name(sg), wave, 'failed', f'{phase}: {e}',
+                                timing['load'], timing['reboot'], timing['verify'], version, build)
+
+    def failureRate(self):
+        attempted = [r for r in self.reports if r.status != 'skipped']
+        if not attempted:
+            return 0.0
+        return sum(1 for r in attempted if r.status == 'failed') / float(len(attempted))
+
+    def run(self):
+        '''
+        Upgrade all waves, stop early when the failure rate is exceeded.
+        Returns: list of DeviceReport, devices of waves not started are "skipped"
+        '''
+        upgradePaths = self.distributor.stage(self.build, self.type) if self.distributor else None
+        waves = self.waves()
+        for wave, devices in enumerate(waves, 1):
+            if self.halted:
+                self.reports.extend(DeviceReport(self._name(sg), wave, 'skipped', self.haltReason, 0.0, 0.0, 0.0, None, None)
+                                    for sg in devices)
+                continue
+            autotest.log('info', f'upgrade wave {wave}/{len(waves)}: {len(devices)} devices to build {self.build}')
+            with concurrent.futures.ThreadPoolExecutor(max_workers=len(devices)) as executor:
+                futures = [executor.submit(self._upgradeDevice, sg, wave, upgradePaths) for sg in devices]
+                for future in concurrent.futures.as_completed(futures):
+                    report = future.result()
+                    autotest.log('info', f'{report.device}: {report.status} load {report.loadSeconds:.0f}s '
+                                 f'reboot {report.rebootSeconds:.0f}s verify {report.verifySeconds:.0f}s')
+                    self.reports.append(report)
+            rate = self.failureRate()
+            if rate > self.maxFailureRate:
+                self.halted = True
+                self.haltReason = f'failure rate {rate:.0%} over {self.maxFailureRate:.0%} after wave {wave}'
+                autotest.log('error', 'rollout halted: ' + self.haltReason)
+        return self.reports
+
+    def summary(self):
+        '''Per device table of status and phase timings'''
+        lines = [f'{"device":20} {"wave":>4} {"status":9} {"load":>7} {"reboot":>7} {"verify":>7}  build']
+        for r in self.reports:
+            lines.append(f'{str(r.device):20} {r.wave:>4} {r.status:9} {r.loadSeconds:7.1f} {r.rebootSeconds:7.1f} '
+                         f'{r.verifySeconds:7.1f}  {r.build or ""} {r.error or ""}'.rstrip())
+        if self.halted:
+            lines.append('halted: ' + self.haltReason)
+        return '\n'.join(lines)
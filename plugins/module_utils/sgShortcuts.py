@@ -0,0 +1,240 @@
+'''
+ProxySG CLI shortcut definitions
+
+Shortcuts of the XML data file are compiled once: every command of a
+shortcut becomes a format string with positional slots and the names of the
+variables for them, so running a shortcut is a single format per command.
+The compiled definitions are cached on disk, keyed by the XML file's path,
+size and modification time. A cache directory that cannot be written only
+disables the disk cache.
+
+XML layout, as read by node_to_dictionary:
+    <CLI>
+      <vars>...</vars>
+      <Contexts>...</Contexts>
+      <Shortcuts>
+        <setConsolePort>
+          <context>CLI_CONFIG</context>
+          <cmd><output>management-services</output></cmd>
+          <cmd><output>edit HTTPS-Console</output></cmd>
+          <cmd><output>add all {HTTPCONSOLEPORT}</output></cmd>
+        </setConsolePort>
+      </Shortcuts>
+    </CLI>
+
+parseXMLDictionary builds the node_to_dictionary shape from expat events,
+element by element, without holding a DOM of the whole file.
+
+Example:
+    shortcuts = sgShortcuts.loadShortcuts('shortcuts.xml')
+    commands = shortcuts.shortcuts['setConsolePort'].render({'HTTPCONSOLEPORT': 8082})
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import collections
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from xml.parsers import expat
+
+import autotest
+
+
+class Error(Exception):
+    pass
+
+
+kShortcutCacheDir = os.path.join(os.path.expanduser('~'), '.cache', 'proxysg', 'shortcuts')
+kCacheVersion = 1
+
+_varRe = re.compile(r'{([^}]+)}')
+
+ShortcutFile = collections.namedtuple('ShortcutFile', ('vars', 'contexts', 'shortcuts'))
+
+
+class Shortcut(collections.namedtuple('Shortcut', ('name', 'context', 'templates'))):
+    '''
+    context - context of the first command
+    templates - tuple of (format string with {0}, {1}... slots, tuple of variable names)
+    '''
+
+    def variables(self):
+        return sorted({name for template, names in self.templates for name in names})
+
+    def render(self, values):
+        '''Returns: list of commands with the variables filled in from values'''
+        try:
+            return [template.format(*[values[name] for name in names]) for template, names in self.templates]
+        except KeyError as e:
+            raise Error(f'shortcut {self.name} needs variable: {e.args[0]}')
+
+
+def compileTemplate(command):
+    '''"add all {PORT}" -> ("add all {0}", ("PORT",)), other braces are escaped'''
+    names = []
+    parts = []
+    position = 0
+    for m in _varRe.finditer(command):
+        parts.append(command[position:m.start()].replace('{', '{{').replace('}', '}}'))
+        parts.append('{%d}' % len(names))
+        names.append(m.group(1))
+        position = m.end()
+    parts.append(command[position:].replace('{', '{{').replace('}', '}}'))
+    return ''.join(parts), tuple(names)
+
+
+def compileShortcuts(xmlData):
+    '''Compile the dictionary of an XML data file. Returns: ShortcutFile'''
+    cli = xmlData.get('CLI') or {}
+    shortcuts = {}
+    for name, definition in (cli.get('Shortcuts') or {}).items():
+        if not isinstance(definition, dict):
+            continue
+        templates = []
+        ix = 1
+        while f'cmd{ix}' in definition:
+            command = definition[f'cmd{ix}']
+            templates.append(compileTemplate(command['output'] if isinstance(command, dict) else command))
+            ix += 1
+        shortcuts[name] = Shortcut(name, definition.get('context') or None, tuple(templates))
+    return ShortcutFile(cli.get('vars') or {}, cli.get('Contexts') or {}, shortcuts)
+
+
+def parseXMLDictionary(file):
+    '''
+    Streaming equivalent of proxysg.node_to_dictionary(xml.dom.minidom.parse(file)),
+    built from expat events without a DOM of the whole file:
+    - an element with only text becomes its stripped text
+    - an element with any other child node (element, comment, CDATA section or
+      processing instruction) becomes a dictionary of its element children,
+      "cmd" children numbered cmd1, cmd2, ...
+    - an element with multiple="true" becomes a list of its children's
+      dictionaries; the children's own multiple attribute is not looked at
+    file - path or binary file object
+    Raises: xml.parsers.expat.ExpatError, as minidom does
+    '''
+    # -- frame per open element: [name, dictionary, next cmd number, has non-text children, list or None, text]
+    document = [None, {}, 1, True, None, None]
+    stack = [document]
+    inCdata = False
+
+    def start(name, attributes):
+        parent = stack[-1]
+        parent[3] = True
+        multiple = attributes.get('multiple') == 'true' and parent[4] is None
+        stack.append([name, {}, 1, False, [] if multiple else None, []])
+
+    def end(name):
+        _, dic, _, hasChildren, items, text = stack.pop()
+        parent = stack[-1]
+        if parent[4] is not None:               # child of a multiple="true" element
+            parent[4].append(dic)
+        elif items is not None:
+            parent[1][name] = items
+        elif hasChildren:
+            if name == 'cmd':
+                parent[1][f'cmd{parent[2]}'] = dic
+                parent[2] += 1
+            else:
+                parent[1][name] = dic
+        else:
+            parent[1][name] = ''.join(text).strip()
+
+    def characters(data):
+        frame = stack[-1]
+        if inCdata:
+            frame[3] = True
+        elif not frame[3]:
+            frame[5].append(data)
+
+    def otherNode(*args):
+        stack[-1][3] = True
+
+    def cdata(entering):
+        nonlocal inCdata
+        inCdata = entering
+        if entering:
+            stack[-1][3] = True
+
+    parser = expat.ParserCreate()
+    parser.buffer_text = True
+    parser.StartElementHandler = start
+    parser.EndElementHandler = end
+    parser.CharacterDataHandler = characters
+    parser.CommentHandler = otherNode
+    parser.ProcessingInstructionHandler = otherNode
+    parser.StartCdataSectionHandler = lambda: cdata(True)
+    parser.EndCdataSectionHandler = lambda: cdata(False)
+    if isinstance(file, (str, bytes, os.PathLike)):
+        with open(file, 'rb') as f:
+            parser.ParseFile(f)
+    else:
+        parser.ParseFile(file)
+    return document[1]
+
+
+def _cachePath(cacheDir, path):
+    return os.path.join(cacheDir, hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest() + '.json')
+
+
+def _writeCache(cachePath, data):
+    '''Replace the cache file atomically, a private temporary file per writer; failures are only logged'''
+    tmp = None
+    try:
+        os.makedirs(os.path.dirname(cachePath), exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=os.path.dirname(cachePath))
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, cachePath)
+    except OSError as e:
+        autotest.log('debug', f'could not write shortcut cache {cachePath}: {e}')
+        if tmp and os.path.exists(tmp):
+            os.remove(tmp)
+
+
+_loaded = {}
+_loadedLock = threading.Lock()
+
+
+def loadShortcuts(path, loader=parseXMLDictionary, cacheDir=kShortcutCacheDir):
+    '''
+    Compiled shortcuts of an XML data file, from memory or the disk cache while the
+    file is unchanged, otherwise parsed with loader (path -> dictionary) and compiled.
+    cacheDir - None disables the disk cache
+    Returns: ShortcutFile
+    '''
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    with _loadedLock:
+        if key in _loaded:
+            return _loaded[key]
+
+    compiled = None
+    cachePath = _cachePath(cacheDir, path) if cacheDir else None
+    if cachePath and os.path.exists(cachePath):
+        try:
+            with open(cachePath) as f:
+                cached = json.load(f)
+            if cached['version'] == kCacheVersion and cached['size'] == st.st_size and cached['mtime'] == st.st_mtime_ns:
+                compiled = ShortcutFile(cached['vars'], cached['contexts'], {
+                    name: Shortcut(name, s['context'], tuple((t, tuple(n)) for t, n in s['templates']))
+                    for name, s in cached['shortcuts'].items()})
+        except (OSError, ValueError, KeyError, TypeError):
+            compiled = None
+
+    if compiled is None:
+        compiled = compileShortcuts(loader(path))
+        if cachePath:
+            _writeCache(cachePath, {
+                'version': kCacheVersion, 'path': os.path.abspath(path), 'size': st.st_size,
+                'mtime': st.st_mtime_ns, 'vars': compiled.vars, 'contexts': compiled.contexts,
+                'shortcuts': {name: {'context': s.context, 'templates': s.templates}
+                              for name, s in compiled.shortcuts.items()}})
+
+    with _loadedLock:
+        _loaded[key] = compiled
+    return compiled
@@ -0,0 +1,259 @@
+'''
+ProxySG TCP connection table parsing
+
+Parses the /tcp/connections advanced-url output incrementally, so large
+connection tables are never held in memory as one string.
+
+Example:
+    with sg.openPage('/tcp/connections') as response:
+        for con in sgTcpConnections.iterTcpConnections(response.iterChunks()):
+            print(con.state, con.remote)
+
+A columnar TcpSnapshot keeps the whole table in a few arrays for group-by,
+top-N and snapshot to snapshot diffs. It needs numpy, an optional dependency
+of the collection (see requirements.txt); the streaming parser does not:
+    snap = sg.getTcpConnections(columnar=True)
+    print(snap.topN('remoteIp', 10))
+'''
+__author__ = 'Maza'
+__version__ = '1.0'
+
+import re
+import time
+from array import array
+
+try:
+    import numpy as np
+    HAS_NUMPY = True
+except ImportError:
+    HAS_NUMPY = False
+
+
+class Error(Exception):
+    pass
+
+
+# -- proto, recv-q, send-q, local address, remote address, state, rest of line
+_conRe = re.compile(r"(\w+)\s+(\d+)\s+(\d+)\s+((?:\d+\.\d+\.\d+\.\d+\.\d+)|(?:\*\.\d+))\s+((?:\d+\.\d+\.\d+\.\d+.\d+)|(?:\*\.\*))\s+(\w+)\s+(\w.*$)", re.I)
+
+
+class TcpConnection:
+    '''One row of the connection table'''
+
+    __slots__ = ('proto', 'recvQ', 'sendQ', 'local', 'remote', 'state', 'extra')
+
+    def __init__(self, proto, recvQ, sendQ, local, remote, state, extra):
+        self.proto = proto
+        self.recvQ = recvQ
+        self.sendQ = sendQ
+        self.local = local
+        self.remote = remote
+        self.state = state
+        self.extra = extra
+
+    def astuple(self):
+        '''Same tuple of strings as the original regex findall on the page'''
+        return (self.proto, str(self.recvQ), str(self.sendQ), self.local, self.remote, self.state, self.extra)
+
+    def __repr__(self):
+        return f'TcpConnection{self.astuple()!r}'
+
+
+def parseTcpConnectionLine(line):
+    '''Return a TcpConnection for one line of output, None when the line is not a connection'''
+    m = _conRe.search(line.rstrip('\r'))
+    if not m:
+        return None
+    proto, recvQ, sendQ, local, remote, state, extra = m.groups()
+    return TcpConnection(proto, int(recvQ), int(sendQ), local, remote, state, extra)
+
+
+def iterTcpConnections(chunks, encoding='latin-1'):
+    '''
+    Parse connection table output as it arrives.
+    chunks - iterable of str or bytes pieces of the page, split anywhere
+    Yields: TcpConnection records
+    '''
+    tail = ''
+    for chunk in chunks:
+        if isinstance(chunk, bytes):
+            chunk = chunk.decode(encoding)
+        lines = (tail + chunk).split('\n')
+        tail = lines.pop()
+        for line in lines:
+            con = parseTcpConnectionLine(line)
+            if con is not None:
+                yield con
+    if tail:
+        con = parseTcpConnectionLine(tail)
+        if con is not None:
+            yield con
+
+
+# ------------------------------------------------------------------------------
+
+def encodeEndpoint(endpoint):
+    '''
+    Encode "a.b.c.d.port", "*.port" or "*.*" as (ip, port) integers.
+    A wildcard address is 0, a wildcard port is -1.
+    '''
+    addr, _, port = endpoint.rpartition('.')
+    ip = 0
+    if addr != '*':
+        for octet in addr.split('.'):
+            ip = (ip << 8) | int(octet)
+    return ip, -1 if port == '*' else int(port)
+
+
+def decodeIp(ip):
+    '''Dotted quad for an encoded address, "*" for the wildcard'''
+    ip = int(ip)
+    if ip == 0:
+        return '*'
+    return '.'.join(str((ip >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
+
+class TcpSnapshot:
+    '''
+    Connection table held as numpy columns.
+
+    Columns: localIp, remoteIp (uint32), localPort, remotePort (int32, -1 for "*"),
+    recvQ, sendQ (int64) and state (uint8 code into self.states).
+    '''
+
+    columns = ('localIp', 'localPort', 'remoteIp', 'remotePort', 'recvQ', 'sendQ', 'state')
+    _ipColumns = ('localIp', 'remoteIp')
+
+    def __init__(self, timestamp, states, **columns):
+        if not HAS_NUMPY:
+            raise Error('TcpSnapshot requires numpy')
+        self.timestamp = timestamp
+        self.states = list(states)
+        for name in self.columns:
+            setattr(self, name, columns[name])
+
+    @classmethod
+    def fromRecords(cls, records, timestamp=None):
+        '''Build a snapshot from TcpConnection records, e.g. ProxySGHTTP.iterTcpConnections()'''
+        if not HAS_NUMPY:
+            raise Error('TcpSnapshot requires numpy')
+        timestamp = time.time() if timestamp is None else timestamp
+        states = {}
+        cols = {'localIp': array('L'), 'localPort': array('l'), 'remoteIp': array('L'), 'remotePort': array('l'),
+                'recvQ': array('q'), 'sendQ': array('q'), 'state': array('B')}
+        for con in records:
+            lip, lport = encodeEndpoint(con.local)
+            rip, rport = encodeEndpoint(con.remote)
+            cols['localIp'].append(lip)
+            cols['localPort'].append(lport)
+            cols['remoteIp'].append(rip)
+            cols['remotePort'].append(rport)
+            cols['recvQ'].append(con.recvQ)
+            cols['sendQ'].append(con.sendQ)
+            cols['state'].append(states.setdefault(con.state, len(states)))
+        dtypes = {'localIp': np.uint32, 'remoteIp': np.uint32, 'localPort': np.int32, 'remotePort': np.int32,
+                  'recvQ': np.int64, 'sendQ': np.int64, 'state': np.uint8}
+        columns = {name: np.asarray(col, dtype=dtypes[name]) for name, col in cols.items()}
+        return cls(timestamp, states, **columns)
+
+    def __len__(self):
+        return len(self.state)
+
+    def _decode(self, column, value):
+        if column in self._ipColumns:
+            return decodeIp(value)
+        if column == 'state':
+            return self.states[int(value)]
+        return int(value)
+
+    def _take(self, mask):
+        return TcpSnapshot(self.timestamp, self.states, **{name: getattr(self, name)[mask] for name in self.columns})
+
+    def select(self, state=None, **equals):
+        '''
+        Rows matching all conditions, e.g. select(state='ESTABLISHED', remotePort=443)
+        Returns: TcpSnapshot
+        '''
+        mask = np.ones(len(self), dtype=bool)
+        if state is not None:
+            if state not in self.states:
+                return self._take(np.zeros(len(self), dtype=bool))
+            mask &= self.state == self.states.index(state)
+        for column, value in equals.items():
+            if column in self._ipColumns and isinstance(value, str):
+                value = encodeEndpoint(value + '.0')[0]
+            mask &= getattr(self, column) == value
+        return self._take(mask)
+
+    def groupBy(self, *columns, weight=None):
+        '''
+        Group rows by one or more columns.
+        weight - None to count rows, or "recvQ"/"sendQ" to sum queue sizes
+        Returns: list of (key tuple, amount), keys decoded (addresses dotted, states named)
+        '''
+        if not columns:
+            raise Error('groupBy needs at least one column')
+        if len(self) == 0:
+            return []
+        keys = np.rec.fromarrays([getattr(self, c) for c in columns], names=list(columns))
+        unique, inverse = np.unique(keys, return_inverse=True)
+        weights = None if weight is None else getattr(self, weight)
+        amounts = np.bincount(inverse.ravel(), weights=weights, minlength=len(unique))
+        return [(tuple(self._decode(c, row[c]) for c in columns), amount.item())
+                for row, amount in zip(unique, amounts)]
+
+    def topN(self, column, n=10, weight=None):
+        '''
+        Largest groups of one column, e.g. topN("remoteIp", 10) or topN("localPort", 5, weight="sendQ")
+        Returns: list of (value, amount) sorted by amount, largest first
+        '''
+        if len(self) == 0:
+            return []
+        values = getattr(self, column)
+        unique, inverse = np.unique(values, return_inverse=True)
+        weights = None if weight is None else getattr(self, weight)
+        amounts = np.bincount(inverse.ravel(), weights=weights, minlength=len(unique))
+        # -- stable sort on the negated amounts: ties stay in value order
+        order = np.argsort(-amounts, kind='stable')[:n]
+        return [(self._decode(column, unique[i]), amounts[i].item()) for i in order]
+
+    def countBy(self, column):
+        '''Row count for every value of a column, largest first'''
+        return self.topN(column, n=None)
+
+    @staticmethod
+    def _endpointKeys(ip, port):
+        # -- 17 bit port field: the wildcard port -1 gets 0x10000, clear of real port 65535
+        port = np.where(port < 0, 0x10000, port).astype(np.uint64)
+        return (ip.astype(np.uint64) << np.uint64(17)) | port
+
+    def _connectionKeys(self):
+        '''Unique per connection: (local ip:port, remote ip:port) packed into two uint64'''
+        local = self._endpointKeys(self.localIp, self.localPort)
+        remote = self._endpointKeys(self.remoteIp, self.remotePort)
+        return np.rec.fromarrays([local, remote], names=['local', 'remote'])
+
+    def diff(self, older):
+        '''
+        Compare with an earlier snapshot of the same device.
+        Returns: dict with
+            elapsed - seconds between the snapshots
+            opened  - TcpSnapshot of connections only in this snapshot
+            closed  - TcpSnapshot of connections only in the older snapshot
+            states  - {state: (older count, newer count, delta)}
+        '''
+        newKeys, oldKeys = self._connectionKeys(), older._connectionKeys()
+        opened = ~np.isin(newKeys, oldKeys)
+        closed = ~np.isin(oldKeys, newKeys)
+        newCounts = dict((k[0], v) for k, v in self.groupBy('state'))
+        oldCounts = dict((k[0], v) for k, v in older.groupBy('state'))
+        states = {}
+        for state in list(oldCounts) + [s for s in newCounts if s not in oldCounts]:
+            before, after = oldCounts.get(state, 0), newCounts.get(state, 0)
+            states[state] = (before, after, after - before)
+        return {
+            'elapsed': self.timestamp - older.timestamp,
+            'opened': self._take(opened),
+            'closed': older._take(closed),
+            'states': states,
+        }
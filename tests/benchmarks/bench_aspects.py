@@ -0,0 +1,98 @@
+'''
+DotDict and device views (autotest.AspectsView) against the earlier DotDict,
+which split every dotted key on each access and copied each device's aspects
+per connection. An inventory of devices x keys aspects is set, read as
+"device.key", tested for and read through a per-connection device view.
+
+Usage:
+    python tests/benchmarks/bench_aspects.py [--devices N] [--keys N] [--repeat N]
+'''
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'plugins', 'module_utils'))
+
+import autotest         # noqa: E402
+
+
+class SplitDotDict(dict):
+    '''DotDict as it was: the dotted key is split on every access'''
+
+    def __setitem__(self, key, value):
+        if '.' in key:
+            key1, key_rest = key.split('.', 1)
+            if key1 not in self or not isinstance(self[key1], SplitDotDict):
+                self[key1] = SplitDotDict()
+            self[key1][key_rest] = value
+        else:
+            super().__setitem__(key, value)
+
+    def __getitem__(self, key):
+        if '.' in key:
+            key1, key_rest = key.split('.', 1)
+            return self[key1][key_rest]
+        return super().__getitem__(key)
+
+    def __contains__(self, key):
+        if '.' in key:
+            key1, key_rest = key.split('.', 1)
+            return key1 in self and key_rest in self[key1]
+        return super().__contains__(key)
+
+
+def splitView(store, device):
+    view = SplitDotDict()
+    for k, v in store[device].items():
+        view[k] = v
+    return view
+
+
+def cachedView(store, device):
+    return autotest.AspectsView(store[device], {'device': device})
+
+
+def run(cls, view, devices, keys):
+    names = [f'proxysg_{d}.aspect_{k}' for d in range(devices) for k in range(keys)]
+    steps = {}
+    start = time.perf_counter()
+    store = cls()
+    for name in names:
+        store[name] = 'value'
+    steps['set'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in names:
+        store[name]
+    steps['get'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for name in names:
+        name in store
+    steps['contains'] = time.perf_counter() - start
+    start = time.perf_counter()
+    for d in range(devices):
+        v = view(store, f'proxysg_{d}')
+        v['aspect_0']
+        v['aspect_1']
+    steps['views'] = time.perf_counter() - start
+    return steps
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark aspects lookups and device views')
+    parser.add_argument('--devices', type=int, default=2000)
+    parser.add_argument('--keys', type=int, default=30)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    print(f'{args.devices} devices x {args.keys} aspects, best of {args.repeat}')
+    for label, cls, view in (('split', SplitDotDict, splitView), ('cached', autotest.DotDict, cachedView)):
+        best = {}
+        for _ in range(args.repeat):
+            for step, seconds in run(cls, view, args.devices, args.keys).items():
+                best[step] = min(best.get(step, seconds), seconds)
+        print(f'{label:8}' + ''.join(f'  {step} {seconds * 1000:7.1f}ms' for step, seconds in best.items()))
+
+
+if __name__ == '__main__':
+    main()
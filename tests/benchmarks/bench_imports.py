@@ -0,0 +1,52 @@
+'''
+Startup cost of module_utils: each module is imported in a fresh interpreter
+with "python -X importtime" and the cumulative import time it reports is kept,
+best of a few runs.
+
+Usage:
+    python tests/benchmarks/bench_imports.py [module ...] [--repeat N]
+Without modules every module in plugins/module_utils is measured.
+'''
+import argparse
+import os
+import subprocess
+import sys
+
+kModuleUtils = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                             '..', '..', 'plugins', 'module_utils'))
+
+
+def importTime(module, repeat):
+    '''Returns: best cumulative import seconds, None when the import failed'''
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, (kModuleUtils, os.environ.get('PYTHONPATH')))))
+    best = None
+    for _ in range(repeat):
+        proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                              cwd=kModuleUtils, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+        if proc.returncode != 0:
+            print(f'import {module} failed: {proc.stderr.strip().splitlines()[-1:]}', file=sys.stderr)
+            return None
+        # -- "import time: self [us] | cumulative | imported package", the module's own line is the last of it
+        for line in proc.stderr.splitlines():
+            fields = line.split('|')
+            if len(fields) == 3 and fields[2].strip() == module:
+                seconds = int(fields[1]) / 1e6
+                best = seconds if best is None else min(best, seconds)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark module_utils import times')
+    parser.add_argument('modules', nargs='*')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    modules = args.modules or sorted(name[:-3] for name in os.listdir(kModuleUtils)
+                                     if name.endswith('.py') and name != '__init__.py')
+    for module in modules:
+        seconds = importTime(module, args.repeat)
+        print(f'{module:20} ' + ('failed' if seconds is None else f'{seconds * 1000:8.1f}ms'))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+'''
+Compare the minidom XML data loader (proxysg.loadXMLDictionary) with the
+streaming one (sgShortcuts.parseXMLDictionary): best time of a few runs and
+peak memory as seen by tracemalloc. Both must build the same dictionary.
+
+Usage:
+    python tests/benchmarks/bench_xml_loaders.py [XML data file] [--shortcuts N] [--repeat N]
+Without a file a synthetic data file with N shortcuts is generated.
+'''
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'plugins', 'module_utils'))
+
+import proxysg           # noqa: E402
+import sgShortcuts       # noqa: E402
+
+
+def writeSyntheticFile(path, shortcuts):
+    with open(path, 'w') as f:
+        f.write('<CLI>\n  <vars><HTTPCONSOLEPORT>8082</HTTPCONSOLEPORT></vars>\n')
+        f.write('  <Contexts multiple="true"><c><name>CLI_CONFIG</name></c></Contexts>\n  <Shortcuts>\n')
+        for n in range(shortcuts):
+            f.write(f'    <shortcut{n}>\n      <!-- shortcut {n} -->\n      <context>CLI_CONFIG</context>\n')
+            for c in range(5):
+                f.write(f'      <cmd><output>command {c} of {n} {{HTTPCONSOLEPORT}}</output></cmd>\n')
+            f.write(f'    </shortcut{n}>\n')
+        f.write('  </Shortcuts>\n</CLI>\n')
+
+
+def measure(loader, path, repeat):
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        data = loader(path)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    tracemalloc.start()
+    loader(path)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return data, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the XML data file loaders')
+    parser.add_argument('file', nargs='?')
+    parser.add_argument('--shortcuts', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    path = args.file
+    if path is None:
+        fd, path = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        writeSyntheticFile(path, args.shortcuts)
+    try:
+        print(f'{path}: {os.path.getsize(path)} bytes')
+        results = {}
+        for name, loader in (('minidom', proxysg.loadXMLDictionary), ('expat', sgShortcuts.parseXMLDictionary)):
+            results[name] = measure(loader, path, args.repeat)
+            print(f'{name:8} {results[name][1]:8.3f}s  peak {results[name][2] / 1e6:8.1f} MB')
+        if results['minidom'][0] != results['expat'][0]:
+            print('loaders built different dictionaries')
+            return 1
+    finally:
+        if args.file is None:
+            os.remove(path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
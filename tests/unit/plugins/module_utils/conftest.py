@@ -0,0 +1,5 @@
+import os
+import sys
+
+# -- the module utils import each other by bare name, as on the control node
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', '..', '..', 'plugins', 'module_utils')))
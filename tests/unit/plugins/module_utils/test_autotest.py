@@ -0,0 +1,62 @@
+import copy
+import json
+import os
+import pickle
+
+import autotest
+
+
+def test_find_paths_skips_unreadable_directories(tmp_path, monkeypatch):
+    (tmp_path / 'lib').mkdir()
+    (tmp_path / 'data').mkdir()
+    root = tmp_path / 'private' / 'tests'
+    root.mkdir(parents=True)
+    scandir = os.scandir
+
+    def traverseOnly(path):
+        if path == str(tmp_path / 'private'):
+            raise PermissionError(13, 'Permission denied', path)
+        return scandir(path)
+
+    monkeypatch.setattr(os, 'scandir', traverseOnly)
+    autotest.find_paths.cache_clear()
+    libs, data, tools = autotest.find_paths(str(root))
+    autotest.find_paths.cache_clear()
+    assert str(tmp_path / 'lib') in libs
+    assert data[:2] == (str(root), str(tmp_path / 'data'))
+
+
+def _view():
+    base = autotest.DotDict({'ipaddr': '10.0.0.1', 'http': {'port': 8080}})
+    view = autotest.AspectsView(base, {'username': 'admin'})
+    view['http.port'] = 8081
+    del view['ipaddr']
+    return base, view
+
+
+def test_view_copy_keeps_writes_private():
+    base, view = _view()
+    clone = copy.copy(view)
+    clone['http.port'] = 1
+    assert view['http.port'] == 8081
+    assert clone.username == 'admin'
+    assert 'ipaddr' not in clone
+    assert base['http.port'] == 8080
+
+
+def test_view_pickle_and_deepcopy():
+    base, view = _view()
+    for clone in (pickle.loads(pickle.dumps(view)), copy.deepcopy(view)):
+        assert dict(clone.items()) == {'username': 'admin', 'http': {'port': 8081}}
+        assert 'ipaddr' not in clone
+
+
+def test_view_private_names_are_not_aspects():
+    base, view = _view()
+    assert view.ipaddr is None
+    assert not hasattr(view, '_missing')
+
+
+def test_view_copy_is_a_dict():
+    base, view = _view()
+    assert json.loads(json.dumps(view.copy())) == {'username': 'admin', 'http': {'port': 8081}}
@@ -0,0 +1,112 @@
+import threading
+import time
+
+import pytest
+
+import proxysg
+
+
+class _Channel:
+    closed = False
+
+
+class _Clone:
+    '''ProxySGCLI clone stand-in on its own shell channel'''
+
+    def __init__(self, sg):
+        self.sg = sg
+        self.connector = type('Connector', (), {'channel': _Channel()})()
+        self.closed = False
+
+    def command(self, cmdLine, context=None):
+        with self.sg.lock:
+            self.sg.running += 1
+            self.sg.mostRunning = max(self.sg.mostRunning, self.sg.running)
+        time.sleep(0.1)
+        with self.sg.lock:
+            self.sg.running -= 1
+        return f'{cmdLine} output'
+
+    def close(self):
+        self.closed = True
+
+
+class _Device:
+    '''ProxySGCLI stand-in: counts log ins and channels opened'''
+
+    def __init__(self):
+        self.connector = None
+        self.logins = 0
+        self.clones = []
+        self.lock = threading.Lock()
+        self.running = self.mostRunning = 0
+
+    def _goThroughLogin(self):
+        self.logins += 1
+        self.connector = object()
+
+    def _cloneOnChannel(self):
+        clone = _Clone(self)
+        self.clones.append(clone)
+        return clone
+
+
+def test_idle_channels_are_reused():
+    sg = _Device()
+    pool = proxysg.ChannelPool(sg, maxChannels=2)
+    first = pool.checkout()
+    pool.checkin(first)
+    assert pool.checkout() is first
+    assert (sg.logins, len(sg.clones)) == (1, 1)
+
+
+def test_closed_or_failed_channels_are_not_reused():
+    sg = _Device()
+    pool = proxysg.ChannelPool(sg, maxChannels=2)
+    first = pool.checkout()
+    pool.checkin(first, reuse=False)
+    assert first.closed
+    second = pool.checkout()
+    second.connector.channel.closed = True
+    pool.checkin(second)
+    assert second.closed and pool.checkout() not in (first, second)
+
+
+def test_at_most_max_channels():
+    pool = proxysg.ChannelPool(_Device(), maxChannels=2)
+    held = [pool.checkout(), pool.checkout()]
+    with pytest.raises(proxysg.Error, match='no free channel of 2'):
+        pool.checkout(timeout=0.1)
+    pool.checkin(held[0])
+    assert pool.checkout(timeout=0.1) is held[0]
+
+
+def test_failed_open_gives_its_slot_back():
+    def refuse():
+        raise proxysg.Error('channel refused')
+    sg = _Device()
+    sg._cloneOnChannel = refuse
+    pool = proxysg.ChannelPool(sg, maxChannels=1)
+    for _ in range(2):
+        with pytest.raises(proxysg.Error, match='channel refused'):
+            pool.checkout(timeout=0.1)
+
+
+def test_close_closes_the_idle_channels():
+    pool = proxysg.ChannelPool(_Device(), maxChannels=2)
+    clones = [pool.checkout(), pool.checkout()]
+    for clone in clones:
+        pool.checkin(clone)
+    pool.close()
+    assert all(clone.closed for clone in clones)
+
+
+def test_show_commands_run_in_parallel_in_order():
+    sgcli = proxysg.ProxySGCLI(ipaddr='127.0.0.1', maxChannels=3)
+    sg = _Device()
+    sgcli.channelPool = proxysg.ChannelPool(sg, sgcli.maxChannels)
+    commands = [f'show {n}' for n in range(6)]
+    assert sgcli.showCommands(commands) == [f'{cmd} output' for cmd in commands]
+    assert sg.mostRunning == 3 and len(sg.clones) == 3
+    with pytest.raises(proxysg.Error, match='not a read-only show command'):
+        sgcli.showCommands(['show clock', 'restart regular'])
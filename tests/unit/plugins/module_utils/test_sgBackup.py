@@ -0,0 +1,87 @@
+import http.server
+import threading
+
+import pytest
+
+import proxysg
+import sgBackup
+
+
+_config = b';; Date: 2026-01-01 02:00\nhostname sg1\n!- BEGIN networking\ninterface 0:0\nexit\n!- END networking\n'
+
+
+class _Archive(http.server.BaseHTTPRequestHandler):
+    '''Management console stand-in serving the configuration archive page'''
+
+    protocol_version = 'HTTP/1.1'
+    body = _config
+
+    def do_GET(self):
+        if self.path != sgBackup.kArchiveURL:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def console():
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Archive)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    sg = proxysg.ProxySGHTTP(ipaddr='127.0.0.1', port=server.server_address[1], protocol='http')
+    yield sg
+    sg.close()
+    server.shutdown()
+    server.server_close()
+
+
+class _CLI:
+    '''ProxySGCLI stand-in: "show config" output as the SSH channel delivers it, \r\n and split lines'''
+
+    device = 'proxysg_1'
+
+    def __init__(self, output, chunk=7):
+        self.output, self.chunk = output, chunk
+
+    def iterCommandOutput(self, cmdLine, context=None, chunkSize=65536):
+        assert cmdLine == 'show config'
+        for n in range(0, len(self.output), self.chunk):
+            yield self.output[n:n + self.chunk]
+
+
+def test_http_and_cli_store_the_same_object(tmp_path, console):
+    store = sgBackup.ConfigStore(str(tmp_path), compression='gzip')
+    http = sgBackup.backup(console, store)
+    cli = sgBackup.backup(_CLI(_config.replace(b'\n', b'\r\n').replace(b'02:00', b'02:05')), store)
+    assert (http.source, cli.source) == ('http', 'cli')
+    assert http.error is None and cli.error is None
+    assert http.new and not cli.new
+    assert http.sha == cli.sha
+    assert store.read(cli.sha) == 'hostname sg1\n!- BEGIN networking\ninterface 0:0\nexit\n!- END networking\n'
+
+
+def test_snapshots_by_device(tmp_path):
+    store = sgBackup.ConfigStore(str(tmp_path), compression='gzip')
+    first = sgBackup.backup(_CLI(_config), store)
+    again = sgBackup.backup(_CLI(_config), store)
+    changed = sgBackup.backup(_CLI(_config.replace(b'sg1', b'sg2')), store)
+    assert (first.new, again.new, changed.new) == (True, False, True)
+    assert [s.sha for s in store.snapshots('proxysg_1')] == [first.sha, first.sha, changed.sha]
+    assert store.latest('proxysg_1').sha == changed.sha
+    assert store.devices() == ['proxysg_1']
+
+
+def test_failed_backup_is_recorded(tmp_path, console):
+    store = sgBackup.ConfigStore(str(tmp_path), compression='gzip')
+    sgBackup.backup(console, store)
+    console.aspects.port = 1
+    snapshot = sgBackup.backup(console, store)
+    assert snapshot.sha is None and snapshot.error
+    device = console.aspects.ipaddr
+    assert [s.sha is None for s in store.snapshots(device)] == [False, True]
+    assert store.latest(device).sha
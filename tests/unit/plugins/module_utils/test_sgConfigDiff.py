@@ -0,0 +1,85 @@
+import sgBackup
+import sgConfigDiff
+
+
+_config = '''\
+;; Date: 2026-01-01
+hostname sg1
+!- BEGIN networking
+interface 0:0
+#(config interface 0:0)
+ip-address 10.1.1.1 255.255.255.0
+exit
+#(config interface 0:1)
+ip-address 10.1.2.1 255.255.255.0
+exit
+!- END networking
+!- BEGIN policy
+define condition internal
+  client.address=10.0.0.0/8
+end
+!- END policy
+'''
+
+
+def test_sections():
+    sections = sgConfigDiff.parseSections(_config)
+    assert list(sections) == ['', 'networking', 'networking/#(config interface 0:0)',
+                              'networking/#(config interface 0:1)', 'policy']
+    assert sections['networking/#(config interface 0:1)'].lines == ('ip-address 10.1.2.1 255.255.255.0', 'exit')
+    assert sections['policy'].lines[1] == '  client.address=10.0.0.0/8'
+
+
+def test_repeated_section_keys_are_numbered():
+    sections = sgConfigDiff.parseSections('!- BEGIN a\nx\n!- END a\n!- BEGIN a\ny\n!- END a\n')
+    assert [s.lines for s in sections.values()] == [('x',), ('y',)]
+    assert list(sections) == ['a', 'a [2]']
+
+
+def test_only_changed_sections_are_diffed():
+    new = _config.replace('10.1.2.1', '10.1.3.1').replace('!- BEGIN policy', '!- BEGIN ssl\nssl\n!- END ssl\n!- BEGIN policy')
+    diff = sgConfigDiff.diffConfigs(_config, new)
+    assert diff.added == ['ssl'] and diff.removed == []
+    assert list(diff.changed) == ['networking/#(config interface 0:1)']
+    changes = [line for line in diff.changed['networking/#(config interface 0:1)'] if line[:1] in '+-']
+    assert changes[2:] == ['-ip-address 10.1.2.1 255.255.255.0', '+ip-address 10.1.3.1 255.255.255.0']
+    assert diff.unchanged == 4
+    assert diff.summary() == '1 added, 0 removed, 1 changed, 4 unchanged sections'
+    assert not sgConfigDiff.diffConfigs(_config, _config.replace('\n', '  \r\n'))
+
+
+def _snapshot(store, device, text):
+    sha, size, new = store.store([text.encode('utf-8')])
+    store.addSnapshot(sgBackup.Snapshot(device, 0.0, sha, size, new, 'http', 0.0, None))
+    return sha
+
+
+def test_drift_latest_against_previous_snapshot(tmp_path):
+    store = sgBackup.ConfigStore(str(tmp_path), compression='gzip')
+    changed = _config.replace('hostname sg1', 'hostname sg2')
+    first = _snapshot(store, 'proxysg_1', _config)
+    second = _snapshot(store, 'proxysg_1', changed)
+    _snapshot(store, 'proxysg_2', _config)
+
+    reports = {r.device: r for r in sgConfigDiff.driftReport(store)}
+    assert (reports['proxysg_1'].oldSha, reports['proxysg_1'].newSha) == (first, second)
+    assert list(reports['proxysg_1'].diff.changed) == ['']
+    assert reports['proxysg_2'].diff is None
+
+    # -- the same configuration pulled again is no drift, even when an older snapshot differs
+    _snapshot(store, 'proxysg_1', changed)
+    report, = sgConfigDiff.driftReport(store, devices=['proxysg_1'])
+    assert (report.oldSha, report.newSha, report.diff) == (second, second, None)
+
+
+def test_drift_against_a_baseline(tmp_path):
+    store = sgBackup.ConfigStore(str(tmp_path), compression='gzip')
+    baseline = _snapshot(store, 'proxysg_1', _config)
+    _snapshot(store, 'proxysg_2', _config.replace('10.1.1.1', '10.1.1.2'))
+
+    reports = {r.device: r for r in sgConfigDiff.driftReport(store, against=baseline)}
+    assert reports['proxysg_1'].diff is None
+    assert list(reports['proxysg_2'].diff.changed) == ['networking/#(config interface 0:0)']
+
+    report, = sgConfigDiff.driftReport(store, devices=['proxysg_1'], against=_config.replace('sg1', 'sg9'))
+    assert report.oldSha is None and list(report.diff.changed) == ['']
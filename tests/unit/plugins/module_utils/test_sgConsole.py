@@ -0,0 +1,144 @@
+import asyncio
+import re
+import socket
+import threading
+import time
+
+import proxysg
+import sgConsole
+
+
+async def _standIn(script):
+    '''
+    Local telnet stand-in: after a client connects, send every (delay, bytes)
+    of script in turn. Returns: (server, port)
+    '''
+    async def handle(reader, writer):
+        for delay, data in script:
+            await asyncio.sleep(delay)
+            writer.write(data)
+            await writer.drain()
+        await reader.read()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def _expect(script, patterns, timeout=3, idle=(), idleTime=sgConsole.kIdleTime):
+    async def run():
+        server, port = await _standIn(script)
+        session = sgConsole.ConsoleSession('127.0.0.1', port, idleTime=idleTime)
+        await session.connect()
+        try:
+            return await session.expect(patterns, timeout, idle)
+        finally:
+            await session.close()
+            server.close()
+    return asyncio.run(run())
+
+
+def test_confirmation_prompt_split_across_chunks():
+    script = [(0, b'restart regular\r\n'), (0.3, b'Restart system? [No]:')]
+    index, match, text = _expect(script, [proxysg._reConfirm, proxysg._reConfirm2])
+    assert index == 1
+    assert text.endswith(b'Restart system? [No]:')
+
+
+def test_multiline_prompt_after_earlier_lines():
+    script = [(0, b'first line\r\n'), (0.2, b'second line\r\n'), (0.2, b'Enable Password:')]
+    index, match, text = _expect(script, [proxysg._rePasswordEnable])
+    assert index == 0
+
+
+def test_idle_prompt_waits_for_longer_prompt():
+    enable, config = re.compile(r'sg#$'), re.compile(r'sg#\(config\)$')
+    script = [(0, b'sg#'), (0.05, b'(config)')]
+    index, match, text = _expect(script, [enable, config], idle=[enable], idleTime=0.3)
+    assert index == 1
+    assert text == b'sg#(config)'
+
+
+def test_idle_prompt_accepted_once_quiet():
+    enable, config = re.compile(r'sg#$'), re.compile(r'sg#\(config\)$')
+    index, match, text = _expect([(0, b'sg#')], [enable, config], idle=[enable], idleTime=0.1)
+    assert index == 0
+
+
+def test_timeout():
+    assert _expect([(0, b'no prompt here')], [rb'>$'], timeout=0.2) == (-1, None, b'')
+
+
+def test_telnet_negotiation_split_across_chunks():
+    decoder = sgConsole.TelnetDecoder()
+    data, replies = decoder.feed(b'ab' + bytes((sgConsole.IAC, sgConsole.WILL)))
+    assert (data, replies) == (b'ab', b'')
+    data, replies = decoder.feed(bytes((sgConsole.ECHO,)) + b'cd')
+    assert data == b'cd'
+    assert replies == bytes((sgConsole.IAC, sgConsole.DO, sgConsole.ECHO))
+
+
+def test_pattern_across_lines_split_across_chunks():
+    script = [(0, b'cmd\r\n;mark-0\r\n'), (0.3, b'sg1.test#(config)')]
+    index, match, text = _expect(script, [rb';mark-0\s*\n\r?([^#>\r\n]{4,80}#\(config\))$'])
+    assert index == 0
+    assert match.group(1) == b'sg1.test#(config)'
+
+
+def test_search_start_of_patterns():
+    single = [rb'>$', rb'sg#\(config\)$', proxysg._reEnablePrompt, proxysg._reConfirm]
+    spanning = [rb'a\s*\nb', rb'mark[^#]+#', rb'(?s)a.b', proxysg._reConfirm2, rb'\Aboot']
+    assert not any(sgConsole._searchFromStart(sgConsole._bytesPattern(p)) for p in single)
+    assert all(sgConsole._searchFromStart(sgConsole._bytesPattern(p)) for p in spanning)
+
+
+class _SerialDevice:
+    '''
+    Stand-in of a device console behind a terminal server, in config mode: echoes
+    every line, prints "% ..." for lines containing "bad" and a prompt after each
+    line; the prompt after a bulk mark comes in a separate chunk, markDelay later.
+    '''
+
+    prompt = b'sg1.test#(config)'
+
+    def __init__(self, markDelay=0.3):
+        self.markDelay = markDelay
+        self.listener = socket.create_server(('127.0.0.1', 0))
+        self.port = self.listener.getsockname()[1]
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+
+    def _serve(self):
+        conn, _ = self.listener.accept()
+        with conn:
+            pending = b''
+            while True:
+                data = conn.recv(4096)
+                if not data:
+                    return
+                pending += data
+                while b'\r' in pending:
+                    line, pending = pending.split(b'\r', 1)
+                    conn.sendall(line + b'\r\n')
+                    if b'bad' in line:
+                        conn.sendall(b'% Invalid input detected\r\n')
+                    if line.startswith(proxysg.kBulkMark.encode()):
+                        time.sleep(self.markDelay)
+                    conn.sendall(self.prompt)
+
+    def close(self):
+        self.listener.close()
+
+
+def test_serial_bulk_push_with_prompt_after_the_mark_in_a_later_chunk():
+    device = _SerialDevice()
+    sg = proxysg.ProxySGCLI(cliaccess='serial', serial=f'127.0.0.1:{device.port}', commandTimeout=1)
+    try:
+        results = sg.commandBulk(['interface 0:0', 'bad line', 'exit'], window=2)
+    finally:
+        sg.close()
+        device.close()
+    assert [(r.line, r.command, r.ok) for r in results] == [
+        (1, 'interface 0:0', True), (2, 'bad line', False), (3, 'exit', True)]
+    assert results[1].errors == ['% Invalid input detected']
+    assert sg.context == proxysg.CLI_CONFIG
@@ -0,0 +1,130 @@
+import base64
+import http.cookiejar
+import http.server
+import threading
+import urllib.error
+
+import pytest
+
+import sgHttpPool
+
+
+class _Console(http.server.BaseHTTPRequestHandler):
+    '''
+    Management console stand-in. Answers with the client port, so a test can tell
+    whether a connection was reused, and records (path, authorization, cookie).
+    '''
+
+    protocol_version = 'HTTP/1.1'
+    requests = []
+
+    def do_GET(self):
+        auth = self.headers.get('Authorization')
+        self.requests.append((self.path, auth, self.headers.get('Cookie')))
+        headers = {}
+        if self.path == '/secret' and auth != 'Basic ' + base64.b64encode(b'admin:pw').decode():
+            status, body, headers = 401, b'login', {'WWW-Authenticate': 'Basic realm="sg"'}
+        elif self.path == '/login':
+            status, body, headers = 200, b'ok', {'Set-Cookie': 'session=42; Path=/'}
+        elif self.path == '/old':
+            status, body, headers = 302, b'', {'Location': '/secret'}
+        elif self.path == '/missing':
+            status, body = 404, b'no such page'
+        else:
+            status, body = 200, str(self.client_address[1]).encode()
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        # -- drop the connection without saying so, as a device does with an idle one
+        self.close_connection = self.path == '/drop'
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def console():
+    _Console.requests = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Console)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    yield f'http://127.0.0.1:{server.server_address[1]}'
+    server.shutdown()
+    server.server_close()
+
+
+def _get(pool, url):
+    with pool.open(url) as response:
+        return response.status, response.read()
+
+
+def test_keep_alive_connection_is_reused(console):
+    pool = sgHttpPool.HTTPPool()
+    ports = {_get(pool, console + f'/page{n}')[1] for n in range(5)}
+    assert len(ports) == 1
+    pool.close()
+    assert _get(pool, console + '/page')[1] not in ports
+
+
+def test_unread_response_drops_its_connection(console):
+    pool = sgHttpPool.HTTPPool()
+    port = _get(pool, console + '/page')[1]
+    pool.open(console + '/page').close()
+    assert _get(pool, console + '/page')[1] != port
+
+
+def test_connections_per_host_are_limited(console):
+    pool = sgHttpPool.HTTPPool(maxPerHost=2, timeout=0.5)
+    held = [pool.open(console + '/a'), pool.open(console + '/b')]
+    with pytest.raises(sgHttpPool.Error, match='no free connection'):
+        pool.open(console + '/c')
+    held[0].read()
+    assert _get(pool, console + '/c')[0] == 200
+    held[1].close()
+    pool.close()
+
+
+def test_stale_connection_is_retried_on_a_new_one(console):
+    pool = sgHttpPool.HTTPPool()
+    dropped = _get(pool, console + '/drop')[1]
+    status, port = _get(pool, console + '/page')
+    assert status == 200 and port != dropped
+    assert [path for path, auth, cookie in _Console.requests] == ['/drop', '/page']
+
+
+def test_expired_idle_connections_are_closed(console):
+    pool = sgHttpPool.HTTPPool(idleTimeout=0)
+    first = _get(pool, console + '/page')[1]
+    pool.evictIdle()
+    assert _get(pool, console + '/page')[1] != first
+
+
+def test_basic_auth_after_the_first_challenge(console):
+    pool = sgHttpPool.HTTPPool(username='admin', password='pw')
+    assert _get(pool, console + '/secret')[0] == 200
+    assert _get(pool, console + '/other')[0] == 200
+    auths = [auth is not None for path, auth, cookie in _Console.requests]
+    assert auths == [False, True, True]
+
+
+def test_wrong_credentials_raise_http_error(console):
+    pool = sgHttpPool.HTTPPool(username='admin', password='wrong')
+    with pytest.raises(urllib.error.HTTPError) as e:
+        pool.open(console + '/secret')
+    assert e.value.code == 401
+    assert len(_Console.requests) == 2
+    with pytest.raises(urllib.error.HTTPError) as e:
+        pool.open(console + '/missing')
+    assert e.value.code == 404 and e.value.read() == b'no such page'
+
+
+def test_cookies_and_redirects(console):
+    pool = sgHttpPool.HTTPPool(cookieJar=http.cookiejar.CookieJar(), username='admin', password='pw')
+    _get(pool, console + '/login')
+    with pool.open(console + '/old') as response:
+        assert response.url == console + '/secret' and response.status == 200
+        response.read()
+    assert [(path, cookie) for path, auth, cookie in _Console.requests] == [
+        ('/login', None), ('/old', 'session=42'), ('/secret', 'session=42'), ('/secret', 'session=42')]
@@ -0,0 +1,121 @@
+import http.server
+import json
+import threading
+import time
+
+import pytest
+
+import sgImages
+
+
+class _BuildServer(http.server.BaseHTTPRequestHandler):
+    '''Stand-in for cachezilla and the build archive'''
+
+    pages = {
+        '/XMLInterface.cgi': None,      # answered from the build_id query
+        '/main.123456/wdir/images/bin/': '<a href="x86_64/">x86_64/</a>',
+        '/main.123456/wdir/images/bin/x86_64/sgos_native/release/': '<a href="gcc_v4.6.1/">gcc_v4.6.1/</a>',
+    }
+
+    def do_GET(self):
+        self.server.hits.append(self.path)
+        path, _, query = self.path.partition('?')
+        if path == '/XMLInterface.cgi':
+            if 'build_id=123456' in query:
+                body = {'Build': {'branch': 'main'}}
+            else:
+                body = {'Build': {'msg': 'unknown build'}}
+            self._send(json.dumps(body))
+        elif path in self.pages:
+            self._send(self.pages[path])
+        else:
+            self.send_error(404)
+
+    def _send(self, text):
+        data = text.encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def buildServer(monkeypatch):
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _BuildServer)
+    httpd.hits = []
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    base = f'http://127.0.0.1:{httpd.server_address[1]}/'
+    monkeypatch.setattr(sgImages, 'kBuildArchiveURL', base)
+    monkeypatch.setattr(sgImages, 'kBuildInfoURL', base + 'XMLInterface.cgi?build_id={}&json=1')
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_resolve_uses_cache_on_second_call(buildServer, tmp_path):
+    cache = sgImages.BuildLinkCache(str(tmp_path / 'links.json'))
+    branch, links = sgImages.resolveBuildLinks('123456', cache=cache)
+    assert branch == 'main'
+    assert links == {'x86_64': sgImages.kBuildArchiveURL +
+                     'main.123456/wdir/images/bin/x86_64/sgos_native/release/gcc_v4.6.1/sysimg/system.bcsi'}
+    crawled = len(buildServer.hits)
+    assert sgImages.resolveBuildLinks('123456', cache=cache) == (branch, links)
+    assert len(buildServer.hits) == crawled
+
+
+def test_cache_is_shared_through_the_file(buildServer, tmp_path):
+    path = str(tmp_path / 'links.json')
+    sgImages.resolveBuildLinks('123456', cache=sgImages.BuildLinkCache(path))
+    crawled = len(buildServer.hits)
+    branch, links = sgImages.resolveBuildLinks('123456', cache=sgImages.BuildLinkCache(path))
+    assert branch == 'main' and 'x86_64' in links
+    assert len(buildServer.hits) == crawled
+
+
+def test_unknown_build_is_cached_negative(buildServer, tmp_path):
+    cache = sgImages.BuildLinkCache(str(tmp_path / 'links.json'))
+    with pytest.raises(sgImages.Error):
+        sgImages.resolveBuildLinks('999999', cache=cache)
+    crawled = len(buildServer.hits)
+    with pytest.raises(sgImages.Error, match='unknown build'):
+        sgImages.resolveBuildLinks('999999', cache=cache)
+    assert len(buildServer.hits) == crawled
+
+
+def test_negative_entries_expire(buildServer, tmp_path):
+    cache = sgImages.BuildLinkCache(str(tmp_path / 'links.json'), negativeTtl=0)
+    for _ in range(2):
+        with pytest.raises(sgImages.Error):
+            sgImages.resolveBuildLinks('999999', cache=cache)
+    assert buildServer.hits.count('/XMLInterface.cgi?build_id=999999&json=1') == 2
+
+
+def test_put_keeps_newer_entries_of_other_runs(tmp_path):
+    path = str(tmp_path / 'links.json')
+    stale = sgImages.BuildLinkCache(path)
+    stale.put('1', 'system.bcsi', {'x86_64': ('main', 'old', None)})
+    other = sgImages.BuildLinkCache(path)
+    other.put('1', 'system.bcsi', {'x86_64': ('main', 'new', None)})
+    stale.put('2', 'system.bcsi', {'x86_64': ('main', 'two', None)})
+    fresh = sgImages.BuildLinkCache(path)
+    assert fresh.get('1', 'system.bcsi', 'x86_64')['link'] == 'new'
+    assert fresh.get('2', 'system.bcsi', 'x86_64')['link'] == 'two'
+
+
+def test_put_prunes_expired_entries(tmp_path):
+    path = str(tmp_path / 'links.json')
+    cache = sgImages.BuildLinkCache(path, ttl=60, negativeTtl=60)
+    cache.put('1', 'system.bcsi', {'x86_64': ('main', 'link', None)})
+    with open(path) as f:
+        entries = json.load(f)
+    for entry in entries.values():
+        entry['time'] = time.time() - 3600
+    with open(path, 'w') as f:
+        json.dump(entries, f)
+    cache.put('2', 'system.bcsi', {'x86_64': ('main', 'link', None)})
+    with open(path) as f:
+        assert list(json.load(f)) == ['2|system.bcsi|x86_64']
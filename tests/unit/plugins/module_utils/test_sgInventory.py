@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+import autotest
+import sgInventory
+
+
+def _writeJson(path, devices, aspects=None):
+    path.write_text(json.dumps({'aspects': aspects or {}, 'devices': devices}))
+
+
+@pytest.fixture
+def inventory(tmp_path):
+    path = tmp_path / 'inventory.json'
+    _writeJson(path, {
+        'proxysg_1': {'ipaddr': '10.1.1.1', 'tags': ['dc1', 'core']},
+        'proxysg_2': {'ipaddr': '10.1.1.2', 'tags': 'dc1, edge'},
+        'proxysg_10': {'ipaddr': '10.1.1.10', 'tags': ['dc2', 'core']},
+        'lab_1': {'ipaddr': '10.9.9.1'},
+    }, {'autotest.termination.seconds': 60})
+    inventory = sgInventory.Inventory(str(path), cacheDir=str(tmp_path / 'cache'))
+    yield inventory
+    inventory.close()
+
+
+def test_mapping(inventory):
+    assert len(inventory) == 4
+    assert list(inventory) == ['lab_1', 'proxysg_1', 'proxysg_10', 'proxysg_2']
+    assert inventory['proxysg_2'].ipaddr == '10.1.1.2'
+    assert inventory['proxysg_2'] is inventory['proxysg_2']
+    assert 'proxysg_3' not in inventory
+    assert inventory.get('proxysg_3') is None
+    assert inventory.globalAspects == {'autotest.termination.seconds': 60}
+
+
+def test_select_glob(inventory):
+    assert inventory.select() == ['lab_1', 'proxysg_1', 'proxysg_10', 'proxysg_2']
+    assert inventory.select('proxysg_?') == ['proxysg_1', 'proxysg_2']
+    assert inventory.select(['proxysg_*', '!proxysg_1*']) == ['proxysg_2']
+    assert inventory.select(['!lab_*']) == ['proxysg_1', 'proxysg_10', 'proxysg_2']
+
+
+def test_select_tags(inventory):
+    assert inventory.select(tags=['dc1']) == ['proxysg_1', 'proxysg_2']
+    assert inventory.select(tags='dc1, core') == ['proxysg_1']
+    assert inventory.select(tags=['edge', 'dc2'], anyTag=True) == ['proxysg_10', 'proxysg_2']
+    assert inventory.select('proxysg_1*', tags=['core']) == ['proxysg_1', 'proxysg_10']
+    assert inventory.tags() == ['core', 'dc1', 'dc2', 'edge']
+    assert inventory.tags('proxysg_2') == ['dc1', 'edge']
+
+
+def test_ini(tmp_path):
+    path = tmp_path / 'inventory.ini'
+    path.write_text('[aspects]\nproxysg_1.ipaddr = 10.1.1.1\nproxysg_1.tags = dc1\nlog = all\n'
+                    '[proxysg_2]\nipaddr = 10.1.1.2\ntags = dc1 dc2\n')
+    inventory = sgInventory.Inventory(str(path), cacheDir=None)
+    assert inventory.globalAspects == {'log': 'all'}
+    assert inventory['proxysg_1'].ipaddr == '10.1.1.1'
+    assert inventory.select(tags='dc1') == ['proxysg_1', 'proxysg_2']
+
+
+def test_index_reused_until_the_file_changes(tmp_path, monkeypatch):
+    path = tmp_path / 'inventory.json'
+    _writeJson(path, {'proxysg_1': {'ipaddr': '10.1.1.1'}})
+    builds = []
+    buildIndex = sgInventory.buildIndex
+    monkeypatch.setattr(sgInventory, 'buildIndex', lambda *args: builds.append(args) or buildIndex(*args))
+    cacheDir = str(tmp_path / 'cache')
+
+    sgInventory.Inventory(str(path), cacheDir).close()
+    sgInventory.Inventory(str(path), cacheDir).close()
+    assert len(builds) == 1
+
+    _writeJson(path, {'proxysg_1': {'ipaddr': '10.1.1.1'}, 'proxysg_2': {'ipaddr': '10.1.1.2'}})
+    st = os.stat(path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 10 ** 9))
+    inventory = sgInventory.Inventory(str(path), cacheDir)
+    assert len(builds) == 2
+    assert inventory.devices() == ['proxysg_1', 'proxysg_2']
+    inventory.close()
+    assert [name for name in os.listdir(cacheDir) if name.endswith('.tmp')] == []
+
+
+def test_unwritable_cache_dir_keeps_the_index_in_memory(tmp_path):
+    path = tmp_path / 'inventory.json'
+    _writeJson(path, {'proxysg_1': {'ipaddr': '10.1.1.1'}})
+    inventory = sgInventory.Inventory(str(path), cacheDir=str(path / 'cache'))
+    assert inventory['proxysg_1'].ipaddr == '10.1.1.1'
+    inventory.close()
+
+
+def test_sqlite_index_is_used_as_is(tmp_path):
+    path = tmp_path / 'inventory.json'
+    _writeJson(path, {'proxysg_1': {'ipaddr': '10.1.1.1', 'tags': ['dc1']}})
+    indexPath = str(tmp_path / 'inventory.sqlite')
+    sgInventory.buildIndex(str(path), indexPath).close()
+    inventory = sgInventory.Inventory(indexPath)
+    assert inventory.select(tags='dc1') == ['proxysg_1']
+    inventory.close()
+
+
+def test_use_inventory_is_the_aspects_fallback(tmp_path, monkeypatch):
+    path = tmp_path / 'inventory.json'
+    _writeJson(path, {'proxysg_1': {'ipaddr': '10.1.1.1'}})
+    monkeypatch.setattr(autotest, 'aspects', autotest.DotDict(autotest.aspectsDefault))
+    monkeypatch.setattr(autotest, 'inventory', None)
+    inventory = sgInventory.useInventory(str(path), cacheDir=None)
+    assert autotest.device_aspects('proxysg_1', username='admin').ipaddr == '10.1.1.1'
+    inventory.close()
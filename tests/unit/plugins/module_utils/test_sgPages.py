@@ -0,0 +1,146 @@
+import http.server
+import threading
+
+import pytest
+
+import proxysg
+import sgPages
+
+
+_cpm = '''\
+ADN tunnel connection pool manager
+
+Pool to peer 10.3.0.1 (sg-branch-1)
+  Id          Peer            State     Age
+  CPMR<1>     10.3.0.1:3035   idle      12
+  CPMR<2>     10.3.0.1:3035   idle      40
+  Total: 2 connections
+Pool to peer 10.3.0.2 (sg-branch-2)
+  Total: 0 connections
+Pool to peer 10.3.0.3 (sg-branch-3)
+  Id          Peer            State     Age
+  CPMR<7>     10.3.0.3:3035   active    3
+'''
+
+
+class _Console(http.server.BaseHTTPRequestHandler):
+    '''Management console stand-in serving canned advanced-url pages, counting downloads'''
+
+    protocol_version = 'HTTP/1.1'
+    pages = {}
+    downloads = []
+
+    def do_GET(self):
+        self.downloads.append(self.path)
+        body = self.pages.get(self.path)
+        if body is None:
+            self.send_error(404)
+            return
+        body = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def console():
+    _Console.pages = {sgPages.getPageParser('cpm').url: _cpm}
+    _Console.downloads = []
+    server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Console)
+    threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+    sg = proxysg.ProxySGHTTP(ipaddr='127.0.0.1', port=server.server_address[1], protocol='http', cacheTTL=60)
+    yield sg
+    sg.close()
+    server.shutdown()
+    server.server_close()
+
+
+def test_connection_pools_in_one_pass():
+    pools = sgPages.parseConnectionPools(_cpm)
+    assert list(pools) == ['Pool to peer 10.3.0.1 (sg-branch-1)', 'Pool to peer 10.3.0.2 (sg-branch-2)',
+                           'Pool to peer 10.3.0.3 (sg-branch-3)']
+    first, empty, last = pools.values()
+    assert [line.split()[0] for line in first['entries']] == ['CPMR<1>', 'CPMR<2>']
+    assert first['total'].strip() == 'Total: 2 connections'
+    assert (empty['entries'], empty['total'].strip()) == ([], 'Total: 0 connections')
+    # -- the last pool runs to the end of the page without a total line
+    assert (len(last['entries']), last['total']) == (1, None)
+    assert sgPages.parseConnectionPools('') == {}
+
+
+def test_connection_pool_lookups_share_one_download(console):
+    assert [line.split()[0] for line in console.getConnectionPool('sg-branch-1')] == ['CPMR<1>', 'CPMR<2>', 'Total:']
+    assert [line.strip() for line in console.getConnectionPool('10.3.0.2')] == ['Total: 0 connections']
+    assert len(console.getConnectionPool('Pool to peer 10.3.0.3 (sg-branch-3)')) == 1
+    assert console.getConnectionPool('sg-branch-9') == []
+    assert len(_Console.downloads) == 1
+
+
+def test_connection_pools_downloaded_again_when_older_than_max_age(console):
+    console.getConnectionPools()
+    _Console.pages[sgPages.getPageParser('cpm').url] = _cpm.replace('CPMR<7>', 'CPMR<8>')
+    assert 'CPMR<7>' in console.getConnectionPool('sg-branch-3')[0]
+    assert 'CPMR<8>' in console.getConnectionPool('sg-branch-3', maxAge=0)[0]
+    assert len(_Console.downloads) == 2
+
+
+_hardware = '''<html><pre>
+Model: 300-10
+Serial number: 1234
+Interface 0:0: Intel Gigabit  running at 1 Gbps full duplex MAC 00:d0:83:01:02:03
+Interface 0:1: Intel Gigabit  not running MAC 00:d0:83:01:02:04
+</pre></html>
+'''
+_cpu = 'CPU 0: 12%\nCPU 1  7.5 %\nAverage CPU: 9%\n'
+_http = '<b>Connections accepted:</b> 1532\nConnections dropped: 0\n'
+_version = 'Version: SGOS 7.3.16.2 Proxy Edition\nRelease id: 312345\nSerial number: 2105-1234-56\n'
+
+
+def test_registered_parsers():
+    assert {'hardware', 'cpu', 'http', 'version', 'cpm'} <= set(sgPages.pageParsers)
+    assert sgPages.getPageParser('http').parse is sgPages.parseHttpStats
+    with pytest.raises(sgPages.Error, match='no page parser'):
+        sgPages.getPageParser('nothing')
+
+    hardware = sgPages.parseHardwareInfo(_hardware)
+    assert hardware.model == '300'
+    assert hardware.interfaces == {'0:0': '00:d0:83:01:02:03', '0:1': '00:d0:83:01:02:04'}
+    assert hardware.fields['Serial number'] == '1234'
+    assert sgPages.parseCpuStats(_cpu).cpus == {'CPU 0': 12.0, 'CPU 1': 7.5}
+    assert sgPages.parseHttpStats(_http).connectionsAccepted == 1532
+    assert sgPages.parseHttpStats('').connectionsAccepted is None
+    assert sgPages.parseSysinfoVersion(_version)[:3] == ('7.3.16.2', '312345', '2105-1234-56')
+
+
+def test_register_a_page(console, monkeypatch):
+    monkeypatch.setattr(sgPages, 'pageParsers', dict(sgPages.pageParsers))
+
+    @sgPages.registerPage('clock', '/Diagnostics/clock')
+    def parseClock(text):
+        return sgPages.parseFields(text)['Time']
+
+    _Console.pages['/Diagnostics/clock'] = 'Time: 12:00:00 UTC\n'
+    assert console.getParsedPage('clock') == '12:00:00 UTC'
+
+
+def test_parsed_pages_are_memoized(console):
+    _Console.pages.update({sgPages.getPageParser('http').url: _http,
+                           sgPages.getPageParser('version').url: _version})
+    assert console.getParsedPage('http') is console.getParsedPage('http')
+    assert console.getParsedPage('version').build == '312345'
+    assert len(_Console.downloads) == 2
+
+    _Console.pages[sgPages.getPageParser('http').url] = _http.replace('1532', '1600')
+    assert console.getParsedPage('http').connectionsAccepted == 1532
+    assert console.getParsedPage('http', maxAge=0).connectionsAccepted == 1600
+    _Console.pages[sgPages.getPageParser('http').url] = _http.replace('1532', '1700')
+    console.refreshPages('http')
+    assert console.getParsedPage('http').connectionsAccepted == 1700
+    console.getParsedPage('version')
+    console.refreshPages()
+    console.getParsedPage('version')
+    assert len(_Console.downloads) == 5
@@ -0,0 +1,88 @@
+import collections
+import os
+
+import pytest
+
+import sgPolicy
+
+
+class _Connector:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+class _CLI:
+    '''ProxySGCLI stand-in: records what is written, answers the end marker with canned compile output'''
+
+    def __init__(self, output):
+        self.aspects = collections.namedtuple('Aspects', 'device ipaddr')('proxysg_1', '10.1.1.1')
+        self.connector = _Connector()
+        self.commandTimeout = 120
+        self.output = output
+        self.commands = []
+
+    def command(self, command, context=None, timeout=None, confirmation=None):
+        self.commands.append(command)
+        return f'{command}\r\n{self.output}' if command else ''
+
+
+_ok = 'Compiling new configuration file ...\r\nCompilation completed in 120 ms\r\n1 warning\r\nWarning: unused rule\r\n'
+
+
+def test_chunks_are_whole_lines_of_at_least_chunk_size():
+    installer = sgPolicy.PolicyInstaller(_CLI(_ok), hashes=None, chunkSize=10)
+    lines = ['<proxy>', 'ALLOW', 'DENY url.domain=example.com', 'x']
+    chunks = list(installer._chunks(lines))
+    assert ''.join(chunks) == ''.join(line + '\r' for line in lines)
+    assert all(chunk.endswith('\r') for chunk in chunks)
+    assert [len(chunk) >= 10 for chunk in chunks] == [True, True, False]
+
+
+def test_install_streams_policy_and_parses_compile_result(tmp_path):
+    sgcli = _CLI(_ok)
+    installer = sgPolicy.PolicyInstaller(sgcli, hashes=str(tmp_path / 'hashes.json'), chunkSize=8)
+    result = installer.install('<proxy>\nALLOW\n')
+    writes = sgcli.connector.writes
+    assert writes[0] == 'inline policy local EOF1234\r'
+    assert ''.join(writes[1:]) == '<proxy>\rALLOW\r'
+    assert sgcli.commands == ['', 'EOF1234']
+    assert result.installed and not result.skipped
+    assert (result.lines, result.warnings, result.errors, result.deviceCompileSeconds) == (2, 1, 0, 0.12)
+
+    result = installer.install('<proxy>\nALLOW\n')
+    assert result.skipped and len(sgcli.connector.writes) == len(writes)
+
+
+def test_marker_never_collides_with_a_policy_line():
+    sgcli = _CLI(_ok)
+    sgPolicy.PolicyInstaller(sgcli, hashes=None).install('EOF1234\nALLOW')
+    assert sgcli.connector.writes[0] == 'inline policy local EOF1234X\r'
+    assert sgcli.commands[-1] == 'EOF1234X'
+
+
+def test_compile_errors_raise_and_store_no_hash(tmp_path):
+    hashes = sgPolicy.PolicyHashes(str(tmp_path / 'hashes.json'))
+    installer = sgPolicy.PolicyInstaller(_CLI('Error: line 2: syntax error\r\n1 error\r\n'), hashes=hashes)
+    with pytest.raises(sgPolicy.Error, match='syntax error'):
+        installer.install('<proxy>\nALOW')
+    assert hashes.get('proxysg_1', 'local') is None
+
+
+def test_unwritable_hash_file_does_not_fail_the_install(tmp_path):
+    blocker = tmp_path / 'file'
+    blocker.write_text('')
+    hashes = sgPolicy.PolicyHashes(str(blocker / 'hashes.json'))
+    result = sgPolicy.PolicyInstaller(_CLI(_ok), hashes=hashes).install('<proxy>\nALLOW')
+    assert result.installed
+    assert hashes.get('proxysg_1', 'local') is None
+
+
+def test_hashes_leave_no_temporary_files(tmp_path):
+    hashes = sgPolicy.PolicyHashes(str(tmp_path / 'hashes.json'))
+    hashes.put('proxysg_1', 'local', 'a')
+    hashes.put('proxysg_1', 'central', 'b')
+    assert hashes.get('proxysg_1', 'local') == 'a' and hashes.get('proxysg_1', 'central') == 'b'
+    assert os.listdir(tmp_path) == ['hashes.json']
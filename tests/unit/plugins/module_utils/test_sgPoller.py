@@ -0,0 +1,61 @@
+import os
+
+import proxysg
+import sgPoller
+
+
+class _Device:
+    '''ProxySGHTTP stand-in with a counter that grows by 10 per poll'''
+
+    def __init__(self, device):
+        self.device = device
+        self.closed = False
+        self.accepted = 0
+
+    def close(self):
+        self.closed = True
+
+
+def _sampleAccepted(sg):
+    sg.accepted += 10
+    return {'http.connectionsAccepted': sg.accepted, 'tcp.connections': 3}
+
+
+def test_ring_buffer_keeps_the_newest_samples(tmp_path):
+    path = str(tmp_path / 'sg.ts')
+    series = sgPoller.TimeSeriesFile(path, capacity=3)
+    for n in range(5):
+        series.append(float(n), 'proxysg_1' if n % 2 else 'proxysg_2', 'cpu.CPU0', n)
+    assert [s.value for s in series.read()] == [2, 3, 4]
+    assert [s.timestamp for s in series.read(device='proxysg_1')] == [3.0]
+    series.close()
+
+    series = sgPoller.TimeSeriesFile(path)
+    assert series.capacity == 3
+    assert [(s.device, s.value) for s in series.read(since=2.0)] == [('proxysg_1', 3), ('proxysg_2', 4)]
+    series.close()
+    assert sorted(os.listdir(tmp_path)) == ['sg.ts', 'sg.ts.names']
+
+
+def test_rates_only_for_counters(tmp_path):
+    sg = _Device('proxysg_1')
+    poller = sgPoller.MetricsPoller([sg], str(tmp_path / 'sg.ts'), samplers=[_sampleAccepted])
+    poller.poll()
+    poller.poll()
+    accepted = poller.series.read(metric='http.connectionsAccepted')
+    assert [(s.value, s.delta) for s in accepted] == [(10, 0), (20, 10)]
+    assert accepted[0].rate == 0 and accepted[1].rate > 0
+    assert [s.rate for s in poller.series.read(metric='tcp.connections')] == [0, 0]
+    poller.stop()
+
+
+def test_stop_closes_only_the_devices_created_from_names(tmp_path, monkeypatch):
+    monkeypatch.setattr(proxysg, 'ProxySGHTTP', _Device)
+    given = _Device('proxysg_1')
+    poller = sgPoller.MetricsPoller([given, 'proxysg_2'], str(tmp_path / 'sg.ts'), interval=0.01,
+                                    samplers=[_sampleAccepted])
+    created = poller.devices[1]
+    poller.run(count=2)
+    assert len(poller.series.read(device='proxysg_2')) == 4
+    poller.stop()
+    assert created.closed and not given.closed
@@ -0,0 +1,144 @@
+import asyncio
+import http.server
+import socket
+import threading
+import time
+
+import pytest
+
+import proxysg
+import sgProbe
+
+
+def _freePort():
+    '''A local port nothing listens on, connects to it are refused'''
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+async def _standIn(greeting=None, answer=None):
+    '''
+    Local stand-in: sends greeting on connect, or answer after the first request line.
+    Returns: (server, port)
+    '''
+    async def handle(reader, writer):
+        if greeting:
+            writer.write(greeting)
+        elif answer:
+            await reader.readline()
+            writer.write(answer)
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, '127.0.0.1', 0)
+    return server, server.sockets[0].getsockname()[1]
+
+
+def _withStandIn(check, **standIn):
+    async def run():
+        server, port = await _standIn(**standIn)
+        try:
+            return await check(port)
+        finally:
+            server.close()
+    return asyncio.run(run())
+
+
+def test_tcp_probe_open_and_refused():
+    assert _withStandIn(lambda port: sgProbe.tcpProbe('127.0.0.1', port)) == (True, True, None)
+    reachable, isOpen, error = asyncio.run(sgProbe.tcpProbe('127.0.0.1', _freePort()))
+    assert (reachable, isOpen) == (True, False) and isinstance(error, ConnectionRefusedError)
+
+
+def test_probe_host_prefers_the_open_port():
+    refused = _freePort()
+    async def check(port):
+        return port, await sgProbe.probeHost('127.0.0.1', ports=(refused, port))
+    port, result = _withStandIn(check)
+    assert (result.reachable, result.port, result.open) == (True, port, True)
+    result = sgProbe.probe('127.0.0.1', ports=(refused,))
+    assert (result.reachable, result.port, result.open) == (True, refused, False)
+
+
+def test_ssh_banner_and_http_answer():
+    assert _withStandIn(lambda port: sgProbe.readSshBanner('127.0.0.1', port),
+                        greeting=b'SSH-2.0-OpenSSH_8.0\r\n') == 'SSH-2.0-OpenSSH_8.0'
+    assert _withStandIn(lambda port: sgProbe.readSshBanner('127.0.0.1', port, timeout=1),
+                        greeting=b'220 ftp ready\r\n') is None
+    assert _withStandIn(lambda port: sgProbe.httpAnswers('127.0.0.1', port, useTls=False),
+                        answer=b'HTTP/1.0 401 Unauthorized\r\n\r\n') is True
+    assert _withStandIn(lambda port: sgProbe.httpAnswers('127.0.0.1', port, useTls=False, timeout=1),
+                        answer=b'SSH-2.0-x\r\n') is False
+    assert sgProbe.httpReady('127.0.0.1', _freePort(), useTls=False) is False
+
+
+def test_wait_reachable():
+    refused = _freePort()
+    elapsed = sgProbe.waitReachable(['127.0.0.1'], timeout=1, ports=(refused,))
+    assert elapsed['127.0.0.1'] < 1
+    elapsed = sgProbe.waitReachable(['127.0.0.1'], timeout=0.5, interval=0.1, ports=(refused,), requireOpen=True)
+    assert elapsed == {'127.0.0.1': None}
+
+
+def test_backoff():
+    delays = sgProbe.backoff(1, 2, 15)
+    assert [next(delays) for _ in range(6)] == [1, 2, 4, 8, 15, 15]
+
+
+# ------------------------------------------------------------------------------
+# ProxyCommon.waitReady stages, see proxysg
+
+class _Console:
+    '''Management console stand-in in a thread, stopped and started again like a restarting device'''
+
+    def __init__(self, port=0):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', port), http.server.BaseHTTPRequestHandler)
+        self.port = self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True).start()
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _device(port):
+    sg = proxysg.ProxySGHTTP(ipaddr='127.0.0.1', port=port, protocol='http')
+    sg._probePorts = lambda: (port,)        # the console port only, SSH on this host is not the device's
+    return sg
+
+
+def test_ready_stages():
+    assert [stage for stage, ready in proxysg.ProxySGHTTP(ipaddr='10.1.1.1')._readyStages()] == ['reachable', 'http']
+    sgcli = proxysg.ProxySGCLI(ipaddr='10.1.1.1')
+    assert [stage for stage, ready in sgcli._readyStages()] == ['reachable', 'ssh', 'cli']
+    assert [stage for stage, ready in sgcli._readyStages(http=True)] == ['reachable', 'ssh', 'cli', 'http']
+
+
+def test_wait_ready_after_a_restart():
+    console = _Console()
+    sg = _device(console.port)
+    events = []
+
+    def restart():
+        console.stop()
+        events.append(time.monotonic())
+        time.sleep(1.7)         # down over the one second between the down probes
+        events.append(_Console(console.port))
+
+    threading.Timer(0.3, restart).start()
+    start = time.monotonic()
+    try:
+        assert sg.waitReady(timeout=10, expectDown=True, initialDelay=0.1, maxDelay=0.2)
+    finally:
+        events[-1].stop()
+    assert list(sg.readyTimes) == ['down', 'reachable', 'http']
+    assert sg.readyTimes['down'] >= events[0] - start
+    assert sg.readyTimes['http'] >= 1.9
+
+
+def test_wait_ready_times_out_at_the_stage_that_never_passes():
+    sg = _device(_freePort())
+    with pytest.raises(TimeoutError, match='stage: http'):
+        sg.waitReady(timeout=0.5, initialDelay=0.1, maxDelay=0.1)
+    assert list(sg.readyTimes) == ['reachable']
@@ -0,0 +1,92 @@
+import collections
+
+import sgRollout
+
+
+class _Device:
+    '''ProxySGCLI stand-in: runs build, fails the phase named in failIn'''
+
+    def __init__(self, name, build='100', failIn=None):
+        self.aspects = collections.namedtuple('Aspects', 'device ipaddr')(name, None)
+        self.build = build
+        self.loaded = None
+        self.failIn = failIn
+        self.commands = []
+
+    def getVersionBuild(self):
+        return '7.3.16.1', self.build
+
+    def loadImage(self, build, type, upgradePaths=None):
+        if self.failIn == 'load':
+            raise sgRollout.Error('image download failed')
+        self.loaded = (build, type, upgradePaths)
+
+    def command(self, cmd, context=None):
+        self.commands.append(cmd)
+
+    def waitReady(self, timeout, expectDown):
+        if self.failIn == 'reboot':
+            raise TimeoutError('not ready')
+        if self.failIn != 'verify':
+            self.build = self.loaded[0]
+
+
+class _Distributor:
+    def __init__(self):
+        self.staged = []
+
+    def stage(self, build, type):
+        self.staged.append((build, type))
+        return {'x86': f'http://control/{build}.bcsi'}
+
+
+def _fleet(count, **failures):
+    return [_Device(f'proxysg_{n}', failIn=failures.get(f'proxysg_{n}')) for n in range(1, count + 1)]
+
+
+def test_waves_from_batch_percent():
+    assert [len(wave) for wave in sgRollout.RollingUpgrade(_fleet(10), '200', batchPercent=25).waves()] == [3, 3, 3, 1]
+    assert [len(wave) for wave in sgRollout.RollingUpgrade(_fleet(3), '200').waves()] == [1, 1, 1]
+    assert len(sgRollout.RollingUpgrade(_fleet(5), '200', batchSize=5).waves()) == 1
+
+
+def test_every_wave_upgraded():
+    devices = _fleet(4)
+    devices[3].build = '200'
+    distributor = _Distributor()
+    reports = sgRollout.RollingUpgrade(devices, 200, batchSize=2, distributor=distributor).run()
+    assert sorted((r.device, r.wave, r.status, r.build) for r in reports) == [
+        ('proxysg_1', 1, 'upgraded', '200'), ('proxysg_2', 1, 'upgraded', '200'),
+        ('proxysg_3', 2, 'upgraded', '200'), ('proxysg_4', 2, 'current', '200')]
+    assert distributor.staged == [('200', 'system.bcsi')]
+    assert devices[0].loaded == ('200', 'system.bcsi', {'x86': 'http://control/200.bcsi'})
+    assert devices[0].commands == ['', 'restart upgrade'] and devices[3].commands == []
+
+
+def test_failures_under_the_rate_do_not_halt():
+    rollout = sgRollout.RollingUpgrade(_fleet(4, proxysg_2='load'), '200', batchSize=2, maxFailureRate=0.5)
+    reports = {r.device: r for r in rollout.run()}
+    assert not rollout.halted
+    assert reports['proxysg_2'].status == 'failed' and reports['proxysg_2'].error.startswith('load: ')
+    assert [reports[f'proxysg_{n}'].status for n in (1, 3, 4)] == ['upgraded'] * 3
+
+
+def test_halt_skips_the_remaining_waves():
+    rollout = sgRollout.RollingUpgrade(_fleet(6, proxysg_1='reboot', proxysg_2='verify'), '200', batchSize=2,
+                                       maxFailureRate=0.25)
+    reports = {r.device: r for r in rollout.run()}
+    assert rollout.halted and rollout.haltReason == 'failure rate 100% over 25% after wave 1'
+    assert reports['proxysg_1'].error.startswith('reboot: ')
+    assert reports['proxysg_2'].error == 'verify: load build did not match, expected: 200, have: 100'
+    assert [(reports[f'proxysg_{n}'].wave, reports[f'proxysg_{n}'].status) for n in (3, 4, 5, 6)] == [
+        (2, 'skipped'), (2, 'skipped'), (3, 'skipped'), (3, 'skipped')]
+    assert rollout.failureRate() == 1.0
+    assert rollout.summary().splitlines()[-1] == 'halted: ' + rollout.haltReason
+
+
+def test_failed_health_check_counts_as_failure():
+    rollout = sgRollout.RollingUpgrade(_fleet(2), '200', batchSize=2, maxFailureRate=0.5,
+                                       healthCheck=lambda sg: sg.aspects.device != 'proxysg_2')
+    reports = {r.device: r for r in rollout.run()}
+    assert reports['proxysg_2'].status == 'failed' and reports['proxysg_2'].error == 'verify: health check failed'
+    assert rollout.failureRate() == 0.5 and not rollout.halted
@@ -0,0 +1,45 @@
+import io
+
+import pytest
+
+import proxysg
+import sgShortcuts
+
+
+@pytest.mark.parametrize('xml', [
+    b'<CLI><a>1</a><b> text </b><c/></CLI>',
+    b'<CLI><a><!-- only a comment --></a><b>x<!-- c -->y</b></CLI>',
+    b'<CLI><a><![CDATA[x<y]]></a><b>t<![CDATA[u]]></b></CLI>',
+    b'<CLI><a><?pi x?></a></CLI>',
+    b'<CLI><a>text<e>1</e></a></CLI>',
+    b'<CLI><L multiple="true"><i><v>1</v></i><M multiple="true"><j><w>2</w></j><k>3</k></M><t>txt</t></L></CLI>',
+    b'<CLI><S><x><cmd><output>a</output></cmd><cmd>b</cmd><cmd><output>c</output></cmd></x></S></CLI>',
+    b'<!-- top --><CLI xmlns:p="u"><p:a>&lt;x&gt; &amp;</p:a></CLI>',
+])
+def test_same_dictionary_as_minidom(xml):
+    assert sgShortcuts.parseXMLDictionary(io.BytesIO(xml)) == proxysg.loadXMLDictionary(io.BytesIO(xml))
+
+
+def test_shortcuts_survive_an_unwritable_cache(tmp_path):
+    path = tmp_path / 'shortcuts.xml'
+    path.write_text('<CLI><Shortcuts><setPort><context>CLI_CONFIG</context>'
+                    '<cmd><output>add all {PORT}</output></cmd></setPort></Shortcuts></CLI>')
+    cacheDir = path / 'not-a-directory'
+    shortcuts = sgShortcuts.loadShortcuts(str(path), cacheDir=str(cacheDir))
+    assert shortcuts.shortcuts['setPort'].render({'PORT': 8082}) == ['add all 8082']
+
+
+def test_shortcut_without_commands_sends_nothing(tmp_path):
+    path = tmp_path / 'shortcuts.xml'
+    path.write_text('<CLI><Shortcuts><noop><context>CLI_CONFIG</context></noop>'
+                    '<setPort><context>CLI_CONFIG</context><cmd><output>add all {PORT}</output></cmd></setPort>'
+                    '</Shortcuts></CLI>')
+    sgcli = proxysg.ProxySGCLI(ipaddr='127.0.0.1')
+    sgcli._setupXMLdata(str(path))
+    sent = []
+    sgcli.command = lambda cmd, context=None: sent.append((cmd, context)) or 'ok'
+    assert sgcli.shortcut('noop') == ''
+    assert sgcli.shortcut('noop', bulk=True) == []
+    assert sent == []
+    assert sgcli.shortcut('setPort', PORT=8082) == 'ok'
+    assert sent == [('add all 8082', 'CLI_CONFIG')]
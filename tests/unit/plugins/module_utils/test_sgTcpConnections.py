@@ -0,0 +1,91 @@
+import re
+
+import pytest
+
+import sgTcpConnections
+
+
+_page = '''\
+<pre>
+Active connections
+Proto Recv-Q Send-Q  Local Address          Foreign Address        (state)       Info
+tcp        0      0  10.1.1.1.8080          10.2.0.5.51000         ESTABLISHED   proxy
+tcp        0   1200  10.1.1.1.8080          10.2.0.5.51001         ESTABLISHED   proxy
+tcp       40      0  10.1.1.1.443           10.2.0.7.40000         ESTABLISHED   ssl
+tcp        0      0  10.1.1.1.8080          10.2.0.9.52000         TIME_WAIT     proxy
+tcp        0      0  *.8080                 *.*                    LISTEN        proxy
+tcp        0      0  *.22                   *.*                    LISTEN        ssh
+</pre>
+'''
+# -- the regex the page was scraped with before the streaming parser
+_pageRe = re.compile(r"(\w+)\s+(\d+)\s+(\d+)\s+((?:\d+\.\d+\.\d+\.\d+\.\d+)|(?:\*\.\d+))\s+"
+                     r"((?:\d+\.\d+\.\d+\.\d+.\d+)|(?:\*\.\*))\s+(\w+)\s+(\w.*$)", re.I | re.M)
+
+
+def _split(data, size):
+    return [data[n:n + size] for n in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize('size', [1, 7, 64, 100000])
+def test_same_rows_wherever_the_chunks_split(size):
+    records = list(sgTcpConnections.iterTcpConnections(_split(_page.encode(), size)))
+    assert [con.astuple() for con in records] == _pageRe.findall(_page)
+    assert len(records) == 6
+
+
+def test_crlf_text_chunks_and_last_line_without_newline():
+    page = _page.replace('\n', '\r\n').rstrip().replace('\r\n</pre>', '')
+    records = list(sgTcpConnections.iterTcpConnections(_split(page, 33)))
+    assert len(records) == 6
+    assert records[-1].astuple() == ('tcp', '0', '0', '*.22', '*.*', 'LISTEN', 'ssh')
+    assert (records[1].sendQ, records[2].recvQ) == (1200, 40)
+
+
+
+def test_endpoints():
+    assert sgTcpConnections.encodeEndpoint('10.1.1.1.8080') == (0x0a010101, 8080)
+    assert sgTcpConnections.encodeEndpoint('*.22') == (0, 22)
+    assert sgTcpConnections.encodeEndpoint('*.*') == (0, -1)
+    assert sgTcpConnections.decodeIp(0x0a010101) == '10.1.1.1'
+    assert sgTcpConnections.decodeIp(0) == '*'
+
+
+needsNumpy = pytest.mark.skipif(not sgTcpConnections.HAS_NUMPY, reason='TcpSnapshot needs numpy')
+
+
+def _snapshot(page, timestamp):
+    return sgTcpConnections.TcpSnapshot.fromRecords(sgTcpConnections.iterTcpConnections([page]), timestamp)
+
+
+@needsNumpy
+def test_snapshot_select_group_and_top():
+    snap = _snapshot(_page, 100.0)
+    assert len(snap) == 6
+    assert len(snap.select(state='ESTABLISHED')) == 3
+    assert len(snap.select(state='ESTABLISHED', localPort=8080)) == 2
+    assert len(snap.select(remoteIp='10.2.0.5')) == 2
+    assert len(snap.select(state='SYN_SENT')) == 0
+    assert snap.groupBy('state') == [(('ESTABLISHED',), 3), (('TIME_WAIT',), 1), (('LISTEN',), 2)]
+    assert snap.groupBy('localIp', 'localPort', weight='sendQ')[-1] == (('10.1.1.1', 8080), 1200.0)
+    assert snap.topN('remoteIp', 2) == [('*', 2), ('10.2.0.5', 2)]
+    assert snap.topN('localPort', 1, weight='recvQ') == [(443, 40.0)]
+    assert snap.countBy('state')[0] == ('ESTABLISHED', 3)
+
+
+@needsNumpy
+def test_snapshot_diff():
+    older = _snapshot(_page, 100.0)
+    newer = _snapshot(_page.replace('51001', '51002').replace('TIME_WAIT', 'ESTABLISHED'), 160.0)
+    diff = newer.diff(older)
+    assert diff['elapsed'] == 60.0
+    assert [(decoded, port) for (decoded, port), n in diff['opened'].groupBy('remoteIp', 'remotePort')] == [
+        ('10.2.0.5', 51002)]
+    assert [key for key, n in diff['closed'].groupBy('remotePort')] == [(51001,)]
+    assert diff['states'] == {'ESTABLISHED': (3, 4, 1), 'TIME_WAIT': (1, 0, -1), 'LISTEN': (2, 2, 0)}
+
+
+@needsNumpy
+def test_empty_snapshot():
+    snap = _snapshot('', 0.0)
+    assert len(snap) == 0
+    assert snap.groupBy('state') == [] and snap.topN('remoteIp') == []